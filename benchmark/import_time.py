@@ -0,0 +1,103 @@
+'''Report the cold-start import cost of every Lambda handler module, broken
+down by imported package, and fail when a handler exceeds its budget.
+
+Usage (from the repository root):
+
+    python benchmark/import_time.py                   # report and check the default budgets
+    python benchmark/import_time.py --top 20          # show more packages per handler
+    python benchmark/import_time.py --budget-ms resampling=600 --budget-ms default=50
+
+Every handler is imported in a fresh interpreter with `python -X importtime`
+and the median of --repeat runs is reported. The process exits with status 1
+if any handler's median import time exceeds its budget.
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+LAMBDA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+
+# handler module -> import time budget in milliseconds
+IMPORT_TIME_BUDGETS_MS = {
+    'default': 100,
+    'request': 100,
+    'retrieval': 100,
+    'subscribe_sns_notification': 100,
+    'resampling': 300
+}
+# the heavy packages every handler imports on first use, never at cold start
+DEFERRED_PACKAGES = ('numpy', 'pandas', 'pyarrow', 'sklearn', 'ImbalancedLearningRegression', 'boto3', 'botocore', 'orjson')
+
+# the handler modules read these at import time
+LAMBDA_ENVIRONMENT_VARIABLES = {
+    'metadataTableName': 'metadata-table',
+    'rawDataBucketName': 'raw-data-bucket',
+    'resampledDataBucketName': 'resampled-data-bucket',
+    'expirationDays': '7',
+    'taskStatusSnsTopicArn': 'arn:aws:sns:us-east-1:000000000000:task-status',
+    'AWS_DEFAULT_REGION': 'us-east-1'
+}
+
+def measure_import_time(module_name):
+    environment = dict(os.environ)
+    environment.update({key: value for key, value in LAMBDA_ENVIRONMENT_VARIABLES.items() if key not in environment})
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module_name],
+        cwd = LAMBDA_DIRECTORY,
+        env = environment,
+        capture_output = True,
+        text = True
+    )
+    if completed.returncode != 0:
+        raise Exception('Importing {} failed:\n{}'.format(module_name, completed.stderr))
+    # lines look like "import time:  self [us] | cumulative | imported package"
+    total_us = 0
+    self_us_by_package = defaultdict(int)
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        self_us_by_package[name.strip().split('.')[0]] += int(self_us)
+        if name.strip() == module_name:
+            total_us = int(cumulative_us)
+    return total_us / 1000, {package: us / 1000 for package, us in self_us_by_package.items()}
+
+def parse_budgets(budget_arguments):
+    budgets = dict(IMPORT_TIME_BUDGETS_MS)
+    for budget_argument in budget_arguments or []:
+        module_name, budget_ms = budget_argument.split('=')
+        budgets[module_name.strip()] = float(budget_ms)
+    return budgets
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Report and check the cold-start import time of the Lambda handlers.')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'fresh interpreter runs per handler, the median is reported')
+    parser.add_argument('--top', type = int, default = 8, help = 'packages listed per handler')
+    parser.add_argument('--budget-ms', action = 'append', metavar = 'MODULE=MS', help = 'override the budget of a handler module')
+    arguments = parser.parse_args()
+
+    budgets = parse_budgets(arguments.budget_ms)
+    over_budget = list()
+    for module_name, budget_ms in budgets.items():
+        runs = [measure_import_time(module_name) for _ in range(arguments.repeat)]
+        total_ms = statistics.median(run[0] for run in runs)
+        packages = defaultdict(list)
+        for run in runs:
+            for package, package_ms in run[1].items():
+                packages[package].append(package_ms)
+        status = 'OK' if total_ms <= budget_ms else 'OVER BUDGET'
+        print('{:<28} {:>8.1f} ms  (budget {:.0f} ms) {}'.format(module_name, total_ms, budget_ms, status))
+        for package, package_ms in sorted(packages.items(), key = lambda item: -statistics.median(item[1]))[:arguments.top]:
+            print('    {:<36} {:>8.1f} ms'.format(package, statistics.median(package_ms)))
+        if total_ms > budget_ms:
+            over_budget.append(module_name)
+
+    if over_budget:
+        print('Import time budget exceeded by: {}'.format(', '.join(over_budget)))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
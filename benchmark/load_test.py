@@ -0,0 +1,190 @@
+'''Replay concurrent users against the API and the functions of the stack in
+one process (see local_api.py), and report the throughput and the latency
+of every operation, the calls the API throttled, and the peak concurrency
+of every function, to plan capacity against the throttling of the API and
+the concurrency limits of Lambda.
+
+Usage (from the repository root, with lambda/requirements.txt installed):
+
+    python benchmark/load_test.py                                     # 10 users, 3 jobs each, as deployed
+    python benchmark/load_test.py --users 50 --poll-operation wait
+    python benchmark/load_test.py --users 20 --rate-limit 50 --burst-limit 100 --concurrency-limit 30
+    python benchmark/load_test.py --accept-encoding gzip
+
+Every user requests a job, uploads data of its own to the presigned url (the
+same data for all jobs with --same-data, whose results are then cached), and
+polls the job with --poll-operation until it ends, then starts the next job:
+retrieve through PUT /retrieve with the etag of its last response,
+retrieve-status or the long polls of wait through PUT /default, all with the
+Accept-Encoding header of --accept-encoding, if any, and the Accept header of
+the binary media type of the API that compressed responses need. A throttled call is repeated
+after an exponential backoff, as clients of the API do, and counted as
+throttled. Latencies are those of the calls that succeeded, in milliseconds,
+and the job latency is the time from its request until the user sees it
+ended, or gives up on it after --job-timeout-seconds, such as when throttled
+invocations of the resampling function moved its message to the dead-letter
+queue. The handlers and the resampling jobs share this interpreter, so the
+latencies include their contention for it, and compare configurations
+rather than predict those of AWS.
+'''
+import argparse
+import io
+import threading
+import time
+from collections import defaultdict
+import numpy
+import pandas
+
+from local_api import LocalApi, get_response_data, API_THROTTLING_RATE_LIMIT, API_THROTTLING_BURST_LIMIT, ACCOUNT_CONCURRENCY_LIMIT, JOB_QUEUE_INTAKE_MAXIMUM_CONCURRENCY
+from helper.lambda_http import COMPRESSED_RESPONSE_MEDIA_TYPE
+
+# a throttled call is repeated after THROTTLE_BACKOFF_SECONDS, doubled on every throttle up to THROTTLE_MAXIMUM_BACKOFF_SECONDS
+THROTTLE_BACKOFF_SECONDS = 0.1
+THROTTLE_MAXIMUM_BACKOFF_SECONDS = 5
+# poll operation -> (resource, operation)
+POLL_OPERATIONS = {
+    'retrieve': ('retrieve', 'retrieve'),
+    'retrieve-status': ('default', 'retrieve-status'),
+    'wait': ('default', 'wait')
+}
+
+class LoadStatistics:
+    '''Latencies and counts of the calls of every operation.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies_ms = defaultdict(list)
+        self.counts = defaultdict(lambda: {'calls': 0, 'throttled': 0, 'errors': 0})
+
+    def add(self, operation, outcome, latency_ms = None):
+        with self.lock:
+            self.counts[operation]['calls'] += 1
+            if outcome != 'ok':
+                self.counts[operation][outcome] += 1
+            if latency_ms != None:
+                self.latencies_ms[operation].append(latency_ms)
+
+# the response of a call of the API, repeated while it is throttled
+def call(api, statistics, resource, operation, payload, headers = None):
+    backoff_seconds = THROTTLE_BACKOFF_SECONDS
+    while True:
+        start_time = time.perf_counter()
+        response = api.call(resource, operation, payload, headers)
+        latency_ms = (time.perf_counter() - start_time) * 1000
+        if response['statusCode'] == 429:
+            statistics.add(operation, 'throttled')
+            time.sleep(backoff_seconds)
+            backoff_seconds = min(backoff_seconds * 2, THROTTLE_MAXIMUM_BACKOFF_SECONDS)
+            continue
+        statistics.add(operation, 'ok' if response['statusCode'] in (200, 304) else 'errors', latency_ms)
+        return response
+
+def run_user(api, statistics, user, arguments):
+    email = 'user{}@example.com'.format(user)
+    resource, poll_operation = POLL_OPERATIONS[arguments.poll_operation]
+    headers = {'Accept': COMPRESSED_RESPONSE_MEDIA_TYPE, 'Accept-Encoding': arguments.accept_encoding} if arguments.accept_encoding != None else {}
+    for job in range(arguments.jobs_per_user):
+        body = get_job_data(arguments.rows, 0 if arguments.same_data else user * arguments.jobs_per_user + job)
+        job_start_time = time.perf_counter()
+        response = get_response_data(call(api, statistics, 'request', 'request', {
+            'email': email,
+            'method': arguments.method,
+            'y': 'y',
+            'chartDataSize': 50,
+            'taskStatusSnsTopicSubscriptionOption': 'reject',
+            'taskStatusSnsTopicSubscriptionArn': None,
+            'originalFileName': 'load_test.csv'
+        }, headers))
+        upload_start_time = time.perf_counter()
+        api.upload(response, body)
+        statistics.add('upload', 'ok', (time.perf_counter() - upload_start_time) * 1000)
+        job_key = {'requestId': response['requestId'], 'email': email}
+        etag = None
+        while True:
+            if time.perf_counter() - job_start_time > arguments.job_timeout_seconds:
+                statistics.add('job timed out', 'ok', (time.perf_counter() - job_start_time) * 1000)
+                break
+            if poll_operation == 'retrieve-status':
+                poll_response = call(api, statistics, resource, poll_operation, {'requests': [job_key]}, headers)
+                status = get_response_data(poll_response)['statuses'][0]['status']
+            else:
+                poll_response = call(api, statistics, resource, poll_operation, job_key, {**headers, 'If-None-Match': etag} if etag != None else headers)
+                data = get_response_data(poll_response)
+                etag = poll_response['headers'].get('ETag', etag)
+                status = get_retrieved_status(data)
+            if status in ('completed', 'failed'):
+                statistics.add('job ' + status, 'ok', (time.perf_counter() - job_start_time) * 1000)
+                break
+            # the long polls of wait return as soon as the job ends
+            if poll_operation != 'wait':
+                time.sleep(arguments.poll_interval_seconds)
+
+# the status of a job from what retrieve and wait return, None when the record has not changed since the last poll
+def get_retrieved_status(data):
+    if data is None or data.get('timedOut'):
+        return None
+    if data['resamplingEndTime'] != None:
+        return 'completed'
+    # a job writes its metrics when it ends, and no end time if it failed
+    if data['resamplingMetrics'] != None or data['onResampleFailSnsPublishMessageId'] != None:
+        return 'failed'
+    return data.get('partitionedJobStatus')
+
+# csv of rows with a skewed target, of the seed
+def get_job_data(rows, seed):
+    x = numpy.random.default_rng(seed).normal(size = (rows, 3))
+    data = pandas.DataFrame(x, columns = ['x0', 'x1', 'x2'])
+    data['y'] = numpy.exp(data['x0'])
+    body = io.BytesIO()
+    data.to_csv(body, index = False)
+    return body.getvalue()
+
+def get_percentile(latencies_ms, percentile):
+    return float(numpy.percentile(latencies_ms, percentile)) if len(latencies_ms) > 0 else float('nan')
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Replay concurrent users against the API of the stack in one process.')
+    parser.add_argument('--users', type = int, default = 10)
+    parser.add_argument('--jobs-per-user', type = int, default = 3)
+    parser.add_argument('--rows', type = int, default = 500, help = 'rows of the data every job resamples')
+    parser.add_argument('--method', default = 'ro')
+    parser.add_argument('--same-data', action = 'store_true', help = 'upload the same data for every job, whose results are then cached')
+    parser.add_argument('--poll-operation', choices = list(POLL_OPERATIONS), default = 'retrieve')
+    parser.add_argument('--poll-interval-seconds', type = float, default = 1)
+    parser.add_argument('--accept-encoding', help = 'Accept-Encoding header of the calls, such as gzip for compressed responses')
+    parser.add_argument('--job-timeout-seconds', type = float, default = 120, help = 'a user stops polling a job that has not ended by then')
+    parser.add_argument('--rate-limit', type = float, default = API_THROTTLING_RATE_LIMIT, help = 'requests per second of the API stage')
+    parser.add_argument('--burst-limit', type = int, default = API_THROTTLING_BURST_LIMIT)
+    parser.add_argument('--concurrency-limit', type = int, default = ACCOUNT_CONCURRENCY_LIMIT, help = 'concurrent executions of all functions')
+    parser.add_argument('--resampling-concurrency', type = int, default = JOB_QUEUE_INTAKE_MAXIMUM_CONCURRENCY, help = 'maximum concurrency of the intake queue')
+    arguments = parser.parse_args()
+
+    api = LocalApi(arguments.rate_limit, arguments.burst_limit, arguments.concurrency_limit, arguments.resampling_concurrency)
+    statistics = LoadStatistics()
+    users = [threading.Thread(target = run_user, args = (api, statistics, user, arguments)) for user in range(arguments.users)]
+    api.start_resampling()
+    start_time = time.perf_counter()
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    seconds = time.perf_counter() - start_time
+    api.stop_resampling()
+
+    print('{} users, {} jobs each, polling with {}, in {:.1f} s'.format(arguments.users, arguments.jobs_per_user, arguments.poll_operation, seconds))
+    print('{:<18}  {:>7}  {:>9}  {:>6}  {:>10}  {:>10}  {:>10}'.format('operation', 'calls', 'throttled', 'errors', 'per second', 'p50 (ms)', 'p99 (ms)'))
+    for operation, counts in statistics.counts.items():
+        latencies_ms = statistics.latencies_ms[operation]
+        print('{:<18}  {:>7}  {:>9}  {:>6}  {:>10.2f}  {:>10.1f}  {:>10.1f}'.format(
+            operation, counts['calls'], counts['throttled'], counts['errors'], len(latencies_ms) / seconds, get_percentile(latencies_ms, 50), get_percentile(latencies_ms, 99)
+        ))
+    print()
+    print('{:<34}  {:>11}  {:>9}  {:>16}'.format('function', 'invocations', 'throttles', 'peak concurrency'))
+    for function, function_statistics in api.get_function_statistics().items():
+        print('{:<34}  {:>11}  {:>9}  {:>16}'.format(function, function_statistics['invocations'], function_statistics['throttles'], function_statistics['peakExecutions']))
+    if len(api.event_source.dead_letters) > 0:
+        print()
+        print('{} job message(s) of the intake queue were moved to the dead-letter queue'.format(len(api.event_source.dead_letters)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+'''The API and the functions of the stack in one process, on the in-memory AWS
+stand-ins of local_aws.py: calls go through the API Gateway routes of the
+stack to the lambda_handler of their function, an upload to the presigned
+url of a request queues its job on the intake queue as the event
+notification of the raw data bucket does, and the resampling function runs
+the jobs of the queue like its event source mapping.
+
+    api = LocalApi()
+    response = api.call('request', 'request', payload)          # PUT /request
+    api.upload(response, body)                                  # PUT to the presigned url
+    api.drain()                                                 # or start_resampling() and stop_resampling()
+    api.call('retrieve', 'retrieve', {'requestId': ..., 'email': ...})
+
+Like the stack, the API throttles requests beyond its rate and burst limits,
+and every invocation counts against the concurrency limit of the account,
+both answered with status 429. The handler modules read the environment
+variables of import_time.py, unless they are set already.
+'''
+import base64
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIRECTORY)
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, '..', 'lambda'))
+
+from import_time import LAMBDA_ENVIRONMENT_VARIABLES
+for name, value in dict(LAMBDA_ENVIRONMENT_VARIABLES, resultCacheTableName = 'result-cache-table', AWS_LAMBDA_FUNCTION_NAME = 'ResamplingFunction').items():
+    os.environ.setdefault(name, value)
+
+import default
+import request
+import resampling
+import retrieval
+import subscribe_sns_notification
+from local_aws import LocalAws, LocalQueueEventSource
+
+# the throttling of the API stage and the intake queue of the resampling function, as deployed by the stack
+API_THROTTLING_RATE_LIMIT = 10
+API_THROTTLING_BURST_LIMIT = 20
+JOB_QUEUE_INTAKE_BATCH_SIZE = 10
+JOB_QUEUE_INTAKE_MAXIMUM_CONCURRENCY = 10
+# the default concurrency limit of an account, shared by all functions
+ACCOUNT_CONCURRENCY_LIMIT = 1000
+# resource of the API -> function, as routed by the stack
+API_ROUTES = {
+    'default': 'DefaultFunction',
+    'subscribe-sns-notification': 'SubscribeSnsNotificationFunction',
+    'request': 'RequestFunction',
+    'retrieve': 'RetrievalFunction'
+}
+# a resampling worker looks at an empty queue again after this many seconds
+RESAMPLING_POLL_INTERVAL_SECONDS = 0.05
+
+class TokenBucket:
+    '''The throttle of an API stage: requests take a token each, and tokens
+    are added at rate_limit per second up to burst_limit.'''
+
+    def __init__(self, rate_limit, burst_limit):
+        self.rate_limit = rate_limit
+        self.burst_limit = burst_limit
+        self.tokens = burst_limit
+        self.time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst_limit, self.tokens + (now - self.time) * self.rate_limit)
+            self.time = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+class TooManyRequestsException(Exception):
+    '''An invocation beyond the concurrency limit, as Lambda raises it.'''
+
+class ConcurrencyLimit:
+    '''The concurrent executions of the functions of an account, with the
+    invocations, throttles and peak concurrency of every function.'''
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.executions = 0
+        self.lock = threading.Lock()
+        # function -> { invocations, throttles, executions, peakExecutions }
+        self.functions = defaultdict(lambda: {'invocations': 0, 'throttles': 0, 'executions': 0, 'peakExecutions': 0})
+
+    # calls handler(event, None) in an execution of function, or raises TooManyRequestsException if the account has no execution left
+    def invoke(self, function, handler, event):
+        with self.lock:
+            statistics = self.functions[function]
+            if self.executions >= self.limit:
+                statistics['throttles'] += 1
+                raise TooManyRequestsException('Rate Exceeded.')
+            self.executions += 1
+            statistics['invocations'] += 1
+            statistics['executions'] += 1
+            statistics['peakExecutions'] = max(statistics['peakExecutions'], statistics['executions'])
+        try:
+            return handler(event, None)
+        finally:
+            with self.lock:
+                self.executions -= 1
+                statistics['executions'] -= 1
+
+    def get_statistics(self):
+        with self.lock:
+            return {function: {key: value for key, value in statistics.items() if key != 'executions'} for function, statistics in self.functions.items()}
+
+class LocalApi:
+    '''One deployment of the stack on a fresh set of stand-ins.'''
+
+    def __init__(self, rate_limit = API_THROTTLING_RATE_LIMIT, burst_limit = API_THROTTLING_BURST_LIMIT, concurrency_limit = ACCOUNT_CONCURRENCY_LIMIT, resampling_concurrency = JOB_QUEUE_INTAKE_MAXIMUM_CONCURRENCY):
+        self.local_aws = LocalAws()
+        self.local_aws.install()
+        self.throttle = TokenBucket(rate_limit, burst_limit)
+        self.concurrency_limit = ConcurrencyLimit(concurrency_limit)
+        self.handlers = {
+            'DefaultFunction': default.lambda_handler,
+            'SubscribeSnsNotificationFunction': subscribe_sns_notification.lambda_handler,
+            'RequestFunction': request.lambda_handler,
+            'RetrievalFunction': retrieval.lambda_handler,
+            'ResamplingFunction': resampling.lambda_handler
+        }
+        # the partition workers of partitioned jobs are asynchronous invocations of the resampling function
+        self.local_aws.lambda_client.add_function(os.environ['AWS_LAMBDA_FUNCTION_NAME'], lambda event, context: self.invoke_function('ResamplingFunction', event))
+        self.intake_queue_url = self.local_aws.sqs_client.create_queue(QueueName = 'IntakeJobQueue')['QueueUrl']
+        self.local_aws.notify_queue(os.environ['rawDataBucketName'], 'raw_', self.intake_queue_url)
+        self.event_source = LocalQueueEventSource(self.local_aws.sqs_client, self.intake_queue_url, lambda event: self.invoke_function('ResamplingFunction', event), JOB_QUEUE_INTAKE_BATCH_SIZE)
+        self.resampling_concurrency = resampling_concurrency
+        self.resampling_workers = list()
+        self.resampling_stopped = threading.Event()
+
+    # PUT /resource with { operation, payload }, returns the proxy response of the function: { statusCode, headers, body }
+    def call(self, resource, operation, payload, headers = None):
+        if not self.throttle.take():
+            return {'statusCode': 429, 'headers': {}, 'body': json.dumps({'message': 'Too Many Requests'})}
+        event = {
+            'resource': '/' + resource,
+            'httpMethod': 'PUT',
+            'headers': headers or {},
+            'body': json.dumps({'operation': operation, 'payload': payload})
+        }
+        try:
+            return self.invoke_function(API_ROUTES[resource], event)
+        except TooManyRequestsException as e:
+            return {'statusCode': 429, 'headers': {}, 'body': json.dumps({'message': str(e)})}
+
+    def invoke_function(self, function, event):
+        return self.concurrency_limit.invoke(function, self.handlers[function], event)
+
+    # PUT of body to the presigned url of a request response, with the headers it was signed with
+    def upload(self, response, body):
+        url = urllib.parse.urlparse(response['putPresignedUrl'])
+        bucket, key = url.path.lstrip('/').split('/', 1)
+        headers = {'ContentType': response['putPresignedUrlContentType']}
+        if response.get('putPresignedUrlContentEncoding') != None:
+            headers['ContentEncoding'] = response['putPresignedUrlContentEncoding']
+        self.local_aws.s3_client.put_object(Bucket = bucket, Key = key, Body = body, **headers)
+
+    # runs the queued jobs in this thread until the queue is empty, and the partition workers they invoke
+    def drain(self):
+        self.event_source.drain()
+        self.local_aws.lambda_client.join()
+
+    # runs the queued jobs on resampling_concurrency threads, like the event source mapping of the intake queue, until stopped
+    def start_resampling(self):
+        self.resampling_stopped.clear()
+        self.resampling_workers = [threading.Thread(target = self.run_resampling_worker, daemon = True) for _ in range(self.resampling_concurrency)]
+        for worker in self.resampling_workers:
+            worker.start()
+
+    def run_resampling_worker(self):
+        while not self.resampling_stopped.is_set():
+            messages = self.local_aws.sqs_client.receive_message(QueueUrl = self.intake_queue_url, MaxNumberOfMessages = JOB_QUEUE_INTAKE_BATCH_SIZE, VisibilityTimeout = 900).get('Messages', [])
+            if len(messages) == 0:
+                self.resampling_stopped.wait(RESAMPLING_POLL_INTERVAL_SECONDS)
+                continue
+            self.event_source.invoke(messages)
+
+    def stop_resampling(self):
+        self.resampling_stopped.set()
+        for worker in self.resampling_workers:
+            worker.join()
+        self.local_aws.lambda_client.join()
+
+    def get_function_statistics(self):
+        return self.concurrency_limit.get_statistics()
+
+# the data of a successful response, or raises its error
+def get_response_data(response):
+    if response['statusCode'] == 304:
+        return None
+    body = response['body']
+    if response.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+        if response['headers'].get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+    body = json.loads(body)
+    if response['statusCode'] != 200:
+        raise Exception(body.get('error') or body.get('message'))
+    return body['data']
@@ -0,0 +1,497 @@
+'''In-memory stand-ins for the S3, DynamoDB, SNS, SQS and Lambda clients of
+the Lambda handlers, so that the real request, resampling and retrieval code
+paths run without AWS. They cover the calls and expressions the handlers use, and
+fail like the services do where it matters: unknown objects raise NoSuchKey,
+floats are rejected by DynamoDB and failed conditions raise
+ConditionalCheckFailedException.
+
+    local_aws = LocalAws()
+    local_aws.install()
+    # request.request(...), resampling.resample(...), retrieval.retrieve(...)
+
+install() needs the lambda directory on sys.path, for helper/aws_clients.py.
+
+Uploads reach the resampling function through a queue as in the stack with
+notify_queue() and a LocalQueueEventSource:
+
+    queue_url = local_aws.sqs_client.create_queue(QueueName = 'intake')['QueueUrl']
+    local_aws.notify_queue(raw_data_bucket_name, 'raw_', queue_url)
+    LocalQueueEventSource(local_aws.sqs_client, queue_url, resampling.resample_jobs).drain()
+
+Functions added to local_aws.lambda_client with add_function() are invoked
+by name, such as the resampling function by the partitioned jobs.
+
+LocalClock.install() replaces the clock of the long polls of an imported retrieval.py.
+'''
+import copy
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+def client_error(code, message, operation_name):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, operation_name)
+
+class LocalS3Client:
+    '''Objects are kept as bytes per (bucket, key).'''
+
+    def __init__(self):
+        self.objects = dict()
+        self.lock = threading.Lock()
+        # (bucket, key prefix, function called with the S3 event record of every object created there)
+        self.event_notifications = list()
+
+    def put_object(self, Bucket, Key, Body = b'', ContentType = 'binary/octet-stream', **arguments):
+        body = Body if isinstance(Body, (bytes, bytearray)) else Body.encode('utf-8') if isinstance(Body, str) else Body.read()
+        with self.lock:
+            self.objects[(Bucket, Key)] = {'Body': bytes(body), 'ContentType': ContentType, 'Metadata': arguments.get('Metadata', {}), 'ContentEncoding': arguments.get('ContentEncoding')}
+        for bucket, prefix, notify in self.event_notifications:
+            if bucket == Bucket and Key.startswith(prefix):
+                notify({
+                    'eventVersion': '2.1',
+                    'eventSource': 'aws:s3',
+                    'eventName': 'ObjectCreated:Put',
+                    's3': {'bucket': {'name': Bucket}, 'object': {'key': urllib.parse.quote_plus(Key), 'size': len(body), 'eTag': get_etag(body).strip('"')}}
+                })
+        return {'ETag': get_etag(body)}
+
+    def add_event_notification(self, bucket, prefix, notify):
+        self.event_notifications.append((bucket, prefix, notify))
+
+    def upload_file(self, Filename, Bucket, Key, ExtraArgs = None, **arguments):
+        with open(Filename, 'rb') as file:
+            self.put_object(Bucket = Bucket, Key = Key, Body = file.read(), **(ExtraArgs or {}))
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs = None, **arguments):
+        self.put_object(Bucket = Bucket, Key = Key, Body = Fileobj.read(), **(ExtraArgs or {}))
+
+    def download_fileobj(self, Bucket, Key, Fileobj, ExtraArgs = None, **arguments):
+        Fileobj.write(self.get_stored_object(Bucket, Key, 'GetObject')['Body'])
+
+    def get_object(self, Bucket, Key, Range = None, **arguments):
+        stored_object = self.get_stored_object(Bucket, Key, 'GetObject')
+        body = stored_object['Body']
+        response = self.describe(stored_object)
+        if Range != None:
+            # bytes=start-end, both inclusive, bytes=start- or bytes=-suffix length
+            first, last = re.match(r'bytes=(\d*)-(\d*)$', Range).groups()
+            if first == '':
+                start, end = max(0, len(body) - int(last)), len(body) - 1
+            else:
+                start, end = int(first), len(body) - 1 if last == '' else min(len(body) - 1, int(last))
+            response['ContentRange'] = 'bytes {}-{}/{}'.format(start, end, len(body))
+            body = body[start:end + 1]
+        response.update({'Body': io.BytesIO(body), 'ContentLength': len(body)})
+        return response
+
+    def head_object(self, Bucket, Key, **arguments):
+        return self.describe(self.get_stored_object(Bucket, Key, 'HeadObject', '404'))
+
+    def copy_object(self, Bucket, Key, CopySource, ContentType = None, **arguments):
+        stored_object = self.get_stored_object(CopySource['Bucket'], CopySource['Key'], 'CopyObject')
+        return self.put_object(Bucket = Bucket, Key = Key, Body = stored_object['Body'], ContentType = ContentType or stored_object['ContentType'], ContentEncoding = arguments.get('ContentEncoding'))
+
+    def delete_object(self, Bucket, Key, **arguments):
+        with self.lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def generate_presigned_url(self, ClientMethod, Params, ExpiresIn = 3600, **arguments):
+        return 'http://localhost/{}/{}?method={}&expires={}'.format(Params['Bucket'], Params['Key'], ClientMethod, ExpiresIn)
+
+    def generate_presigned_post(self, Bucket, Key, ExpiresIn = 3600, **arguments):
+        return {'url': 'http://localhost/{}'.format(Bucket), 'fields': {'key': Key}}
+
+    def get_stored_object(self, bucket, key, operation_name, code = 'NoSuchKey'):
+        with self.lock:
+            if (bucket, key) not in self.objects:
+                raise client_error(code, 'The specified key does not exist: {}/{}'.format(bucket, key), operation_name)
+            return self.objects[(bucket, key)]
+
+    def describe(self, stored_object):
+        description = {
+            'ETag': get_etag(stored_object['Body']),
+            'ContentLength': len(stored_object['Body']),
+            'ContentType': stored_object['ContentType'],
+            'Metadata': stored_object['Metadata']
+        }
+        if stored_object['ContentEncoding'] != None:
+            description['ContentEncoding'] = stored_object['ContentEncoding']
+        return description
+
+def get_etag(body):
+    return '"{}"'.format(hashlib.md5(body).hexdigest())
+
+class LocalTable:
+    '''A DynamoDB table resource with a string partition key. Update
+    expressions support SET of names, nested names and name + value, ADD to
+    number and string sets, and attribute_not_exists conditions.
+    '''
+
+    def __init__(self, name, key_name):
+        self.name = name
+        self.key_name = key_name
+        self.items = dict()
+        self.lock = threading.Lock()
+
+    def put_item(self, Item, **arguments):
+        with self.lock:
+            self.items[Item[self.key_name]] = to_stored_value(Item)
+        return {}
+
+    def get_item(self, Key, ProjectionExpression = None, ExpressionAttributeNames = None, **arguments):
+        with self.lock:
+            item = self.items.get(Key[self.key_name])
+            if item is None:
+                return {}
+            return {'Item': project(copy.deepcopy(item), ProjectionExpression, ExpressionAttributeNames)}
+
+    def query(self, KeyConditionExpression, FilterExpression = None, **arguments):
+        with self.lock:
+            items = [copy.deepcopy(item) for item in self.items.values() if matches(KeyConditionExpression, item) and (FilterExpression is None or matches(FilterExpression, item))]
+        return {'Items': items, 'Count': len(items)}
+
+    # one page of all items
+    def scan(self, FilterExpression = None, ProjectionExpression = None, ExpressionAttributeNames = None, **arguments):
+        with self.lock:
+            items = [project(copy.deepcopy(item), ProjectionExpression, ExpressionAttributeNames) for item in self.items.values() if FilterExpression is None or matches(FilterExpression, item)]
+        return {'Items': items, 'Count': len(items)}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeNames = None, ExpressionAttributeValues = None, ConditionExpression = None, ReturnValues = 'NONE', **arguments):
+        names = ExpressionAttributeNames or {}
+        values = {name: to_stored_value(value) for name, value in (ExpressionAttributeValues or {}).items()}
+        with self.lock:
+            item = self.items.setdefault(Key[self.key_name], {self.key_name: Key[self.key_name]})
+            if ConditionExpression != None:
+                condition = re.match(r'attribute_not_exists\((#\w+)\)$', ConditionExpression.strip())
+                if condition is None:
+                    raise Exception('Unsupported condition expression {}!'.format(ConditionExpression))
+                if names[condition.group(1)] in item:
+                    raise client_error('ConditionalCheckFailedException', 'The conditional request failed', 'UpdateItem')
+            updated = dict()
+            for action, clauses in re.findall(r'(SET|ADD)\s+(.*?)(?=\s+(?:SET|ADD)\s+|$)', UpdateExpression.strip()):
+                for clause in clauses.split(','):
+                    if action == 'SET':
+                        path, value = [part.strip() for part in clause.split('=', 1)]
+                        value = sum(resolve(item, names, values, operand.strip()) for operand in value.split('+')) if '+' in value else resolve(item, names, values, value)
+                        set_path(item, [names[name] for name in path.split('.')], value)
+                    else:
+                        path, value = clause.split()
+                        current = item.get(names[path])
+                        item[names[path]] = (current or set()) | values[value] if isinstance(values[value], set) else (current or Decimal(0)) + values[value]
+                    top_name = names[path.split('.')[0]]
+                    updated[top_name] = copy.deepcopy(item[top_name])
+        if ReturnValues == 'UPDATED_NEW':
+            return {'Attributes': updated}
+        if ReturnValues == 'ALL_NEW':
+            return {'Attributes': copy.deepcopy(item)}
+        return {}
+
+class LocalDynamoDBResource:
+    def __init__(self, tables):
+        self.tables = tables
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **arguments):
+        responses = dict()
+        for table_name, request in RequestItems.items():
+            table = self.tables[table_name]
+            responses[table_name] = [
+                item['Item'] for item in (table.get_item(Key = key, ProjectionExpression = request.get('ProjectionExpression'), ExpressionAttributeNames = request.get('ExpressionAttributeNames')) for key in request['Keys']) if 'Item' in item
+            ]
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+# DynamoDB stores every number as a Decimal and rejects floats, like boto3 does
+def to_stored_value(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, float):
+        raise TypeError('Float types are not supported. Use Decimal types instead.')
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, dict):
+        return {key: to_stored_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_stored_value(item) for item in value]
+    if isinstance(value, set):
+        return {to_stored_value(item) for item in value}
+    return value
+
+def resolve(item, names, values, operand):
+    if operand.startswith(':'):
+        return values[operand]
+    value = item
+    for name in operand.split('.'):
+        value = value[names[name]]
+    return value
+
+def set_path(item, path, value):
+    for name in path[:-1]:
+        item = item[name]
+    item[path[-1]] = value
+
+def project(item, projection_expression, expression_attribute_names):
+    if projection_expression is None:
+        return item
+    names = [(expression_attribute_names or {}).get(name.strip(), name.strip()) for name in projection_expression.split(',')]
+    return {name: item[name] for name in names if name in item}
+
+# key and filter conditions of boto3.dynamodb.conditions, equality, AND and greater sizes only
+def matches(condition, item):
+    expression = condition.get_expression()
+    if expression['operator'] == 'AND':
+        return all(matches(value, item) for value in expression['values'])
+    if expression['operator'] == '=':
+        attribute, value = expression['values']
+        return item.get(attribute.name) == value
+    if expression['operator'] == '>' and expression['values'][0].get_expression()['operator'] == 'size':
+        attribute, value = expression['values'][0].get_expression()['values'][0], expression['values'][1]
+        # of a nested name, such as name.L
+        for name in attribute.name.split('.'):
+            item = item.get(name) if isinstance(item, dict) else None
+        return item != None and len(item) > value
+    raise Exception('Unsupported condition operator {}!'.format(expression['operator']))
+
+class LocalSnsClient:
+    '''Published messages are kept in order in messages.'''
+
+    def __init__(self):
+        self.messages = list()
+        self.lock = threading.Lock()
+
+    def publish(self, **arguments):
+        message_id = str(uuid.uuid4())
+        with self.lock:
+            self.messages.append(dict(arguments, MessageId = message_id))
+        return {'MessageId': message_id}
+
+    def publish_batch(self, TopicArn, PublishBatchRequestEntries, **arguments):
+        successful = [{'Id': entry['Id'], 'MessageId': self.publish(TopicArn = TopicArn, **{key: value for key, value in entry.items() if key != 'Id'})['MessageId']} for entry in PublishBatchRequestEntries]
+        return {'Successful': successful, 'Failed': []}
+
+    def subscribe(self, TopicArn, Protocol, Endpoint, **arguments):
+        return {'SubscriptionArn': '{}:{}'.format(TopicArn, uuid.uuid4())}
+
+class LocalSqsClient:
+    '''Queues of messages by queue url. A received message stays invisible
+    for the visibility timeout and is received again unless it is deleted
+    by then, as in SQS, and counts how often it was received.'''
+
+    def __init__(self):
+        self.queues = dict()
+        self.lock = threading.Lock()
+
+    def create_queue(self, QueueName, **arguments):
+        queue_url = 'https://sqs.us-east-1.amazonaws.com/000000000000/{}'.format(QueueName)
+        with self.lock:
+            self.queues.setdefault(queue_url, list())
+        return {'QueueUrl': queue_url}
+
+    def get_queue_url(self, QueueName, QueueOwnerAWSAccountId = '000000000000', **arguments):
+        queue_url = 'https://sqs.us-east-1.amazonaws.com/{}/{}'.format(QueueOwnerAWSAccountId, QueueName)
+        with self.lock:
+            self.get_queue(queue_url, 'GetQueueUrl')
+        return {'QueueUrl': queue_url}
+
+    def send_message(self, QueueUrl, MessageBody, **arguments):
+        message_id = str(uuid.uuid4())
+        with self.lock:
+            self.get_queue(QueueUrl, 'SendMessage').append({'MessageId': message_id, 'Body': MessageBody, 'ReceiveCount': 0, 'VisibleAt': 0, 'ReceiptHandle': None})
+        return {'MessageId': message_id}
+
+    def send_message_batch(self, QueueUrl, Entries, **arguments):
+        successful = [{'Id': entry['Id'], 'MessageId': self.send_message(QueueUrl = QueueUrl, MessageBody = entry['MessageBody'])['MessageId']} for entry in Entries]
+        return {'Successful': successful, 'Failed': []}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages = 1, VisibilityTimeout = 30, **arguments):
+        now = time.monotonic()
+        received = list()
+        with self.lock:
+            for message in self.get_queue(QueueUrl, 'ReceiveMessage'):
+                if len(received) >= MaxNumberOfMessages:
+                    break
+                if message['VisibleAt'] <= now:
+                    message.update({'ReceiveCount': message['ReceiveCount'] + 1, 'VisibleAt': now + VisibilityTimeout, 'ReceiptHandle': uuid.uuid4().hex})
+                    received.append({'MessageId': message['MessageId'], 'ReceiptHandle': message['ReceiptHandle'], 'Body': message['Body'], 'Attributes': {'ApproximateReceiveCount': str(message['ReceiveCount'])}})
+        return {'Messages': received} if len(received) > 0 else {}
+
+    # a receipt handle of an earlier receive deletes nothing, as in SQS
+    def delete_message(self, QueueUrl, ReceiptHandle, **arguments):
+        with self.lock:
+            queue = self.get_queue(QueueUrl, 'DeleteMessage')
+            queue[:] = [message for message in queue if message['ReceiptHandle'] != ReceiptHandle]
+        return {}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout, **arguments):
+        with self.lock:
+            for message in self.get_queue(QueueUrl, 'ChangeMessageVisibility'):
+                if message['ReceiptHandle'] == ReceiptHandle:
+                    message['VisibleAt'] = time.monotonic() + VisibilityTimeout
+        return {}
+
+    def get_queue(self, queue_url, operation_name):
+        if queue_url not in self.queues:
+            raise client_error('AWS.SimpleQueueService.NonExistentQueue', 'The specified queue does not exist: {}'.format(queue_url), operation_name)
+        return self.queues[queue_url]
+
+def get_queue_arn(queue_url):
+    account, name = queue_url.split('/')[-2:]
+    return 'arn:aws:sqs:us-east-1:{}:{}'.format(account, name)
+
+class LocalQueueEventSource:
+    '''Polls a queue of a LocalSqsClient like an SQS event source mapping
+    with batch item failures: batches of up to batch_size messages are passed
+    to handler(event) as SQS events, and the messages of a batch are deleted
+    unless the handler raises or reports them in its batchItemFailures, in
+    which case they are received again, up to maximum_receive_count times,
+    and kept in dead_letters after that.'''
+
+    def __init__(self, sqs_client, queue_url, handler, batch_size = 10, maximum_receive_count = 3):
+        self.sqs_client = sqs_client
+        self.queue_url = queue_url
+        self.handler = handler
+        self.batch_size = batch_size
+        self.maximum_receive_count = maximum_receive_count
+        self.dead_letters = list()
+        self.invocations = 0
+
+    # invokes the handler until the queue is empty, returns the number of invocations
+    def drain(self):
+        invocations = self.invocations
+        while True:
+            messages = self.sqs_client.receive_message(QueueUrl = self.queue_url, MaxNumberOfMessages = self.batch_size, VisibilityTimeout = 900).get('Messages', [])
+            if len(messages) == 0:
+                return self.invocations - invocations
+            self.invoke(messages)
+
+    def invoke(self, messages):
+        event = {'Records': [{
+            'messageId': message['MessageId'],
+            'receiptHandle': message['ReceiptHandle'],
+            'body': message['Body'],
+            'attributes': message['Attributes'],
+            'eventSource': 'aws:sqs',
+            'eventSourceARN': get_queue_arn(self.queue_url)
+        } for message in messages]}
+        self.invocations += 1
+        try:
+            failed_message_ids = set(failure['itemIdentifier'] for failure in (self.handler(event) or {}).get('batchItemFailures', []))
+        except Exception as e:
+            print('Invocation of a batch of {} message(s) failed: {}'.format(len(messages), e))
+            failed_message_ids = set(message['MessageId'] for message in messages)
+        for message in messages:
+            if message['MessageId'] not in failed_message_ids:
+                self.sqs_client.delete_message(QueueUrl = self.queue_url, ReceiptHandle = message['ReceiptHandle'])
+            elif int(message['Attributes']['ApproximateReceiveCount']) >= self.maximum_receive_count:
+                self.sqs_client.delete_message(QueueUrl = self.queue_url, ReceiptHandle = message['ReceiptHandle'])
+                self.dead_letters.append(message)
+            else:
+                self.sqs_client.change_message_visibility(QueueUrl = self.queue_url, ReceiptHandle = message['ReceiptHandle'], VisibilityTimeout = 0)
+
+class LocalLambdaClient:
+    '''Invokes the handlers of functions by name: a RequestResponse
+    invocation calls handler(event, None) and returns its result as the
+    Payload, an Event invocation runs it on a thread of its own and is
+    retried twice if it raises, as Lambda retries asynchronous invocations.'''
+
+    def __init__(self):
+        self.functions = dict()
+        self.threads = list()
+        self.lock = threading.Lock()
+
+    def add_function(self, name, handler):
+        self.functions[name] = handler
+
+    def invoke(self, FunctionName, Payload = b'{}', InvocationType = 'RequestResponse', **arguments):
+        if FunctionName not in self.functions:
+            raise client_error('ResourceNotFoundException', 'Function not found: {}'.format(FunctionName), 'Invoke')
+        handler = self.functions[FunctionName]
+        event = json.loads(Payload)
+        if InvocationType == 'Event':
+            thread = threading.Thread(target = self.invoke_asynchronously, args = (FunctionName, handler, event), daemon = True)
+            with self.lock:
+                self.threads.append(thread)
+            thread.start()
+            return {'StatusCode': 202}
+        return {'StatusCode': 200, 'Payload': io.BytesIO(json.dumps(handler(event, None), default = str).encode('utf-8'))}
+
+    def invoke_asynchronously(self, name, handler, event, maximum_attempts = 3):
+        for attempt in range(1, maximum_attempts + 1):
+            try:
+                handler(event, None)
+                return
+            except Exception as e:
+                print('Asynchronous invocation {} of {} failed: {}'.format(attempt, name, e))
+
+    # waits for the asynchronous invocations, including those they invoke
+    def join(self):
+        while True:
+            with self.lock:
+                threads = [thread for thread in self.threads if thread.is_alive()]
+                self.threads = threads
+            if len(threads) == 0:
+                return
+            for thread in threads:
+                thread.join()
+
+class LocalClock:
+    '''A virtual monotonic clock: sleep() moves the time forward at once and
+    runs the events that are due by then, so that code which waits for
+    something to happen runs without waiting.'''
+
+    def __init__(self):
+        self.time = 0.0
+        self.events = list()
+
+    def monotonic(self):
+        return self.time
+
+    def sleep(self, seconds):
+        self.time += seconds
+        due_events = [event for event in self.events if event[0] <= self.time]
+        self.events = [event for event in self.events if event[0] > self.time]
+        for _, function in sorted(due_events, key=lambda event: event[0]):
+            function()
+
+    # function() runs once the clock passes seconds from now
+    def call_later(self, seconds, function):
+        self.events.append((self.time + seconds, function))
+
+    # replace the clock of the long polls of retrieval.py
+    def install(self):
+        retrieval = sys.modules.get('retrieval')
+        if retrieval != None:
+            retrieval.sleep = self.sleep
+            retrieval.monotonic = self.monotonic
+
+class LocalAws:
+    '''One set of stand-ins, shared by all handler modules once installed.'''
+
+    def __init__(self, environment = None):
+        environment = environment or os.environ
+        self.s3_client = LocalS3Client()
+        self.sns_client = LocalSnsClient()
+        self.sqs_client = LocalSqsClient()
+        self.lambda_client = LocalLambdaClient()
+        self.metadata_table = LocalTable(environment['metadataTableName'], 'requestId')
+        self.result_cache_table = LocalTable(environment.get('resultCacheTableName', 'result-cache-table'), 'cacheKey')
+        self.dynamodb_resource = LocalDynamoDBResource({self.metadata_table.name: self.metadata_table, self.result_cache_table.name: self.result_cache_table})
+
+    # every client, resource and table of helper/aws_clients.py is a stand-in from here on, in modules imported before or after
+    def install(self):
+        from helper.aws_clients import use_stand_ins
+        use_stand_ins({'s3': self.s3_client, 'sns': self.sns_client, 'sqs': self.sqs_client, 'lambda': self.lambda_client}, {'dynamodb': self.dynamodb_resource})
+
+    # objects created in bucket under prefix send their S3 event to queue_url, like the event notification of the stack
+    def notify_queue(self, bucket, prefix, queue_url):
+        self.s3_client.add_event_notification(bucket, prefix, lambda record: self.sqs_client.send_message(QueueUrl = queue_url, MessageBody = json.dumps({'Records': [record]})))
@@ -0,0 +1,109 @@
+'''Compare how many requests and metadata reads a client needs to learn that
+a resampling job has ended, with tight polling of the retrieve operation
+against long polls of the wait operation.
+
+Usage (from the repository root, with lambda/requirements.txt installed):
+
+    python benchmark/long_poll.py                                     # jobs of 10.5, 60.5 and 300.5 seconds
+    python benchmark/long_poll.py --job-seconds 30 600 --poll-interval-seconds 2
+
+Both clients run against the in-memory AWS stand-ins of local_aws.py on a
+virtual clock, so no time passes while they wait: the job is a real
+resampling.resample() of a small dataset, run when the clock reaches its
+duration. Requests are calls of the default function, reads are metadata
+table reads, and latency is the time from the end of the job until the
+client sees it.
+'''
+import argparse
+import os
+import sys
+import numpy
+import pandas
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIRECTORY)
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, '..', 'lambda'))
+
+from import_time import LAMBDA_ENVIRONMENT_VARIABLES
+os.environ.update(LAMBDA_ENVIRONMENT_VARIABLES)
+os.environ.setdefault('resultCacheTableName', 'result-cache-table')
+
+import default
+import request
+import resampling
+import retrieval
+from local_aws import LocalAws, LocalClock
+
+EMAIL = 'long-poll@example.com'
+
+# a job that ends after job_seconds on a fresh set of stand-ins, with its metadata table reads counted
+def start_job(job_seconds):
+    local_aws = LocalAws()
+    local_aws.install()
+    clock = LocalClock()
+    clock.install()
+    # only the reads of the client are counted, not those of the job
+    reads = {'count': 0, 'counted': True}
+    for name in ('get_item', 'query'):
+        read = getattr(local_aws.metadata_table, name)
+        def counted_read(*arguments, read = read, **keyword_arguments):
+            reads['count'] += reads['counted']
+            return read(*arguments, **keyword_arguments)
+        setattr(local_aws.metadata_table, name, counted_read)
+    response = request.request({
+        'email': EMAIL,
+        'method': 'ro',
+        'y': 'y',
+        'chartDataSize': 50,
+        'taskStatusSnsTopicSubscriptionOption': 'reject',
+        'taskStatusSnsTopicSubscriptionArn': None,
+        'originalFileName': 'long_poll.csv'
+    })
+    x = numpy.random.default_rng(0).normal(size = 200)
+    data = pandas.DataFrame({'x': x, 'y': numpy.exp(x)})
+    local_aws.s3_client.put_object(Bucket = response['s3RawDataBucketName'], Key = response['s3RawDataObjectKey'], Body = data.to_csv(index = False))
+    job = {'requestId': response['requestId'], 'endTime': clock.monotonic() + job_seconds}
+    def end_job():
+        reads['counted'] = False
+        resampling.resample(response['s3RawDataBucketName'], response['s3RawDataObjectKey'])
+        reads['counted'] = True
+    clock.call_later(job_seconds, end_job)
+    return job, clock, reads
+
+def call(operation, payload):
+    return default.operations[operation]({'requestId': payload['requestId'], 'email': EMAIL, **payload})
+
+def poll(job_seconds, poll_interval_seconds):
+    job, clock, reads = start_job(job_seconds)
+    request_count = 0
+    while True:
+        request_count += 1
+        if call('retrieve', {'requestId': job['requestId']})['resamplingEndTime'] != None:
+            return request_count, reads['count'], clock.monotonic() - job['endTime']
+        clock.sleep(poll_interval_seconds)
+
+def long_poll(job_seconds):
+    job, clock, reads = start_job(job_seconds)
+    request_count = 0
+    while True:
+        request_count += 1
+        if not call('wait', {'requestId': job['requestId']}).get('timedOut', False):
+            return request_count, reads['count'], clock.monotonic() - job['endTime']
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Compare tight polling of retrieve with long polls of wait.')
+    parser.add_argument('--job-seconds', type = float, nargs = '+', default = [10.5, 60.5, 300.5])
+    parser.add_argument('--poll-interval-seconds', type = float, default = 1)
+    arguments = parser.parse_args()
+
+    print('{:>10}  {:<26}  {:>9}  {:>7}  {:>10}'.format('job (s)', 'client', 'requests', 'reads', 'latency (s)'))
+    for job_seconds in arguments.job_seconds:
+        for client, measure in (
+            ('poll every {:g} s'.format(arguments.poll_interval_seconds), lambda: poll(job_seconds, arguments.poll_interval_seconds)),
+            ('wait, at most {:g} s each'.format(retrieval.WAIT_MAXIMUM_SECONDS), lambda: long_poll(job_seconds))
+        ):
+            request_count, read_count, latency_seconds = measure()
+            print('{:>10g}  {:<26}  {:>9}  {:>7}  {:>10.2f}'.format(job_seconds, client, request_count, read_count, latency_seconds))
+
+if __name__ == '__main__':
+    main()
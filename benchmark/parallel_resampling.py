@@ -0,0 +1,92 @@
+'''Compare the wall-clock time of the resampling stages run sequentially and
+over worker processes, on synthetic data and without any AWS service.
+
+Usage (from the repository root, with lambda/requirements.txt installed):
+
+    python benchmark/parallel_resampling.py                        # ro, ru, gn and enn on 4000 and 10000 rows
+    python benchmark/parallel_resampling.py --rows 50000 --methods ro ru --workers 4
+
+Every method runs through resampling.resample_data() once with
+resamplingWorkerCount=1 and once with --workers. The neighbour graph and
+the overlap of writing the resampled data with the chart computation are
+timed the same way. Resampling draws random samples, so the row counts of
+the two runs may differ slightly.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+import numpy
+import pandas
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from import_time import LAMBDA_ENVIRONMENT_VARIABLES
+for name, value in LAMBDA_ENVIRONMENT_VARIABLES.items():
+    os.environ.setdefault(name, value)
+os.environ['neighbourIndexPersistence'] = 'false'
+
+import resampling
+from helper import neighbour_index
+from helper.dataset_io import write_dataset
+from helper.parallel import start_stage
+
+def generate_data(rows, features = 5, seed = 0):
+    random = numpy.random.default_rng(seed)
+    data = pandas.DataFrame(random.normal(size = (rows, features)), columns = ['x{}'.format(feature) for feature in range(features)])
+    # a skewed target, so that the relevance function finds rare values in the upper tail
+    data['y'] = numpy.exp(data['x0'] + random.normal(scale = 0.3, size = rows))
+    return data
+
+def time_call(worker_count, function, *arguments):
+    os.environ['resamplingWorkerCount'] = str(worker_count)
+    start_time = time.perf_counter()
+    result = function(*arguments)
+    return time.perf_counter() - start_time, result
+
+def time_neighbour_graph(matrix, k):
+    # a fresh index every time, the graphs are memoized otherwise
+    neighbour_index.neighbour_indexes.clear()
+    return neighbour_index.get_neighbour_index(matrix, 'benchmark').kneighbors(k)
+
+def write_and_chart(data, resampled_data, file_path, overlap):
+    write = start_stage(overlap, write_dataset, resampled_data, file_path, 'csv')
+    resampling.compute_kde_plot_data_points(data, resampled_data, 'y', 200)
+    write.result()
+
+def print_row(name, rows, sequential_seconds, parallel_seconds, note = ''):
+    print('{:<16} {:>8} rows {:>9.2f} s {:>9.2f} s {:>7.2f}x  {}'.format(name, rows, sequential_seconds, parallel_seconds, sequential_seconds / parallel_seconds, note))
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark sequential against parallel resampling stages.')
+    parser.add_argument('--rows', type = int, nargs = '+', default = [4000, 10000], help = 'synthetic data set sizes')
+    parser.add_argument('--methods', nargs = '+', default = ['ro', 'ru', 'gn', 'enn'], help = 'methods of resampling.methods to run')
+    parser.add_argument('--workers', type = int, default = 2, help = 'worker count of the parallel runs')
+    arguments = parser.parse_args()
+
+    print('{:<16} {:>13} {:>11} {:>11} {:>8}'.format('stage', 'size', '1 worker', '{} workers'.format(arguments.workers), 'speedup'))
+    for rows in arguments.rows:
+        data = generate_data(rows)
+        for method in arguments.methods:
+            # the first call also imports ImbalancedLearningRegression, keep it out of the measurement
+            resampling.resample_data(data.head(200), method, 'y', {})
+            neighbour_index.neighbour_indexes.clear()
+            sequential_seconds, sequential_result = time_call(1, resampling.resample_data, data, method, 'y', {})
+            neighbour_index.neighbour_indexes.clear()
+            parallel_seconds, parallel_result = time_call(arguments.workers, resampling.resample_data, data, method, 'y', {})
+            print_row(method, rows, sequential_seconds, parallel_seconds, '{} -> {} rows'.format(len(sequential_result), len(parallel_result)))
+
+        # neighbour graphs are only queried in parallel from NEIGHBOUR_QUERY_PARTITION_MINIMUM_ROWS rows on
+        matrix = data.drop(columns = 'y').to_numpy()
+        sequential_seconds, _ = time_call(1, time_neighbour_graph, matrix, 4)
+        parallel_seconds, _ = time_call(arguments.workers, time_neighbour_graph, matrix, 4)
+        print_row('neighbour graph', rows, sequential_seconds, parallel_seconds, '' if rows >= neighbour_index.NEIGHBOUR_QUERY_PARTITION_MINIMUM_ROWS else '(below the partition threshold)')
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_path = os.path.join(directory, 'resampled.csv')
+            sequential_seconds, _ = time_call(1, write_and_chart, data, data, file_path, False)
+            parallel_seconds, _ = time_call(arguments.workers, write_and_chart, data, data, file_path, True)
+            print_row('write + chart', rows, sequential_seconds, parallel_seconds)
+
+if __name__ == '__main__':
+    main()
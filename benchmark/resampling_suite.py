@@ -0,0 +1,303 @@
+'''Benchmark the whole resampling path of every method on synthetic
+imbalanced regression data, against the in-memory AWS stand-ins of
+local_aws.py, and fail on regressions against a stored baseline.
+
+Usage (from the repository root, with lambda/requirements.txt installed):
+
+    python benchmark/resampling_suite.py                                  # every method on 1000 and 5000 rows
+    python benchmark/resampling_suite.py --methods ro gn --rows 10000 50000 --columns 5 20 --skew 0.5 1.5
+    python benchmark/resampling_suite.py --save-baseline benchmark/baseline.json
+    python benchmark/resampling_suite.py --baseline benchmark/baseline.json --tolerance 0.25
+    python benchmark/resampling_suite.py --limits --limits-output benchmark/method_size_limits.json
+
+Every case runs in a fresh interpreter: a request record is created with
+request.request(), the CSV is put into the stand-in raw data bucket and
+resampling.resample() handles it like the S3 notification would. The stage
+durations are the resamplingMetrics of the record (see
+lambda/helper/job_metrics.py), the peak memory is the peak RSS of the case
+process. ImbalancedLearningRegression is imported before the measurement,
+and partitioned jobs are disabled, so every case runs in one invocation.
+
+A baseline is the JSON of a run saved with --save-baseline, compared case by
+case: a case regresses when its total, resample or chart duration or its
+peak memory exceeds the baseline by more than --tolerance, beyond a small
+absolute margin for noise. Baselines are only comparable on the machine they
+were saved on.
+
+--limits grows the rows of every method until a case takes --limits-case-seconds,
+fits the duration (a power of the rows) and the peak memory (linear in the
+rows) and extrapolates the largest data set that still fits the Lambda
+timeout and memory size of the resampling function, with --limits-margin of
+headroom. The limits are those of the measuring machine: Lambda runs the
+function on 2 vCPUs at 3008 MB.
+'''
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import numpy
+import pandas
+
+BENCHMARK_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIRECTORY, '..', 'lambda'))
+from import_time import LAMBDA_ENVIRONMENT_VARIABLES
+for name, value in LAMBDA_ENVIRONMENT_VARIABLES.items():
+    os.environ.setdefault(name, value)
+os.environ.setdefault('resultCacheTableName', 'result-cache-table')
+os.environ['neighbourIndexPersistence'] = 'false'
+# the cases measure what one invocation handles, large ones are not split into partitioned jobs
+os.environ['partitionedJobMinimumRows'] = str(2 ** 62)
+
+# the resampling function, see lib/cdk-imbalanced-learning-regression-demo-stack.ts
+LAMBDA_TIMEOUT_SECONDS = 15 * 60
+LAMBDA_MEMORY_SIZE_MB = 3008
+# stages compared against the baseline, besides the total and the peak memory
+BASELINE_STAGES = ('resample', 'chart')
+# differences below these are noise, whatever the tolerance
+BASELINE_MINIMUM_DIFFERENCE_MS = 50
+BASELINE_MINIMUM_DIFFERENCE_MB = 32
+# smallest case of the size limit search
+LIMITS_MINIMUM_ROWS = 50
+
+def generate_dataset(rows, columns = 5, skew = 1.0, seed = 0):
+    '''A regression data set whose target is log-normal in the first
+    feature: the larger skew, the longer and sparser the upper tail, which
+    is what the relevance function marks as rare.
+    '''
+    random = numpy.random.default_rng(seed)
+    data = pandas.DataFrame(random.normal(size = (rows, columns)), columns = ['x{}'.format(column) for column in range(columns)])
+    data['y'] = numpy.exp(skew * data['x0'] + random.normal(scale = 0.3, size = rows))
+    return data
+
+# runs in the case process
+def run_case(method, rows, columns, skew, worker_count):
+    os.environ['resamplingWorkerCount'] = str(worker_count)
+    import request
+    import resampling
+    from local_aws import LocalAws
+    local_aws = LocalAws()
+    local_aws.install()
+
+    data = generate_dataset(rows, columns, skew)
+    # import the methods outside of the measurement
+    resampling.resample_data(generate_dataset(200, columns, skew, seed = 1), method, 'y', {})
+
+    record = request.request({
+        'email': 'benchmark@example.com',
+        'method': method,
+        'y': 'y',
+        'chartDataSize': 200,
+        'taskStatusSnsTopicSubscriptionOption': 'subscribed',
+        'taskStatusSnsTopicSubscriptionArn': 'arn:aws:sns:us-east-1:000000000000:task-status:benchmark',
+        'originalFileName': 'benchmark.csv'
+    })
+    local_aws.s3_client.put_object(Bucket = record['s3RawDataBucketName'], Key = record['s3RawDataObjectKey'], Body = data.to_csv(index = False).encode('utf-8'))
+    start_time = time.perf_counter()
+    resampling.resample(record['s3RawDataBucketName'], record['s3RawDataObjectKey'])
+    total_seconds = time.perf_counter() - start_time
+
+    metadata = local_aws.metadata_table.get_item(Key = {'requestId': record['requestId']})['Item']
+    stages = dict()
+    for stage_metrics in metadata['resamplingMetrics']['M']['stages']:
+        stages[stage_metrics['stage']] = stages.get(stage_metrics['stage'], 0) + float(stage_metrics['durationMs'])
+    failed = metadata['resamplingEndTime']['N'] is None
+    resampled_rows = None
+    if not failed:
+        resampled_object = local_aws.s3_client.get_object(Bucket = record['s3ResampledDataBucketName'], Key = record['s3ResampledDataObjectKey'])
+        resampled_rows = len(pandas.read_csv(resampled_object['Body']))
+    return {
+        'status': 'failed' if failed else 'completed',
+        'totalMs': round(total_seconds * 1000, 1),
+        'stagesMs': stages,
+        'resampledRows': resampled_rows,
+        'throughputRowsPerSecond': round(rows / stages['resample'] * 1000, 1) if stages.get('resample') else None,
+        # ru_maxrss is reported in kilobytes on linux
+        'peakRssMb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+def measure_case(method, rows, columns, skew, worker_count, timeout_seconds):
+    case = {'method': method, 'rows': rows, 'columns': columns, 'skew': skew, 'workers': worker_count}
+    try:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-case', json.dumps(case)],
+            capture_output = True,
+            text = True,
+            timeout = timeout_seconds
+        )
+    except subprocess.TimeoutExpired:
+        return dict(case, status = 'timeout', totalMs = timeout_seconds * 1000.0)
+    # the result is the last line, the lines before are the logs of the handlers
+    lines = completed.stdout.strip().splitlines()
+    if completed.returncode != 0 or len(lines) == 0:
+        return dict(case, status = 'error', error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'exit code {}'.format(completed.returncode))
+    return dict(case, **json.loads(lines[-1]))
+
+def get_case_key(case):
+    return '{method}:{rows}:{columns}:{skew}:{workers}'.format(**case)
+
+def print_header():
+    print('{:<11} {:>8} {:>5} {:>5} {:>10} {:>10} {:>9} {:>12} {:>9}  {}'.format('method', 'rows', 'cols', 'skew', 'total s', 'resample s', 'chart ms', 'rows/s', 'peak MB', 'status'))
+
+def print_case(case):
+    stages = case.get('stagesMs', {})
+    print('{:<11} {:>8} {:>5} {:>5} {:>10.2f} {:>10} {:>9} {:>12} {:>9}  {}'.format(
+        case['method'],
+        case['rows'],
+        case['columns'],
+        case['skew'],
+        case['totalMs'] / 1000 if 'totalMs' in case else float('nan'),
+        '{:.2f}'.format(stages['resample'] / 1000) if 'resample' in stages else '-',
+        '{:.1f}'.format(stages['chart']) if 'chart' in stages else '-',
+        '{:.0f}'.format(case['throughputRowsPerSecond']) if case.get('throughputRowsPerSecond') else '-',
+        '{:.0f}'.format(case['peakRssMb']) if 'peakRssMb' in case else '-',
+        case['status'] if case['status'] != 'error' else 'error: ' + case['error']
+    ))
+
+# regression messages of the cases measured with the baseline as well
+def compare_with_baseline(cases, baseline, tolerance):
+    baseline_cases = {get_case_key(case): case for case in baseline['cases']}
+    regressions = list()
+    for case in cases:
+        baseline_case = baseline_cases.get(get_case_key(case))
+        if baseline_case is None or baseline_case['status'] != 'completed':
+            continue
+        if case['status'] != 'completed':
+            regressions.append('{}: {} (completed in the baseline)'.format(get_case_key(case), case['status']))
+            continue
+        measures = [('total', case['totalMs'], baseline_case['totalMs'], BASELINE_MINIMUM_DIFFERENCE_MS, 'ms')]
+        measures += [(stage, case['stagesMs'].get(stage, 0), baseline_case['stagesMs'].get(stage, 0), BASELINE_MINIMUM_DIFFERENCE_MS, 'ms') for stage in BASELINE_STAGES]
+        measures.append(('peak memory', case['peakRssMb'], baseline_case['peakRssMb'], BASELINE_MINIMUM_DIFFERENCE_MB, 'MB'))
+        for name, value, baseline_value, minimum_difference, unit in measures:
+            if value > baseline_value * (1 + tolerance) and value - baseline_value > minimum_difference:
+                regressions.append('{}: {} {:.1f} {} against {:.1f} {} in the baseline'.format(get_case_key(case), name, value, unit, baseline_value, unit))
+    return regressions
+
+# duration = a * rows ** b and peak memory = c + d * rows, fitted on the completed cases
+def extrapolate_size_limit(cases, margin):
+    cases = [case for case in cases if case['status'] == 'completed']
+    timed_cases = [case for case in cases if case['totalMs'] > 0]
+    if len(timed_cases) < 2:
+        return None
+    rows = numpy.array([case['rows'] for case in timed_cases], dtype = numpy.float64)
+    seconds = numpy.array([case['totalMs'] / 1000 for case in timed_cases])
+    exponent, log_factor = numpy.polyfit(numpy.log(rows), numpy.log(seconds), 1)
+    # a duration growing slower than linearly means fixed costs still dominate, so extrapolate the largest case linearly instead
+    if exponent < 1:
+        exponent, log_factor = 1.0, numpy.log(seconds[-1] / rows[-1])
+    time_limit_rows = numpy.exp((numpy.log(LAMBDA_TIMEOUT_SECONDS * margin) - log_factor) / exponent)
+    memory_slope, memory_intercept = numpy.polyfit(rows, [case['peakRssMb'] for case in timed_cases], 1)
+    memory_limit_rows = (LAMBDA_MEMORY_SIZE_MB * margin - memory_intercept) / memory_slope if memory_slope > 0 else float('inf')
+    return {
+        'maximumRows': int(min(time_limit_rows, memory_limit_rows)),
+        'limitedBy': 'time' if time_limit_rows <= memory_limit_rows else 'memory',
+        'timeLimitRows': int(time_limit_rows),
+        'memoryLimitRows': int(memory_limit_rows) if numpy.isfinite(memory_limit_rows) else None,
+        'durationExponent': round(float(exponent), 3),
+        'durationFactor': float('{:.4g}'.format(numpy.exp(log_factor))),
+        'memoryMbPerMillionRows': round(float(memory_slope) * 1e6, 1),
+        'memoryInterceptMb': round(float(memory_intercept), 1),
+        'measuredRows': [case['rows'] for case in timed_cases]
+    }
+
+def measure_size_limits(methods, columns, skew, worker_count, start_rows, case_seconds, margin):
+    limits = dict()
+    for method in methods:
+        cases = list()
+        rows = start_rows
+        while True:
+            case = measure_case(method, rows, columns, skew, worker_count, case_seconds * 4)
+            print_case(case)
+            cases.append(case)
+            if case['status'] != 'completed' or case['totalMs'] / 1000 >= case_seconds or case['peakRssMb'] >= LAMBDA_MEMORY_SIZE_MB * margin:
+                break
+            rows *= 2
+        # a method too slow for the first case gets smaller ones instead, until two of them give a slope
+        rows = start_rows
+        while len([case for case in cases if case['status'] == 'completed']) < 2 and rows >= LIMITS_MINIMUM_ROWS * 4:
+            rows //= 4
+            case = measure_case(method, rows, columns, skew, worker_count, case_seconds * 4)
+            print_case(case)
+            cases.insert(0, case)
+        limits[method] = extrapolate_size_limit(cases, margin)
+        print('{:<11} size limit: {}'.format(method, json.dumps(limits[method])))
+    return limits
+
+def get_machine():
+    return {'platform': platform.platform(), 'python': platform.python_version(), 'cpuCount': os.cpu_count()}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark every resampling method end to end against local AWS stand-ins.')
+    parser.add_argument('--methods', nargs = '+', default = None, help = 'methods of resampling.methods to run, all by default')
+    parser.add_argument('--rows', type = int, nargs = '+', default = [1000, 5000], help = 'synthetic data set sizes')
+    parser.add_argument('--columns', type = int, nargs = '+', default = [5], help = 'feature counts of the synthetic data sets')
+    parser.add_argument('--skew', type = float, nargs = '+', default = [1.0], help = 'skews of the synthetic targets')
+    parser.add_argument('--workers', type = int, default = 1, help = 'resamplingWorkerCount of the cases')
+    parser.add_argument('--case-timeout', type = float, default = LAMBDA_TIMEOUT_SECONDS, help = 'seconds after which a case counts as timed out')
+    parser.add_argument('--baseline', help = 'baseline JSON to compare with, the run fails on regressions')
+    parser.add_argument('--tolerance', type = float, default = 0.25, help = 'relative slowdown or memory growth tolerated against the baseline')
+    parser.add_argument('--save-baseline', help = 'write the results of this run as a baseline JSON')
+    parser.add_argument('--limits', action = 'store_true', help = 'extrapolate the largest data set every method handles within the Lambda limits')
+    parser.add_argument('--limits-start-rows', type = int, default = 1000, help = 'rows of the first case of every method')
+    parser.add_argument('--limits-case-seconds', type = float, default = 60, help = 'rows double until a case takes this long')
+    parser.add_argument('--limits-margin', type = float, default = 0.8, help = 'share of the timeout and memory size a job may use')
+    parser.add_argument('--limits-output', help = 'write the size limits as JSON')
+    parser.add_argument('--run-case', help = argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.run_case != None:
+        case = json.loads(arguments.run_case)
+        result = run_case(case['method'], case['rows'], case['columns'], case['skew'], case['workers'])
+        sys.stdout.flush()
+        print(json.dumps(result))
+        return
+
+    import resampling
+    methods = arguments.methods or list(resampling.methods)
+    print_header()
+    if arguments.limits:
+        limits = measure_size_limits(methods, arguments.columns[0], arguments.skew[0], arguments.workers, arguments.limits_start_rows, arguments.limits_case_seconds, arguments.limits_margin)
+        if arguments.limits_output:
+            with open(arguments.limits_output, 'w') as file:
+                json.dump({
+                    'machine': get_machine(),
+                    'lambdaTimeoutSeconds': LAMBDA_TIMEOUT_SECONDS,
+                    'lambdaMemorySizeMb': LAMBDA_MEMORY_SIZE_MB,
+                    'margin': arguments.limits_margin,
+                    'caseSeconds': arguments.limits_case_seconds,
+                    'columns': arguments.columns[0],
+                    'skew': arguments.skew[0],
+                    'workers': arguments.workers,
+                    'methods': limits
+                }, file, indent = 2)
+                file.write('\n')
+        return
+
+    cases = list()
+    for rows in arguments.rows:
+        for columns in arguments.columns:
+            for skew in arguments.skew:
+                for method in methods:
+                    case = measure_case(method, rows, columns, skew, arguments.workers, arguments.case_timeout)
+                    print_case(case)
+                    cases.append(case)
+
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, 'w') as file:
+            json.dump({'machine': get_machine(), 'cases': cases}, file, indent = 2)
+            file.write('\n')
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare_with_baseline(cases, baseline, arguments.tolerance)
+        for regression in regressions:
+            print('REGRESSION ' + regression)
+        print('{} regressions against {} (tolerance {:.0%})'.format(len(regressions), arguments.baseline, arguments.tolerance))
+        if len(regressions) > 0:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''Compare the JSON serializers of helper/lambda_http.py on large chart
+payloads, and what gzip compression of the body costs and saves.
+
+Usage (from the repository root, with lambda/requirements.txt installed):
+
+    python benchmark/response_serialization.py                             # 200 and 2000 points, 1 and 10 charts
+    python benchmark/response_serialization.py --chart-data-sizes 10000 --charts 20 --repeat 20
+    python benchmark/response_serialization.py --formats points --compression-level 6
+
+The payload is that of retrieve-status with includeChartData: the statuses
+of --charts completed jobs, each with the chart of a skewed sample of
+--chart-data-sizes points, in the packed layout and as the legacy list of
+points of chartDataFormat=points, whose every value is a string. Every
+available serializer (orjson only when installed) serializes the payload
+--repeat times, and the fastest time is reported, as is the time to gzip
+and base64 encode the body as generate_lambda_proxy_success_response() does,
+at --compression-level.
+'''
+import argparse
+import base64
+import gzip
+import json
+import os
+import sys
+import time
+import numpy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+from import_time import LAMBDA_ENVIRONMENT_VARIABLES
+for name, value in LAMBDA_ENVIRONMENT_VARIABLES.items():
+    os.environ.setdefault(name, value)
+
+import resampling
+from helper.chart_data import unpack_chart_data_points, CHART_DATA_RAW_DENSITY_NAME, CHART_DATA_RESAMPLED_DENSITY_NAME
+from helper.lambda_http import json_serializers, RESPONSE_COMPRESSION_LEVEL
+
+# the packed chart of chart_data_size points of a skewed sample, as resampling stores it
+def generate_chart(chart_data_size, seed = 0):
+    random = numpy.random.default_rng(seed)
+    target_list = numpy.linspace(0, 10, chart_data_size)
+    raw_density = numpy.exp(-target_list) * (1 + 0.1 * random.random(chart_data_size))
+    resampled_density = numpy.exp(-target_list / 2) / 2 * (1 + 0.1 * random.random(chart_data_size))
+    return resampling.pack_kde_plot_data_points(target_list, {
+        CHART_DATA_RAW_DENSITY_NAME: raw_density,
+        CHART_DATA_RESAMPLED_DENSITY_NAME: resampled_density
+    })
+
+# the data of a retrieve-status response with the charts of charts jobs
+def generate_payload(chart_data_size, charts, chart_data_format):
+    statuses = list()
+    for index in range(charts):
+        chart = generate_chart(chart_data_size, index)
+        statuses.append({
+            'requestId': 'benchmark-{}'.format(index),
+            'status': 'completed',
+            'method': 'ro',
+            'resultCacheHit': False,
+            'chartDataPoints': unpack_chart_data_points(chart) if chart_data_format == 'points' else chart
+        })
+    return {'data': {'statuses': statuses}}
+
+def time_fastest(repeat, function, *arguments):
+    best_seconds = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function(*arguments)
+        best_seconds = min(best_seconds, time.perf_counter() - start_time)
+    return best_seconds, result
+
+def compress_body(body, compression_level):
+    return base64.b64encode(gzip.compress(body, compresslevel = compression_level, mtime = 0))
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the JSON serializers and the compression of API responses.')
+    parser.add_argument('--chart-data-sizes', type = int, nargs = '+', default = [200, 2000], help = 'points of every chart')
+    parser.add_argument('--charts', type = int, nargs = '+', default = [1, 10], help = 'charts of every payload')
+    parser.add_argument('--formats', nargs = '+', choices = ['packed', 'points'], default = ['packed', 'points'])
+    parser.add_argument('--compression-level', type = int, default = RESPONSE_COMPRESSION_LEVEL, help = 'gzip level from 1 to 9')
+    parser.add_argument('--repeat', type = int, default = 10)
+    arguments = parser.parse_args()
+
+    print('{:<7} {:>6} {:>6}  {:<7} {:>10} {:>10}  {:>10} {:>10}'.format('format', 'points', 'charts', 'backend', 'json (ms)', 'bytes', 'gzip (ms)', 'gzip bytes'))
+    for chart_data_format in arguments.formats:
+        for chart_data_size in arguments.chart_data_sizes:
+            for charts in arguments.charts:
+                payload = generate_payload(chart_data_size, charts, chart_data_format)
+                bodies = dict()
+                for name, serializer in json_serializers.items():
+                    serialize_seconds, body = time_fastest(arguments.repeat, serializer, payload)
+                    compress_seconds, compressed_body = time_fastest(arguments.repeat, compress_body, body, arguments.compression_level)
+                    bodies[name] = body
+                    print('{:<7} {:>6} {:>6}  {:<7} {:>10.2f} {:>10}  {:>10.2f} {:>10}'.format(
+                        chart_data_format, chart_data_size, charts, name, serialize_seconds * 1000, len(body), compress_seconds * 1000, len(compressed_body)
+                    ))
+                decoded_bodies = [json.loads(body) for body in bodies.values()]
+                if any(decoded_body != decoded_bodies[0] for decoded_body in decoded_bodies):
+                    raise Exception('The serializers returned different payloads!')
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,16 @@
-from subscribe_sns_notification import subscribe_sns_notification
-from request import request
-from retrieval import retrieve
-from helper.lambda_http import extract_request_body, generate_lambda_proxy_success_response, generate_lambda_proxy_exception_response
+from helper.lazy_import import lazy_function
+from helper.lambda_http import extract_request_body, accepts_compressed_response, generate_lambda_proxy_success_response, generate_lambda_proxy_exception_response
 
 def echo(payload):
     return payload
 
+# operation modules (and the AWS clients they create) are imported on their first use only
 operations = {
-    'subscribe-sns-notification': subscribe_sns_notification,
-    'request': request,
-    'retrieve': retrieve,
+    'subscribe-sns-notification': lazy_function('subscribe_sns_notification', 'subscribe_sns_notification'),
+    'request': lazy_function('request', 'request'),
+    'retrieve': lazy_function('retrieval', 'retrieve'),
+    'retrieve-status': lazy_function('retrieval', 'retrieve_statuses'),
+    'wait': lazy_function('retrieval', 'wait_for_completion'),
     'echo': echo,
 }
 
@@ -25,7 +26,7 @@ def lambda_handler(event, context):
         operation = request_body['operation']
         payload = request_body['payload']
         if operation in operations:
-            return generate_lambda_proxy_success_response(operations[operation](payload))
+            return generate_lambda_proxy_success_response(operations[operation](payload), compress = accepts_compressed_response(event))
         else:
             raise ValueError(f'Unrecognized operation "{operation}"')
     except Exception as e:
@@ -0,0 +1,66 @@
+import math
+import numpy
+import pandas
+from helper.method_parameters import APPROXIMATE_PARTITION_ROWS, APPROXIMATE_VALIDATION_ROWS
+from helper.partitioned_methods import plan_target_partitions, resample_partition
+from helper.parallel import run_in_processes
+
+# the validation sample is approximated with as many partitions as the data, but with partitions of at least this many rows
+APPROXIMATE_VALIDATION_MINIMUM_PARTITION_ROWS = 100
+
+# the approximate mode of cnn, enn and tomeklinks: rather than searching the neighbours among all rows, the method runs on
+# partitions of about APPROXIMATE_PARTITION_ROWS rows dealt out in order of the target, like the partitioned methods,
+# so that every partition is a stratified sample of the data and the cost grows linearly with the rows
+# approximation_report: a dict to which the partitioning and its deviation from the exact mode on a validation sample are added:
+# { partitions, partitionRows, validation: { rows, partitions, exactRows, approximateRows, rowAgreement, targetKsStatistic } }
+def resample_approximately(method, method_function, data, y, method_parameters, worker_count, approximation_report = None):
+    approximation_report = approximation_report if approximation_report != None else dict()
+    method_parameters = dict(method_parameters)
+    chunk_count = math.ceil(len(data) / APPROXIMATE_PARTITION_ROWS[method])
+    # one row of every relevance bump per partition, so that every partition has every bump
+    chunk_positions = plan_target_partitions(data, y, method_parameters, chunk_count, 1)
+    if chunk_positions is None:
+        approximation_report.update({'partitions': 1, 'partitionRows': len(data), 'validation': None})
+        return method_function(data = data.copy(deep = False), y = y, **method_parameters)
+    tasks = [(resample_partition, (method_function, data, y, method_parameters, positions)) for positions in chunk_positions]
+
+    # the validation sample runs exactly and approximately together with the partitions
+    validation_data = get_validation_sample(data, y, APPROXIMATE_VALIDATION_ROWS[method])
+    validation_chunk_positions = plan_target_partitions(validation_data, y, method_parameters, min(chunk_count, len(validation_data) // APPROXIMATE_VALIDATION_MINIMUM_PARTITION_ROWS), 1)
+    if validation_chunk_positions != None:
+        tasks.append((resample_partition, (method_function, validation_data, y, method_parameters, numpy.arange(len(validation_data)))))
+        tasks += [(resample_partition, (method_function, validation_data, y, method_parameters, positions)) for positions in validation_chunk_positions]
+    print('Resampling {} rows approximately in {} partitions, validated on {} rows'.format(len(data), len(chunk_positions), len(validation_data) if validation_chunk_positions != None else 0))
+    resampled_chunks = run_in_processes(tasks, worker_count)
+
+    approximation_report.update({'partitions': len(chunk_positions), 'partitionRows': int(numpy.mean([len(positions) for positions in chunk_positions])), 'validation': None})
+    if validation_chunk_positions != None:
+        validation_chunks = resampled_chunks[len(chunk_positions):]
+        approximation_report['validation'] = dict(
+            get_approximation_deviation(validation_chunks[0], pandas.concat(validation_chunks[1:], ignore_index = True), y),
+            rows = len(validation_data),
+            partitions = len(validation_chunk_positions)
+        )
+        print('Approximation deviation on the validation sample: {}'.format(approximation_report['validation']))
+    return pandas.concat(resampled_chunks[:len(chunk_positions)], ignore_index = True)
+
+# every (rows / sample rows)-th row in order of the target, a stratified sample of the whole range of the target
+def get_validation_sample(data, y, sample_rows):
+    if len(data) <= sample_rows:
+        return data.reset_index(drop = True)
+    order = numpy.argsort(data[y].to_numpy(), kind = 'stable')
+    positions = numpy.sort(order[numpy.linspace(0, len(data) - 1, sample_rows).astype(int)])
+    return data.iloc[positions].reset_index(drop = True)
+
+# rowAgreement: the share of rows kept by either mode that are kept by both (1 when identical)
+# targetKsStatistic: the largest difference between the distribution functions of the resampled targets (0 when identical)
+def get_approximation_deviation(exact_data, approximate_data, y):
+    from scipy.stats import ks_2samp
+    exact_rows = set(pandas.util.hash_pandas_object(exact_data.astype(str), index = False))
+    approximate_rows = set(pandas.util.hash_pandas_object(approximate_data.astype(str), index = False))
+    return {
+        'exactRows': len(exact_data),
+        'approximateRows': len(approximate_data),
+        'rowAgreement': round(len(exact_rows & approximate_rows) / max(1, len(exact_rows | approximate_rows)), 4),
+        'targetKsStatistic': round(float(ks_2samp(exact_data[y], approximate_data[y]).statistic), 4) if len(exact_data) > 0 and len(approximate_data) > 0 else None
+    }
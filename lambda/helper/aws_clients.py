@@ -0,0 +1,99 @@
+import os
+import threading
+
+# connections kept per client, enough for the threads of overlapping stages and multipart transfers
+AWS_CLIENT_MAXIMUM_POOL_CONNECTIONS = 32
+AWS_CLIENT_CONNECT_TIMEOUT_SECONDS = 5
+AWS_CLIENT_READ_TIMEOUT_SECONDS = 60
+# the standard retry mode backs off exponentially with jitter on throttling and transient errors, this many attempts in total
+AWS_CLIENT_MAXIMUM_ATTEMPTS = 5
+
+# every module shares one client per service and one resource per service, created on first use
+clients = dict()
+resources = dict()
+tables = dict()
+lock = threading.Lock()
+# service name -> client or resource used instead of a real one, such as the local stand-ins of benchmark/local_aws.py
+client_stand_ins = dict()
+resource_stand_ins = dict()
+
+def get_client(service_name):
+    client = clients.get(service_name)
+    if client is None:
+        with lock:
+            if service_name not in clients:
+                clients[service_name] = client_stand_ins[service_name] if service_name in client_stand_ins else create_aws_object('client', service_name)
+            client = clients[service_name]
+    return client
+
+def get_resource(service_name):
+    resource = resources.get(service_name)
+    if resource is None:
+        with lock:
+            if service_name not in resources:
+                resources[service_name] = resource_stand_ins[service_name] if service_name in resource_stand_ins else create_aws_object('resource', service_name)
+            resource = resources[service_name]
+    return resource
+
+def get_table(table_name):
+    table = tables.get(table_name)
+    if table is None:
+        table = get_resource('dynamodb').Table(table_name)
+        with lock:
+            table = tables.setdefault(table_name, table)
+    return table
+
+# boto3 is imported here, on the creation of the first client, instead of at cold start
+def create_aws_object(kind, service_name):
+    import boto3
+    from botocore.config import Config
+    config = Config(
+        max_pool_connections = AWS_CLIENT_MAXIMUM_POOL_CONNECTIONS,
+        connect_timeout = AWS_CLIENT_CONNECT_TIMEOUT_SECONDS,
+        read_timeout = AWS_CLIENT_READ_TIMEOUT_SECONDS,
+        retries = {'mode': 'standard', 'total_max_attempts': AWS_CLIENT_MAXIMUM_ATTEMPTS},
+        tcp_keepalive = True
+    )
+    return getattr(boto3, kind)(service_name, config = config, endpoint_url = get_endpoint_url(service_name))
+
+# e.g. s3EndpointUrl for S3 only, or awsEndpointUrl for every service, to use a local emulation of AWS
+def get_endpoint_url(service_name):
+    return os.environ.get('{}EndpointUrl'.format(service_name)) or os.environ.get('awsEndpointUrl') or None
+
+# stand_in_clients: { service name: client }, stand_in_resources: { service name: resource }, the clients created so far are dropped
+def use_stand_ins(stand_in_clients = {}, stand_in_resources = {}):
+    with lock:
+        client_stand_ins.clear()
+        client_stand_ins.update(stand_in_clients)
+        resource_stand_ins.clear()
+        resource_stand_ins.update(stand_in_resources)
+    reset_clients()
+
+# clients keep pooled connections, which a forked worker process must not share with its parent
+def reset_clients():
+    with lock:
+        clients.clear()
+        resources.clear()
+        tables.clear()
+
+class LazyAwsObject:
+    '''A module-level name for a shared client, resource or table: every
+    attribute is looked up on get(*arguments), so nothing is created until
+    the first call and stand-ins apply to modules imported before them.
+    '''
+
+    def __init__(self, get, *arguments):
+        self.get = get
+        self.arguments = arguments
+
+    def __getattr__(self, name):
+        return getattr(self.get(*self.arguments), name)
+
+def lazy_client(service_name):
+    return LazyAwsObject(get_client, service_name)
+
+def lazy_resource(service_name):
+    return LazyAwsObject(get_resource, service_name)
+
+def lazy_table(table_name):
+    return LazyAwsObject(get_table, table_name)
@@ -0,0 +1,53 @@
+import base64
+import sys
+from array import array
+
+# chartDataPoints layouts:
+#   version 1 (legacy): [{ 'Target Variable', 'Raw Density', 'Resampled Density' }, ...], stored as a dynamodb L
+#   version 2 (packed): { version, size, targetMin, targetMax, densityEncoding, densities: { <series name>: { scale, values } } }, stored as a dynamodb M
+#     the x-axis is numpy.linspace(targetMin, targetMax, size), and every density series is quantized to unsigned 16-bit integers,
+#     packed little-endian and base64 encoded: density[i] = values[i] * scale
+CHART_DATA_VERSION = 2
+CHART_DATA_DENSITY_ENCODING = 'uint16le-base64'
+CHART_DATA_DENSITY_QUANTIZATION_LEVELS = 65535
+CHART_DATA_TARGET_NAME = 'Target Variable'
+CHART_DATA_RAW_DENSITY_NAME = 'Raw Density'
+CHART_DATA_RESAMPLED_DENSITY_NAME = 'Resampled Density'
+
+def get_chart_data_version(chart_data_points):
+    if chart_data_points is None:
+        return None
+    if isinstance(chart_data_points, list):
+        return 1
+    return int(chart_data_points['version'])
+
+def decode_density_values(density, size):
+    values = array('H')
+    values.frombytes(base64.b64decode(density['values']))
+    if sys.byteorder != 'little':
+        values.byteswap()
+    if len(values) != size:
+        raise Exception('Invalid chart data! Expected {} density values, but found {}!'.format(size, len(values)))
+    scale = float(density['scale'])
+    return [value * scale for value in values]
+
+# expand a packed chart back into the legacy list of points, e.g. for clients that only read version 1
+# the values are strings, as the API sends the Decimals of a record, so that the serializer converts none of them itself
+def unpack_chart_data_points(chart_data_points):
+    version = get_chart_data_version(chart_data_points)
+    if version is None:
+        return None
+    if version == 1:
+        return [{name: str(value) for name, value in point.items()} for point in chart_data_points]
+    if version != CHART_DATA_VERSION or chart_data_points['densityEncoding'] != CHART_DATA_DENSITY_ENCODING:
+        raise Exception('Unsupported chart data version {} with density encoding {}!'.format(version, chart_data_points.get('densityEncoding')))
+    size = int(chart_data_points['size'])
+    target_min = float(chart_data_points['targetMin'])
+    target_step = (float(chart_data_points['targetMax']) - target_min) / (size - 1) if size > 1 else 0
+    densities = {name: decode_density_values(density, size) for name, density in chart_data_points['densities'].items()}
+    result = list()
+    for index in range(size):
+        point = {CHART_DATA_TARGET_NAME: str(target_min + index * target_step)}
+        point.update({name: str(values[index]) for name, values in densities.items()})
+        result.append(point)
+    return result
@@ -0,0 +1,181 @@
+import io
+import os
+import numpy
+import pandas
+from pandas._libs.parsers import STR_NA_VALUES
+import pyarrow
+import pyarrow.csv
+import pyarrow.feather
+import pyarrow.parquet
+from helper.s3_transfer import S3_TRANSFER_MULTIPART_THRESHOLD_BYTES, download_object
+from helper.file_format import get_data_compression, get_uncompressed_data_file_format
+from helper.job_metrics import get_peak_memory_mb
+
+# raw data is streamed from S3 into pyarrow's incremental CSV reader in blocks of this many bytes
+RAW_DATA_READ_BLOCK_SIZE_BYTES = 16 * 1024 * 1024
+# object columns with at most this ratio of distinct values to rows become categoricals when downcasting
+CATEGORICAL_MAXIMUM_UNIQUE_RATIO = 0.5
+
+class PrefixedStream(io.RawIOBase):
+    '''A read-only stream that replays the bytes already consumed from a
+    stream before continuing with the rest of that stream.
+    '''
+
+    def __init__(self, prefix, stream):
+        self.prefix = memoryview(prefix)
+        self.stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if len(self.prefix) > 0:
+            size = min(len(buffer), len(self.prefix))
+            buffer[:size] = self.prefix[:size]
+            self.prefix = self.prefix[size:]
+            return size
+        chunk = self.stream.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+class UnclosedStream(io.RawIOBase):
+    '''A writable stream over a file object that leaves the file open when
+    it is closed, so that a compressed stream can be closed to end its
+    output while the file stays open for its owner.
+    '''
+
+    def __init__(self, file):
+        self.file = file
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.file.write(data)
+
+def get_object_body(s3_client, bucket, key):
+    try:
+        return s3_client.get_object(Bucket = bucket, Key = key)['Body']
+    except Exception as e:
+        print(e)
+        print('Error getting object {} from bucket {}. Make sure they exist and your bucket is in the same region as this function.'.format(key, bucket))
+        raise e
+
+# data_format: one of the format names in helper/file_format.py
+# size_bytes: the size of the object if known, large columnar objects are then downloaded in parts on several threads
+# content_encoding: the Content-Encoding the object is stored with, whose compression is undone while the object is read
+def read_dataset_from_s3(s3_client, bucket, key, data_format = 'csv', downcast = False, exclude_columns = (), size_bytes = None, content_encoding = None):
+    compression = get_data_compression(data_format, content_encoding)
+    data_format = get_uncompressed_data_file_format(data_format)
+    # csv is parsed while it is downloaded in one stream, the columnar formats need the whole object first
+    if data_format in ('parquet', 'feather') and size_bytes != None and size_bytes > S3_TRANSFER_MULTIPART_THRESHOLD_BYTES:
+        body, transfer = download_object(s3_client, bucket, key, size_bytes)
+        print('Downloaded object {} from bucket {}: {:.1f} MB at {} MB/s'.format(key, bucket, transfer['bytes'] / 1024 / 1024, transfer['throughputMbPerSecond']))
+    else:
+        body = get_object_body(s3_client, bucket, key)
+    if compression != None:
+        body = open_decompressed_stream(body, compression)
+    if data_format == 'csv':
+        try:
+            data = read_csv_stream(body, downcast, exclude_columns)
+        except pyarrow.ArrowInvalid as e:
+            # the column types are inferred from the first block, so a later block may not fit them, e.g. a decimal in an integer column
+            print('Streaming CSV parse of object {} from bucket {} failed ({}), falling back to pandas.read_csv.'.format(key, bucket, e))
+            body = get_object_body(s3_client, bucket, key)
+            data = pandas.read_csv(open_decompressed_stream(body, compression) if compression != None else body)
+    elif data_format == 'parquet':
+        # parquet footers are at the end of the file, so the columnar formats are read from an in-memory buffer
+        data = pyarrow.parquet.read_table(pyarrow.BufferReader(body.read())).to_pandas(split_blocks = True, self_destruct = True)
+    elif data_format == 'feather':
+        data = pyarrow.feather.read_table(pyarrow.BufferReader(body.read())).to_pandas(split_blocks = True, self_destruct = True)
+    else:
+        raise Exception('Unexpected input data_format: {}, in read_dataset_from_s3() in dataset_io.py!'.format(data_format))
+    if downcast:
+        data = downcast_dtypes(data, exclude_columns)
+    print('Read object {} from bucket {}: {} rows, {} columns, {:.1f} MB in memory, peak RSS {:.1f} MB, peak arrow pool {:.1f} MB'.format(
+        key,
+        bucket,
+        data.shape[0],
+        data.shape[1],
+        data.memory_usage(deep = True).sum() / 1024 / 1024,
+        get_peak_memory_mb(),
+        pyarrow.default_memory_pool().max_memory() / 1024 / 1024
+    ))
+    return data
+
+# file: a path or a binary file object, which stays open
+# content_encoding: the Content-Encoding the data is to be stored with, in whose compression it is written
+def write_dataset(data, file, data_format = 'csv', content_encoding = None):
+    compression = get_data_compression(data_format, content_encoding)
+    if compression != None:
+        # compressed by pyarrow's codecs while it is written, faster than pandas' gzip and without a zstandard dependency
+        with open_compressed_output_stream(file, compression) as stream:
+            write_dataset(data, stream, get_uncompressed_data_file_format(data_format))
+    elif data_format == 'csv':
+        data.to_csv(file, index = False)
+    elif data_format == 'parquet':
+        data.to_parquet(file, engine = 'pyarrow', index = False)
+    elif data_format == 'feather':
+        data.reset_index(drop = True).to_feather(file)
+    else:
+        raise Exception('Unexpected input data_format: {}, in write_dataset() in dataset_io.py!'.format(data_format))
+
+# a readable stream of the decompressed content of stream, decompressed as it is read
+def open_decompressed_stream(stream, compression):
+    return pyarrow.CompressedInputStream(pyarrow.PythonFile(stream, mode = 'r'), compression)
+
+def open_compressed_output_stream(file, compression):
+    if isinstance(file, str):
+        return pyarrow.CompressedOutputStream(file, compression)
+    return pyarrow.CompressedOutputStream(pyarrow.PythonFile(UnclosedStream(file), mode = 'w'), compression)
+
+# read as pandas.read_csv reads them, with its default missing values and empty strings as missing
+def read_csv_stream(stream, downcast = False, exclude_columns = ()):
+    # infer the column types on the first block only, then pin the temporal ones to strings since pandas.read_csv does not parse dates either
+    first_block = stream.read(RAW_DATA_READ_BLOCK_SIZE_BYTES)
+    read_options = pyarrow.csv.ReadOptions(block_size = RAW_DATA_READ_BLOCK_SIZE_BYTES)
+    # the default missing values of the installed pandas.read_csv, which differ between its versions
+    convert_options = pyarrow.csv.ConvertOptions(null_values = sorted(STR_NA_VALUES), strings_can_be_null = True)
+    schema = pyarrow.csv.open_csv(io.BytesIO(first_block[:first_block.rfind(b'\n') + 1] or first_block), read_options = read_options, convert_options = convert_options).schema
+    convert_options.column_types = {field.name: pyarrow.string() for field in schema if pyarrow.types.is_temporal(field.type)}
+    reader = pyarrow.csv.open_csv(io.BufferedReader(PrefixedStream(first_block, stream), RAW_DATA_READ_BLOCK_SIZE_BYTES), read_options = read_options, convert_options = convert_options)
+    del first_block
+    # every block is converted, and downcast, as soon as it is read, so that at most one block is held by arrow at a time,
+    # then the columns are joined one by one, releasing the parts of each
+    column_parts = [list() for _ in reader.schema]
+    for batch in reader:
+        part = pyarrow.Table.from_batches([batch]).to_pandas(split_blocks = True, self_destruct = True)
+        del batch
+        if downcast:
+            part = downcast_dtypes(part, exclude_columns, categorical = False)
+        for position in range(part.shape[1]):
+            column = part.iloc[:, position]
+            # the missing values of object columns, strings or booleans with missing values, are NaN like those of pandas.read_csv
+            if column.dtype == object:
+                column = column.where(column.notna(), numpy.nan)
+            column_parts[position].append(column)
+        del part
+    if len(column_parts) == 0 or len(column_parts[0]) == 0:
+        return reader.schema.empty_table().to_pandas()
+    columns = list()
+    for position in range(len(column_parts)):
+        columns.append(pandas.concat(column_parts[position], ignore_index = True))
+        column_parts[position] = None
+    return pandas.concat(columns, axis = 1, copy = False)
+
+# categorical: whether object columns become categoricals, which only pays off once all rows are known
+def downcast_dtypes(data, exclude_columns = (), categorical = True):
+    for column in data.columns:
+        if column in exclude_columns:
+            continue
+        dtype = data[column].dtype
+        if pandas.api.types.is_float_dtype(dtype):
+            data[column] = data[column].astype('float32')
+        elif pandas.api.types.is_integer_dtype(dtype):
+            data[column] = pandas.to_numeric(data[column], downcast = 'integer')
+        elif categorical and pandas.api.types.is_object_dtype(dtype) and data[column].nunique() <= CATEGORICAL_MAXIMUM_UNIQUE_RATIO * len(data):
+            data[column] = data[column].astype('category')
+    return data
+
+def is_downcast_enabled():
+    return os.environ.get('rawDataDowncastDtypes', 'false').strip().lower() == 'true'
@@ -0,0 +1,210 @@
+import io
+import zlib
+import pyarrow
+import pyarrow.compute
+import pyarrow.csv
+import pyarrow.ipc
+import pyarrow.parquet
+from helper.file_format import get_data_compression, get_uncompressed_data_file_format
+
+# a csv object is profiled on this many of its first bytes, parsed up to the last complete line
+PROFILE_CSV_SAMPLE_BYTES = 1024 * 1024
+# columnar objects are read in range GETs of at least this many bytes, which covers most footers in one request
+PROFILE_RANGE_BLOCK_BYTES = 64 * 1024
+# at most this many bytes are read from a columnar object, beyond which the profile is made from its footer only
+PROFILE_MAXIMUM_READ_BYTES = 16 * 1024 * 1024
+
+class S3RangeFile(io.RawIOBase):
+    '''A seekable read-only file over an S3 object of a known size, read
+    through range GETs of whole blocks, so that pyarrow can read the footer
+    and schema of a columnar object without downloading all of it. Reading
+    more than maximum_read_bytes raises.
+    '''
+
+    def __init__(self, s3_client, bucket, key, size_bytes, maximum_read_bytes = PROFILE_MAXIMUM_READ_BYTES):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size_bytes = size_bytes
+        self.maximum_read_bytes = maximum_read_bytes
+        self.position = 0
+        self.read_bytes = 0
+        # block start -> bytes
+        self.blocks = dict()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence = io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size_bytes
+        self.position = max(0, offset)
+        return self.position
+
+    def tell(self):
+        return self.position
+
+    def readinto(self, buffer):
+        end = min(self.position + len(buffer), self.size_bytes)
+        size = 0
+        while self.position < end:
+            block_start = self.position - self.position % PROFILE_RANGE_BLOCK_BYTES
+            block = self.get_block(block_start, end)
+            chunk = block[self.position - block_start : end - block_start]
+            buffer[size : size + len(chunk)] = chunk
+            size += len(chunk)
+            self.position += len(chunk)
+        return size
+
+    # reads from block_start to at least end in one request, in whole blocks
+    def get_block(self, block_start, end):
+        if block_start in self.blocks and block_start + len(self.blocks[block_start]) >= end:
+            return self.blocks[block_start]
+        block_end = min(self.size_bytes, -(-end // PROFILE_RANGE_BLOCK_BYTES) * PROFILE_RANGE_BLOCK_BYTES)
+        if self.read_bytes + block_end - block_start > self.maximum_read_bytes:
+            raise Exception('Profiling object {} in bucket {} would read more than {} bytes!'.format(self.key, self.bucket, self.maximum_read_bytes))
+        block = get_object_range(self.s3_client, self.bucket, self.key, block_start, block_end)
+        self.read_bytes += len(block)
+        self.blocks[block_start] = block
+        return block
+
+# bytes start to end (exclusive) of bucket/key
+def get_object_range(s3_client, bucket, key, start, end):
+    return s3_client.get_object(Bucket = bucket, Key = key, Range = 'bytes={}-{}'.format(start, end - 1))['Body'].read()
+
+# a profile of bucket/key of size_bytes in data_format (see helper/file_format.py), stored with content_encoding, from a sample or the footer of the object:
+# { format, sizeBytes, bytesRead, rows, rowsEstimated, columns, columnTypes: { type: count }, sampleRows, missingValues, target: { name, type, numeric, missing, distinct, min, max } }
+# rows is estimated from the share of the object the sample covers when rowsEstimated, the target statistics are those of the sample,
+# or of the footer statistics of a parquet object, and are None when unknown
+def profile_dataset(s3_client, bucket, key, data_format, y, size_bytes, content_encoding = None):
+    compression = get_data_compression(data_format, content_encoding)
+    if get_uncompressed_data_file_format(data_format) == 'csv':
+        profile = profile_csv(s3_client, bucket, key, compression, y, size_bytes)
+    elif compression != None:
+        # the footer of a compressed columnar object cannot be read without all of the object before it
+        raise Exception('Object {} in bucket {} is a compressed {} object, which cannot be profiled from a sample!'.format(key, bucket, data_format))
+    elif data_format == 'parquet':
+        profile = profile_parquet(S3RangeFile(s3_client, bucket, key, size_bytes), y)
+    elif data_format == 'feather':
+        profile = profile_feather(S3RangeFile(s3_client, bucket, key, size_bytes), y, size_bytes)
+    else:
+        raise Exception('Unexpected input data_format: {}, in profile_dataset() in dataset_profile.py!'.format(data_format))
+    profile.update({'format': data_format, 'sizeBytes': size_bytes})
+    return profile
+
+def profile_csv(s3_client, bucket, key, compression, y, size_bytes):
+    sample = get_object_range(s3_client, bucket, key, 0, min(size_bytes, PROFILE_CSV_SAMPLE_BYTES)) if size_bytes > 0 else b''
+    bytes_read = len(sample)
+    complete = bytes_read >= size_bytes
+    # a compressed sample is decompressed as far as it goes, and the rows estimated from its compression ratio
+    compression_ratio = 1
+    if compression == 'gzip':
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        compressed_size = len(sample)
+        sample = decompressor.decompress(sample)
+        compression_ratio = len(sample) / max(1, compressed_size - len(decompressor.unused_data))
+        complete = complete and decompressor.eof
+    elif compression != None:
+        # pyarrow's codecs decompress as far as the sample goes, then fail on its cut end
+        stream = pyarrow.CompressedInputStream(pyarrow.BufferReader(sample), compression)
+        chunks = list()
+        try:
+            for chunk in iter(lambda: stream.read(PROFILE_RANGE_BLOCK_BYTES), b''):
+                chunks.append(chunk)
+        except OSError:
+            complete = False
+        compressed_size = len(sample)
+        sample = b''.join(chunks)
+        compression_ratio = len(sample) / max(1, compressed_size)
+    if not complete:
+        sample = sample[:sample.rfind(b'\n') + 1]
+    table = pyarrow.csv.read_csv(io.BytesIO(sample)) if len(sample.strip()) > 0 else pyarrow.table({})
+    if complete or len(sample) == 0:
+        rows = table.num_rows
+    else:
+        rows = int(table.num_rows * size_bytes * compression_ratio / len(sample))
+    return get_sample_profile(table, y, rows, not complete, bytes_read)
+
+def profile_parquet(file, y):
+    parquet_file = pyarrow.parquet.ParquetFile(file)
+    metadata = parquet_file.metadata
+    profile = get_sample_profile(parquet_file.schema_arrow.empty_table(), y, metadata.num_rows, False, 0)
+    # the footer holds the row count and, per row group, the minimum, maximum and null count of every column
+    if profile['target']['numeric'] and metadata.num_row_groups > 0:
+        column_index = parquet_file.schema_arrow.get_field_index(y)
+        missing, minimum, maximum = 0, None, None
+        for index in range(metadata.num_row_groups):
+            # pyarrow 8 crashes on statistics whose row group metadata has been released, so every level is kept in a variable
+            row_group = metadata.row_group(index)
+            column = row_group.column(column_index)
+            statistics = column.statistics
+            if statistics is None or not statistics.has_min_max or not statistics.has_null_count:
+                break
+            missing += statistics.null_count
+            minimum = statistics.min if minimum is None else min(minimum, statistics.min)
+            maximum = statistics.max if maximum is None else max(maximum, statistics.max)
+        else:
+            profile['target'].update({'missing': missing, 'min': float(minimum), 'max': float(maximum)})
+    profile['bytesRead'] = file.read_bytes
+    return profile
+
+# pandas writes feather files in record batches of 64k rows, the first of which is the sample
+def profile_feather(file, y, size_bytes):
+    reader = pyarrow.ipc.open_file(file)
+    try:
+        table = pyarrow.Table.from_batches([reader.get_batch(0)]) if reader.num_record_batches > 0 else reader.schema.empty_table()
+    except Exception as e:
+        print('Profiling with the schema of the feather file only: {}'.format(e))
+        table = reader.schema.empty_table()
+    if table.num_rows > 0:
+        # at most a batch too many, when the last batch is shorter
+        rows = table.num_rows * reader.num_record_batches
+    else:
+        # the fixed width of a row, counting 8 bytes for every other column
+        row_bytes = sum(field.type.bit_width // 8 if pyarrow.types.is_primitive(field.type) and field.type.bit_width >= 8 else 8 for field in reader.schema)
+        rows = size_bytes // max(1, row_bytes)
+    return get_sample_profile(table, y, rows, reader.num_record_batches != 1, file.read_bytes)
+
+def get_sample_profile(table, y, rows, rows_estimated, bytes_read):
+    column_types = dict()
+    for field in table.schema:
+        column_types[str(field.type)] = column_types.get(str(field.type), 0) + 1
+    profile = {
+        'rows': rows,
+        'rowsEstimated': rows_estimated,
+        'columns': table.num_columns,
+        'columnTypes': column_types,
+        'sampleRows': table.num_rows,
+        'bytesRead': bytes_read,
+        'missingValues': sum(column.null_count for column in table.columns) if table.num_rows > 0 else None,
+        'target': {'name': y, 'type': None, 'numeric': False, 'missing': None, 'distinct': None, 'min': None, 'max': None}
+    }
+    if y not in table.column_names:
+        return profile
+    target = table.column(y)
+    # an empty csv column is inferred as null, which says nothing about the type of its other values
+    profile['target'].update({'type': str(target.type), 'numeric': is_numeric_type(target.type) or pyarrow.types.is_null(target.type)})
+    if table.num_rows > 0:
+        profile['target'].update({'missing': target.null_count, 'distinct': len(target.unique()) - (target.null_count > 0)})
+        if is_numeric_type(target.type) and target.null_count < len(target):
+            minimum_maximum = pyarrow.compute.min_max(target)
+            profile['target'].update({'min': float(minimum_maximum['min'].as_py()), 'max': float(minimum_maximum['max'].as_py())})
+    return profile
+
+def is_numeric_type(data_type):
+    return pyarrow.types.is_integer(data_type) or pyarrow.types.is_floating(data_type) or pyarrow.types.is_decimal(data_type)
+
+# raises when the target of the profile cannot be resampled: missing, not numeric, or without values in the whole data
+def validate_target(profile):
+    target = profile['target']
+    if target['type'] is None:
+        raise Exception('Target column {} does not exist in the data!'.format(target['name']))
+    if not target['numeric']:
+        raise Exception('Target column {} is of type {}! Should be numeric!'.format(target['name'], target['type']))
+    if not profile['rowsEstimated'] and target['missing'] != None and target['missing'] >= profile['rows']:
+        raise Exception('Target column {} has no values!'.format(target['name']))
@@ -1,17 +1,44 @@
 # remove type capital letters introduced in dynamodb update_item in resampling
+# chartDataPoints is either a legacy list of points (L) or a packed chart (M), see helper/chart_data.py
 def remove_dynamodb_item_types(obj):
-    chart_data_points = obj['chartDataPoints']['L'] if 'chartDataPoints' in obj else None
+    chart_data_points = remove_chart_data_points_type(obj['chartDataPoints']) if 'chartDataPoints' in obj else None
     resampling_start_time = obj['resamplingStartTime']['N'] if 'resamplingStartTime' in obj else None
     resampling_end_time = obj['resamplingEndTime']['N'] if 'resamplingEndTime' in obj else None
     on_resample_start_sns_publish_message_id = obj['onResampleStartSnsPublishMessageId']['S'] if 'onResampleStartSnsPublishMessageId' in obj else None
     on_resample_complete_sns_publish_message_id = obj['onResampleCompleteSnsPublishMessageId']['S'] if 'onResampleCompleteSnsPublishMessageId' in obj else None
     on_resample_fail_sns_publish_message_id = obj['onResampleFailSnsPublishMessageId']['S'] if 'onResampleFailSnsPublishMessageId' in obj else None
+    result_cache_hit = obj['resultCacheHit']['BOOL'] if 'resultCacheHit' in obj else None
+    batch_results = obj['batchResults']['L'] if 'batchResults' in obj else None
+    resampling_metrics = obj['resamplingMetrics']['M'] if 'resamplingMetrics' in obj else None
+    partitioned_job = obj['partitionedJob']['M'] if 'partitionedJob' in obj else None
+    partitioned_job_status = obj['partitionedJobStatus']['S'] if 'partitionedJobStatus' in obj else None
+    # a number set, which is not JSON serializable
+    completed_partitions = sorted(int(partition) for partition in obj['completedPartitions']) if 'completedPartitions' in obj else None
+    notification_outbox = obj['notificationOutbox']['L'] if 'notificationOutbox' in obj else None
+    dataset_profile = obj['datasetProfile']['M'] if 'datasetProfile' in obj else None
+    approximation_report = obj['approximationReport']['M'] if 'approximationReport' in obj else None
+    job_profile = obj['jobProfile']['M'] if 'jobProfile' in obj else None
     obj.update({
         'chartDataPoints': chart_data_points,
         'resamplingStartTime': resampling_start_time,
         'resamplingEndTime': resampling_end_time,
         'onResampleStartSnsPublishMessageId': on_resample_start_sns_publish_message_id,
         'onResampleCompleteSnsPublishMessageId': on_resample_complete_sns_publish_message_id,
-        'onResampleFailSnsPublishMessageId': on_resample_fail_sns_publish_message_id
+        'onResampleFailSnsPublishMessageId': on_resample_fail_sns_publish_message_id,
+        'resultCacheHit': result_cache_hit,
+        'batchResults': batch_results,
+        'resamplingMetrics': resampling_metrics,
+        'partitionedJob': partitioned_job,
+        'partitionedJobStatus': partitioned_job_status,
+        'completedPartitions': completed_partitions,
+        'notificationOutbox': notification_outbox,
+        'datasetProfile': dataset_profile,
+        'approximationReport': approximation_report,
+        'jobProfile': job_profile
     })
-    return obj
\ No newline at end of file
+    return obj
+
+def remove_chart_data_points_type(chart_data_points):
+    if 'M' in chart_data_points:
+        return chart_data_points['M']
+    return chart_data_points['L']
\ No newline at end of file
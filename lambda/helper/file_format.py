@@ -0,0 +1,69 @@
+from mimetypes import guess_type
+
+# supported data file suffixes, longest first so that compound suffixes win, and their content types
+data_file_content_types = {
+    '.csv.gz': 'application/gzip',
+    '.csv.zst': 'application/zstd',
+    '.parquet': 'application/vnd.apache.parquet',
+    '.feather': 'application/vnd.apache.arrow.file',
+    '.csv': 'text/csv'
+}
+# files with any other suffix are parsed as csv, as they always have been
+default_data_file_suffix = '.csv'
+# the compressed csv formats and their compression, named like the codecs of pyarrow, which are the Content-Encoding names as well
+data_file_compressions = {
+    'csv.gz': 'gzip',
+    'csv.zst': 'zstd'
+}
+# Content-Encoding of an object -> the compression of its content, in which any format may be stored
+content_encoding_compressions = {
+    'gzip': 'gzip',
+    'x-gzip': 'gzip',
+    'zstd': 'zstd',
+    'identity': None
+}
+
+def get_data_file_suffix(file_name):
+    lower_file_name = file_name.lower()
+    for suffix in data_file_content_types:
+        if lower_file_name.endswith(suffix):
+            return file_name[len(file_name) - len(suffix):]
+    return file_name[file_name.rindex("."):]
+
+# data file format names are the supported suffixes without the leading dot: csv, csv.gz, csv.zst, parquet, feather
+def get_data_file_format(file_name_or_suffix):
+    suffix = get_data_file_suffix(file_name_or_suffix).lower()
+    return (suffix if suffix in data_file_content_types else default_data_file_suffix)[1:]
+
+def get_data_file_format_suffix(data_file_format):
+    suffix = '.' + data_file_format.strip().lower()
+    if suffix not in data_file_content_types:
+        raise Exception('Unsupported file format {}! Should be one of {}!'.format(data_file_format, ', '.join(suffix[1:] for suffix in data_file_content_types)))
+    return suffix
+
+# the compression of an object of data_format stored with content_encoding: that of a compressed format, or of its Content-Encoding
+def get_data_compression(data_format, content_encoding = None):
+    if data_format in data_file_compressions:
+        return data_file_compressions[data_format]
+    return content_encoding_compressions[normalize_content_encoding(content_encoding)]
+
+# the format a compressed format is a compression of, csv for csv.gz and csv.zst
+def get_uncompressed_data_file_format(data_format):
+    return 'csv' if data_format in data_file_compressions else data_format
+
+# no Content-Encoding stands for identity
+def normalize_content_encoding(content_encoding):
+    content_encoding = (content_encoding or 'identity').strip().lower()
+    if content_encoding not in content_encoding_compressions:
+        raise Exception('Unsupported Content-Encoding {}! Should be one of {}!'.format(content_encoding, ', '.join(content_encoding_compressions)))
+    return content_encoding
+
+def get_content_type(file_name):
+    lower_file_name = file_name.lower()
+    for suffix, content_type in data_file_content_types.items():
+        if lower_file_name.endswith(suffix):
+            return content_type
+    content_type = guess_type(file_name)[0]
+    if type(content_type) != str:
+        content_type = "application/octet-stream"
+    return content_type
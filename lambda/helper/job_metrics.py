@@ -0,0 +1,89 @@
+import contextlib
+import json
+import resource
+import threading
+import time
+from decimal import Decimal
+
+class JobMetrics:
+    '''Durations and sizes of the stages of one resampling job. Every stage
+    is timed with the monotonic clock and logged as one JSON line as it
+    ends, so that the stages of all jobs can be aggregated from the logs.
+    '''
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.start_time = time.perf_counter()
+        # stages may end on the threads of overlapping stages
+        self.lock = threading.Lock()
+        self.stages = list()
+        # a JobProfiler captures the stages of a profiled job, see helper/job_profiler.py
+        self.profiler = None
+
+    # yields the dict of the stage, to which the stage adds what it handled: rows, columns and bytes
+    @contextlib.contextmanager
+    def measure(self, stage, **sizes):
+        stage_metrics = dict(sizes, stage = stage)
+        stage_start_time = time.perf_counter()
+        try:
+            if self.profiler is None:
+                yield stage_metrics
+            else:
+                with self.profiler.capture(stage_metrics):
+                    yield stage_metrics
+        except Exception as e:
+            stage_metrics['error'] = type(e).__name__
+            raise e
+        finally:
+            stage_metrics['durationMs'] = round((time.perf_counter() - stage_start_time) * 1000, 1)
+            # stages that transfer or parse data report the throughput they achieved
+            if stage_metrics.get('bytes') and stage_metrics['durationMs'] > 0:
+                stage_metrics['throughputMbPerSecond'] = round(stage_metrics['bytes'] / 1024 / 1024 / stage_metrics['durationMs'] * 1000, 1)
+            stage_metrics['peakRssMb'] = round(get_peak_memory_mb(), 1)
+            with self.lock:
+                self.stages.append(stage_metrics)
+            log_metrics('resamplingStage', self.request_id, stage_metrics)
+
+    # function(*arguments) as a stage, for stages started with helper/parallel.py start_stage()
+    def measured(self, stage, function):
+        def measured_function(*arguments):
+            with self.measure(stage):
+                return function(*arguments)
+        return measured_function
+
+    def get_summary(self):
+        with self.lock:
+            stages = [dict(stage_metrics) for stage_metrics in self.stages]
+        return {
+            'totalMs': round((time.perf_counter() - self.start_time) * 1000, 1),
+            'peakRssMb': round(get_peak_memory_mb(), 1),
+            'stages': stages
+        }
+
+    # the summary in the numbers DynamoDB accepts, logged once more as a whole
+    def to_dynamodb(self):
+        summary = self.get_summary()
+        log_metrics('resamplingJob', self.request_id, {key: value for key, value in summary.items() if key != 'stages'})
+        return to_dynamodb_numbers(summary)
+
+# a stage of a job, or nothing when there is no job_metrics to record it in
+def measure_stage(job_metrics, stage, **sizes):
+    if job_metrics is None:
+        return contextlib.nullcontext(dict())
+    return job_metrics.measure(stage, **sizes)
+
+def log_metrics(metric, request_id, values):
+    print(json.dumps(dict({'metric': metric, 'requestId': request_id}, **values)))
+
+def to_dynamodb_numbers(value):
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, dict):
+        return {key: to_dynamodb_numbers(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_dynamodb_numbers(item) for item in value]
+    return value
+
+def get_peak_memory_mb():
+    # ru_maxrss is reported in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
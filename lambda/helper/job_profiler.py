@@ -0,0 +1,100 @@
+import contextlib
+import cProfile
+import json
+import marshal
+import threading
+import tracemalloc
+import helper.parallel
+
+# allocations are attributed to the innermost frames of their traceback, of which this many are kept
+TRACEMALLOC_FRAMES = 1
+# the report lists this many allocation sites per stage, and this many functions by cumulative time
+TOP_ALLOCATION_SITES = 10
+TOP_FUNCTIONS = 40
+# the allocations of the profiler itself and of imports are left out of the allocation sites
+IGNORED_ALLOCATION_FILES = (tracemalloc.__file__, '<frozen importlib._bootstrap>', '<frozen importlib._bootstrap_external>', '<unknown>')
+
+class JobProfiler:
+    '''cProfile and tracemalloc capture of the stages of one resampling job,
+    attached to its JobMetrics (see helper/job_metrics.py). Every stage run
+    on the thread that created the profiler is profiled, and its peak traced
+    memory and the sites of its allocations still alive at its end recorded.
+    While a stage is captured, its work stays in this process, which the
+    profile covers, rather than in worker processes.
+    '''
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.profile = cProfile.Profile()
+        self.thread_id = threading.get_ident()
+        self.capturing = False
+        self.stages = list()
+
+    # stages on other threads, and stages within a captured stage, are covered by the capture that is already running
+    @contextlib.contextmanager
+    def capture(self, stage_metrics):
+        if self.capturing or threading.get_ident() != self.thread_id:
+            yield stage_metrics
+            return
+        self.capturing = True
+        helper.parallel.in_profiled_stage = True
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.profile.enable()
+        try:
+            yield stage_metrics
+        finally:
+            self.profile.disable()
+            traced_peak_bytes = tracemalloc.get_traced_memory()[1]
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            helper.parallel.in_profiled_stage = False
+            self.capturing = False
+            stage_metrics['tracedPeakMb'] = round(traced_peak_bytes / 1024 / 1024, 1)
+            self.stages.append({
+                'stage': stage_metrics['stage'],
+                'label': stage_metrics.get('label'),
+                'tracedPeakMb': stage_metrics['tracedPeakMb'],
+                'allocationSites': get_allocation_sites(snapshot)
+            })
+
+    # the stats in the marshal format of pstats, which pstats.Stats and snakeviz read
+    def get_stats_bytes(self):
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+    # { requestId, stages: [{ stage, label, tracedPeakMb, allocationSites: [{ site, sizeMb, count }, ...] }, ...],
+    #   functions: [{ function, calls, primitiveCalls, totalSeconds, cumulativeSeconds }, ...] }
+    def get_report(self):
+        self.profile.create_stats()
+        functions = sorted(self.profile.stats.items(), key = lambda item: item[1][3], reverse = True)[:TOP_FUNCTIONS]
+        return {
+            'requestId': self.request_id,
+            'stages': self.stages,
+            'functions': [{
+                'function': '{}:{}({})'.format(*function),
+                'calls': calls,
+                'primitiveCalls': primitive_calls,
+                'totalSeconds': round(total_seconds, 4),
+                'cumulativeSeconds': round(cumulative_seconds, 4)
+            } for function, (primitive_calls, calls, total_seconds, cumulative_seconds, callers) in functions]
+        }
+
+    # uploads the stats and the report next to the resampled data, returns { s3ProfileStatsObjectKey, s3ProfileReportObjectKey }
+    def save(self, s3_client, bucket_name):
+        profile = {
+            's3ProfileStatsObjectKey': 'profile_' + self.request_id + '.prof',
+            's3ProfileReportObjectKey': 'profile_' + self.request_id + '.json'
+        }
+        s3_client.put_object(Bucket = bucket_name, Key = profile['s3ProfileStatsObjectKey'], Body = self.get_stats_bytes(), ContentType = 'application/octet-stream')
+        s3_client.put_object(Bucket = bucket_name, Key = profile['s3ProfileReportObjectKey'], Body = json.dumps(self.get_report()).encode('utf-8'), ContentType = 'application/json')
+        print('Uploaded the profile of request {} to bucket {}'.format(self.request_id, bucket_name))
+        return profile
+
+# the lines that allocated the most memory still alive in snapshot
+def get_allocation_sites(snapshot):
+    snapshot = snapshot.filter_traces([tracemalloc.Filter(False, file_name) for file_name in IGNORED_ALLOCATION_FILES])
+    return [{
+        'site': '{}:{}'.format(statistic.traceback[0].filename, statistic.traceback[0].lineno),
+        'sizeMb': round(statistic.size / 1024 / 1024, 3),
+        'count': statistic.count
+    } for statistic in snapshot.statistics('lineno')[:TOP_ALLOCATION_SITES]]
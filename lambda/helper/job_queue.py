@@ -0,0 +1,73 @@
+import json
+import urllib.parse
+
+# SendMessageBatch and DeleteMessageBatch take at most this many messages per call
+SQS_BATCH_MAXIMUM_ENTRIES = 10
+
+# the jobs of an event: the records of an S3 event of raw data uploads, delivered directly or in the messages of a queue
+# returns [{ bucket, key, sizeBytes, s3Record, message }, ...] in the order of the records, where message is the SQS record
+# the job came in, or None for a direct S3 event
+def get_job_records(event):
+    jobs = list()
+    for record in event.get('Records', []):
+        if record.get('eventSource') == 'aws:sqs':
+            message = record
+            # S3 sends a test event without records when the notification is created
+            s3_records = json.loads(record['body']).get('Records', [])
+        else:
+            message = None
+            s3_records = [record]
+        for s3_record in s3_records:
+            jobs.append({
+                'bucket': s3_record['s3']['bucket']['name'],
+                'key': urllib.parse.unquote_plus(s3_record['s3']['object']['key'], encoding = 'utf-8'),
+                'sizeBytes': int(s3_record['s3']['object'].get('size', 0)),
+                's3Record': s3_record,
+                'message': message
+            })
+    return jobs
+
+# the priority lane holds the jobs of at most small_job_maximum_bytes, smallest first, the other lane the rest in order
+def split_job_lanes(jobs, small_job_maximum_bytes):
+    small_jobs = sorted([job for job in jobs if job['sizeBytes'] <= small_job_maximum_bytes], key = lambda job: job['sizeBytes'])
+    large_jobs = [job for job in jobs if job['sizeBytes'] > small_job_maximum_bytes]
+    return small_jobs, large_jobs
+
+# sends every job to queue_url as an S3 event of its own record
+# returns the jobs that were not sent, those of a failed call and those of the failed entries of a call, so that only their messages fail
+def forward_jobs(sqs_client, queue_url, jobs):
+    failed_jobs = list()
+    for start in range(0, len(jobs), SQS_BATCH_MAXIMUM_ENTRIES):
+        batch_jobs = jobs[start : start + SQS_BATCH_MAXIMUM_ENTRIES]
+        entries = [{'Id': str(index), 'MessageBody': json.dumps({'Records': [job['s3Record']]})} for index, job in enumerate(batch_jobs)]
+        try:
+            response = sqs_client.send_message_batch(QueueUrl = queue_url, Entries = entries)
+        except Exception as e:
+            print('Could not forward {} job(s) to queue {}: {}'.format(len(batch_jobs), queue_url, e))
+            failed_jobs.extend(batch_jobs)
+            continue
+        for failure in response.get('Failed', []):
+            job = batch_jobs[int(failure['Id'])]
+            print('Could not forward object {} to queue {}: {}'.format(job['key'], queue_url, failure.get('Message')))
+            failed_jobs.append(job)
+    return failed_jobs
+
+# deletes a message as soon as its jobs are done, so that a later timeout of the invocation does not run them again
+# the event source mapping deletes it once more when the invocation succeeds, which is harmless
+def delete_message(sqs_client, message):
+    try:
+        sqs_client.delete_message(QueueUrl = get_queue_url(sqs_client, message['eventSourceARN']), ReceiptHandle = message['receiptHandle'])
+    except Exception as e:
+        print('Could not delete message {}: {}'.format(message['messageId'], e))
+
+# queue arn -> queue url, as the endpoint of the client resolves it, which may be overridden or of another partition than aws
+queue_urls = dict()
+
+def get_queue_url(sqs_client, queue_arn):
+    if queue_arn not in queue_urls:
+        account, name = queue_arn.split(':')[4:6]
+        queue_urls[queue_arn] = sqs_client.get_queue_url(QueueName = name, QueueOwnerAWSAccountId = account)['QueueUrl']
+    return queue_urls[queue_arn]
+
+def is_same_queue(queue_arn, queue_url):
+    return queue_arn != None and queue_url != None and queue_arn.split(':')[-1] == queue_url.rstrip('/').split('/')[-1]
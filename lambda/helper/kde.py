@@ -0,0 +1,63 @@
+import numpy
+
+# same defaults as seaborn.kdeplot: scott's rule bandwidth, grid extended by cut * bandwidth past the extreme data points
+KDE_CUT = 3
+# the internal binning grid is refined until its spacing is at most bandwidth / KDE_BINS_PER_BANDWIDTH
+KDE_BINS_PER_BANDWIDTH = 8
+KDE_MAX_BINNING_GRID_SIZE = 2 ** 16
+
+def scott_bandwidth(values):
+    values = numpy.asarray(values, dtype = numpy.float64)
+    if values.size < 2:
+        raise Exception('At least 2 finite target values are required to estimate a density, but {} found!'.format(values.size))
+    bandwidth = numpy.std(values, ddof = 1) * values.size ** (-1 / 5)
+    if not numpy.isfinite(bandwidth) or bandwidth <= 0:
+        raise Exception('Unable to estimate a density of a target variable with zero variance!')
+    return bandwidth
+
+def finite_values(values):
+    values = numpy.asarray(values, dtype = numpy.float64).ravel()
+    return values[numpy.isfinite(values)]
+
+# linear binning: every value splits its unit weight between the two grid points around it
+def linear_binning(values, grid_min, grid_step, grid_size):
+    positions = (values - grid_min) / grid_step
+    lower = numpy.clip(numpy.floor(positions).astype(numpy.int64), 0, grid_size - 2)
+    upper_weights = numpy.clip(positions - lower, 0, 1)
+    counts = numpy.bincount(lower, weights = 1 - upper_weights, minlength = grid_size)
+    counts += numpy.bincount(lower + 1, weights = upper_weights, minlength = grid_size)
+    return counts[:grid_size]
+
+# evaluate the gaussian kernel density estimates of several samples on one shared, evenly spaced grid
+# the binned counts of all samples are convolved with their own kernels in a single batched FFT
+def compute_kde_on_shared_grid(samples, grid_size = 200, cut = KDE_CUT):
+    grid_size = int(grid_size)
+    if grid_size < 2:
+        raise Exception('Invalid chart data size {}! Should be at least 2!'.format(grid_size))
+    samples = [finite_values(sample) for sample in samples]
+    bandwidths = numpy.array([scott_bandwidth(sample) for sample in samples])
+    grid_min = min(sample.min() - cut * bandwidth for sample, bandwidth in zip(samples, bandwidths))
+    grid_max = max(sample.max() + cut * bandwidth for sample, bandwidth in zip(samples, bandwidths))
+    target_list = numpy.linspace(grid_min, grid_max, grid_size)
+
+    # refine the output grid by an integer factor so that the output points are a subset of the binning grid
+    output_step = (grid_max - grid_min) / (grid_size - 1)
+    refinement = int(numpy.ceil(output_step * KDE_BINS_PER_BANDWIDTH / bandwidths.min()))
+    refinement = max(1, min(refinement, (KDE_MAX_BINNING_GRID_SIZE - 1) // (grid_size - 1)))
+    binning_grid_size = refinement * (grid_size - 1) + 1
+    binning_grid_step = output_step / refinement
+
+    counts = numpy.stack([linear_binning(sample, grid_min, binning_grid_step, binning_grid_size) for sample in samples])
+
+    # kernels cover the whole grid, so the zero padding below keeps the FFT convolution free of wrap-around
+    offsets = numpy.arange(-(binning_grid_size - 1), binning_grid_size) * binning_grid_step
+    kernels = numpy.exp(-0.5 * (offsets[numpy.newaxis, :] / bandwidths[:, numpy.newaxis]) ** 2)
+    kernels /= bandwidths[:, numpy.newaxis] * numpy.sqrt(2 * numpy.pi)
+    fft_size = 1 << int(numpy.ceil(numpy.log2(3 * binning_grid_size - 2)))
+    convolved = numpy.fft.irfft(numpy.fft.rfft(counts, fft_size) * numpy.fft.rfft(kernels, fft_size), fft_size)
+    densities = convolved[:, binning_grid_size - 1 : 2 * binning_grid_size - 1 : refinement]
+    densities /= numpy.array([sample.size for sample in samples])[:, numpy.newaxis]
+
+    # FFT round-off may leave tiny negative values far in the tails
+    numpy.clip(densities, 0, None, out = densities)
+    return target_list, densities
@@ -1,26 +1,139 @@
+import base64
+import gzip
+import importlib.util
 import json
+import os
 from decimal import Decimal
 
-class DecimalEncoder(json.JSONEncoder):
-  def default(self, obj):
+# bodies of at least this many bytes are gzip compressed for clients that accept it, smaller ones gain too little
+RESPONSE_COMPRESSION_MINIMUM_BYTES = 1024
+# the fastest level, which saves most of what higher levels do on chart points in a fraction of their time
+RESPONSE_COMPRESSION_LEVEL = 1
+# the binary media type of the API: API Gateway returns the base64 body of a function as binary only to requests whose
+# first Accept media type is a binary one, and passes the bodies of requests with other content types to the functions as text
+COMPRESSED_RESPONSE_MEDIA_TYPE = 'application/gzip'
+
+# Decimals are sent as strings, as the items of the tables hold them, and numpy scalars and arrays as their values
+# the chart points, most of the numbers of a response, are strings already, see unpack_chart_data_points() of helper/chart_data.py
+# numpy is recognised by the module of the type, so that functions without numpy do not import it
+def encode_json_default(obj):
     if isinstance(obj, Decimal):
-      return str(obj)
-    return json.JSONEncoder.default(self, obj)
+        return str(obj)
+    if type(obj).__module__ == 'numpy':
+        return obj.tolist() if hasattr(obj, 'shape') and obj.shape != () else obj.item()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+# orjson serializes numpy arrays and scalars itself, and calls encode_json_default only for the few Decimals of a record
+def serialize_json_orjson(data):
+    # imported on first use, it takes longer to import than the rest of the small functions
+    import orjson
+    return orjson.dumps(data, default = encode_json_default, option = orjson.OPT_SERIALIZE_NUMPY)
+
+def serialize_json_stdlib(data):
+    return json.dumps(data, default = encode_json_default, separators = (',', ':'), ensure_ascii = False).encode('utf-8')
+
+# name -> function of data returning the utf-8 encoded JSON
+json_serializers = {'json': serialize_json_stdlib}
+# orjson is optional: the zip functions have it from the layer of lambda_layer/requirements.txt, the others serialize with the json module
+if importlib.util.find_spec('orjson') != None:
+    json_serializers['orjson'] = serialize_json_orjson
+
+# the serializer of env responseJsonSerializer, or the fastest one available
+def get_json_serializer(name = None):
+    if name is None or name == '':
+        return json_serializers.get('orjson', serialize_json_stdlib)
+    if name not in json_serializers:
+        raise Exception('Unavailable JSON serializer {}! Should be one of {}!'.format(name, ', '.join(json_serializers)))
+    return json_serializers[name]
+
+serialize_json = get_json_serializer(os.environ.get('responseJsonSerializer'))
 
 def extract_request_body(event):
+    # the API passes bodies of its binary media type base64 encoded
+    if event.get('isBase64Encoded'):
+        return json.loads(base64.b64decode(event['body']))
     return json.loads(event['body'])
 
-def generate_lambda_proxy_success_response(response):
+def get_request_header(event, name):
+    # header names are case-insensitive, and API Gateway passes them as sent
+    for header_name, value in (event.get('headers') or {}).items():
+        if header_name.lower() == name.lower():
+            return value
+    return None
+
+# whether an Accept-Encoding header accepts gzip, which it does unless it gives gzip, or * without gzip, a q of 0
+def accepts_gzip(accept_encoding):
+    if accept_encoding is None:
+        return False
+    qualities = dict()
+    for coding in accept_encoding.split(','):
+        name, _, parameters = coding.partition(';')
+        quality = 1.0
+        for parameter in parameters.split(';'):
+            key, _, value = parameter.strip().partition('=')
+            if key.lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip().lower()] = quality
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+# whether a response to event may be compressed: its Accept header names COMPRESSED_RESPONSE_MEDIA_TYPE first, as API Gateway
+# reads only the first media type, and its Accept-Encoding header accepts gzip, so that other clients, such as the UI, get text
+def accepts_compressed_response(event):
+    accept = get_request_header(event, 'Accept')
+    if accept is None or accept.split(',')[0].partition(';')[0].strip().lower() != COMPRESSED_RESPONSE_MEDIA_TYPE:
+        return False
+    return accepts_gzip(get_request_header(event, 'Accept-Encoding'))
+
+# a body is gzip compressed and base64 encoded with compress, see accepts_compressed_response()
+def generate_lambda_proxy_success_response(response, etag = None, compress = False):
+    body = serialize_json({"data": response})
+    if compress and len(body) >= RESPONSE_COMPRESSION_MINIMUM_BYTES:
+        return {
+                "isBase64Encoded": True,
+                "statusCode": 200,
+                "headers": 
+                    { 
+                        "Access-Control-Allow-Origin" : "*",
+                        "Access-Control-Allow-Credentials" : True,
+                        "Content-Type": "application/json",
+                        "Content-Encoding": "gzip",
+                        "Vary": "Accept-Encoding",
+                        **get_etag_headers(etag)
+                    },
+                "body": base64.b64encode(gzip.compress(body, compresslevel = RESPONSE_COMPRESSION_LEVEL, mtime = 0)).decode('ascii')
+            }
     return {
             "isBase64Encoded": False,
             "statusCode": 200,
             "headers": 
                 { 
                     "Access-Control-Allow-Origin" : "*",
-                    "Access-Control-Allow-Credentials" : True
+                    "Access-Control-Allow-Credentials" : True,
+                    **get_etag_headers(etag)
                 },
-            "body": json.dumps({"data": response}, cls = DecimalEncoder)
+            "body": body.decode('utf-8')
         }
+
+def generate_lambda_proxy_not_modified_response(etag):
+    return {
+            "isBase64Encoded": False,
+            "statusCode": 304,
+            "headers": 
+                { 
+                    "Access-Control-Allow-Origin" : "*",
+                    "Access-Control-Allow-Credentials" : True,
+                    **get_etag_headers(etag)
+                },
+            "body": ""
+        }
+
+def get_etag_headers(etag):
+    if etag is None:
+        return {}
+    return {"ETag": etag, "Access-Control-Expose-Headers": "ETag"}
         
 def generate_lambda_proxy_exception_response(e):
     print(e)
@@ -0,0 +1,27 @@
+import importlib
+import sys
+import threading
+import time
+
+# a callable that imports module_name only when it is first called, then forwards every call to module_name.function_name
+# on_import: called with the module before the first call is forwarded, even if something else imported the module earlier
+# first calls on several threads wait for one another, and for a module another thread is still importing
+def lazy_function(module_name, function_name, on_import = None):
+    prepared = False
+    lock = threading.Lock()
+    def function(*args, **kwargs):
+        nonlocal prepared
+        if not prepared:
+            with lock:
+                if not prepared:
+                    import_start_time = time.perf_counter()
+                    imported = module_name not in sys.modules
+                    importlib.import_module(module_name)
+                    if imported:
+                        print('Imported {} on first use of {} in {:.0f} ms'.format(module_name, function_name, (time.perf_counter() - import_start_time) * 1000))
+                    if on_import != None:
+                        on_import(sys.modules[module_name])
+                    prepared = True
+        return getattr(sys.modules[module_name], function_name)(*args, **kwargs)
+    function.__name__ = function_name
+    return function
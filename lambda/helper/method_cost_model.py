@@ -0,0 +1,48 @@
+import math
+import os
+
+# duration = durationFactor * rows ** durationExponent seconds and peak memory = memoryInterceptMb + memoryMbPerMillionRows * rows / 1e6,
+# fitted by benchmark/resampling_suite.py --limits on synthetic data of COST_MODEL_FEATURES features with one worker, see benchmark/method_size_limits.json
+METHOD_COST_MODELS = {
+    'ro': {'durationFactor': 7.146e-05, 'durationExponent': 1.0, 'memoryInterceptMb': 202.9, 'memoryMbPerMillionRows': 659.7},
+    'smote': {'durationFactor': 7.574e-06, 'durationExponent': 1.956, 'memoryInterceptMb': 187.5, 'memoryMbPerMillionRows': 3450.0},
+    'gn': {'durationFactor': 5.46e-06, 'durationExponent': 1.569, 'memoryInterceptMb': 192.1, 'memoryMbPerMillionRows': 1158.4},
+    'adasyn': {'durationFactor': 6.849e-05, 'durationExponent': 2.164, 'memoryInterceptMb': 188.9, 'memoryMbPerMillionRows': 6914.9},
+    'ru': {'durationFactor': 8.196e-05, 'durationExponent': 1.0, 'memoryInterceptMb': 196.1, 'memoryMbPerMillionRows': 599.5},
+    'cnn': {'durationFactor': 6.742e-06, 'durationExponent': 1.939, 'memoryInterceptMb': 188.8, 'memoryMbPerMillionRows': 1600.0},
+    'tomeklinks': {'durationFactor': 1.856e-05, 'durationExponent': 1.08, 'memoryInterceptMb': 202.0, 'memoryMbPerMillionRows': 679.5},
+    'enn': {'durationFactor': 3.088e-05, 'durationExponent': 1.057, 'memoryInterceptMb': 198.5, 'memoryMbPerMillionRows': 886.3}
+}
+COST_MODEL_FEATURES = 5
+# the limits of the resampling function: its timeout, passed by the stack, and its memory size, set by the Lambda runtime
+DEFAULT_TIMEOUT_SECONDS = 900
+DEFAULT_MEMORY_SIZE_MB = 3008
+
+# { predictedSeconds, predictedPeakMemoryMb } of method on rows with features besides the target, or None for a method without a model
+# more features cost more in proportion, fewer are predicted like COST_MODEL_FEATURES features
+# partition_rows and validation_rows: the approximate mode runs on partitions of partition_rows, and exactly on validation_rows more,
+# see helper/approximate_methods.py, while its memory is predicted like that of the exact mode
+def predict_method_cost(method, rows, features, partition_rows = None, validation_rows = 0):
+    model = METHOD_COST_MODELS.get(method)
+    if model is None:
+        return None
+    column_scale = max(1, features / COST_MODEL_FEATURES)
+    get_seconds = lambda rows: model['durationFactor'] * max(1, rows) ** model['durationExponent'] * column_scale
+    if partition_rows != None and rows > partition_rows:
+        seconds = math.ceil(rows / partition_rows) * get_seconds(partition_rows) + 2 * get_seconds(min(rows, validation_rows))
+    else:
+        seconds = get_seconds(rows)
+    return {
+        'predictedSeconds': round(seconds, 1),
+        'predictedPeakMemoryMb': round(model['memoryInterceptMb'] + model['memoryMbPerMillionRows'] * rows / 1e6 * column_scale, 1)
+    }
+
+def get_cost_limits():
+    return {
+        'timeoutSeconds': float(os.environ.get('resamplingTimeoutSeconds', DEFAULT_TIMEOUT_SECONDS)),
+        'memorySizeMb': float(os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', DEFAULT_MEMORY_SIZE_MB))
+    }
+
+# whether a predicted cost exceeds the timeout or the memory size of the function, in which case the job would fail
+def is_over_cost_limits(prediction, limits):
+    return prediction['predictedSeconds'] > limits['timeoutSeconds'] or prediction['predictedPeakMemoryMb'] > limits['memorySizeMb']
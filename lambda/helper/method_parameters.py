@@ -0,0 +1,73 @@
+from decimal import Decimal
+
+# at most this many methods may be requested in one batch
+BATCH_MAXIMUM_METHOD_COUNT = 8
+# these arguments of the resampling methods are provided by the service itself
+RESERVED_METHOD_PARAMETER_NAMES = ('data', 'y')
+# a method runs exactly, or on request approximately if it is one of the neighbour-based methods below, see helper/approximate_methods.py
+EXECUTION_MODES = ('exact', 'approximate')
+# method -> rows per partition of the approximate mode, the cost of cnn grows with the square of the rows of a partition
+APPROXIMATE_PARTITION_ROWS = {
+    'cnn': 1000,
+    'enn': 20000,
+    'tomeklinks': 20000
+}
+# method -> rows of the sample on which the approximate mode measures its deviation from the exact mode
+APPROXIMATE_VALIDATION_ROWS = {
+    'cnn': 2000,
+    'enn': 20000,
+    'tomeklinks': 20000
+}
+
+# validate the keyword arguments of a resampling method, converting floats to Decimal for dynamodb
+def normalize_method_parameters(parameters):
+    if parameters is None:
+        return {}
+    if not isinstance(parameters, dict):
+        raise Exception('Invalid method parameters {}! Should be a JSON object!'.format(parameters))
+    result = dict()
+    for name, value in parameters.items():
+        if not isinstance(name, str) or not name.isidentifier():
+            raise Exception('Invalid method parameter name {}!'.format(name))
+        if name in RESERVED_METHOD_PARAMETER_NAMES:
+            raise Exception('Method parameter {} cannot be overridden!'.format(name))
+        result[name] = normalize_method_parameter_value(name, value)
+    return result
+
+def normalize_method_parameter_value(name, value):
+    if value is None or isinstance(value, (bool, int, str, Decimal)):
+        return value
+    if isinstance(value, float):
+        return Decimal(str(value))
+    if isinstance(value, list):
+        return [normalize_method_parameter_value(name, item) for item in value]
+    raise Exception('Invalid value {} of method parameter {}!'.format(value, name))
+
+def normalize_execution_mode(method, execution_mode):
+    execution_mode = (execution_mode or 'exact').strip().lower()
+    if execution_mode not in EXECUTION_MODES:
+        raise Exception('Invalid executionMode {}! Should be one of {}!'.format(execution_mode, ', '.join(EXECUTION_MODES)))
+    if execution_mode == 'approximate' and method not in APPROXIMATE_PARTITION_ROWS:
+        raise Exception('Method {} has no approximate executionMode! Only {} have one!'.format(method, ', '.join(APPROXIMATE_PARTITION_ROWS)))
+    return execution_mode
+
+# dynamodb returns every number as a Decimal, but the resampling methods expect int or float
+def from_dynamodb_method_parameters(parameters):
+    return {name: from_dynamodb_method_parameter_value(value) for name, value in (parameters or {}).items()}
+
+def from_dynamodb_method_parameter_value(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, list):
+        return [from_dynamodb_method_parameter_value(item) for item in value]
+    return value
+
+# one label per batch entry, numbering repeated methods: ro, smote #1, smote #2
+def get_batch_method_labels(method_names):
+    labels = list()
+    for index, method in enumerate(method_names):
+        if method_names.count(method) > 1:
+            labels.append('{} #{}'.format(method, method_names[:index + 1].count(method)))
+        else:
+            labels.append(method)
+    return labels
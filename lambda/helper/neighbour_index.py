@@ -0,0 +1,126 @@
+import hashlib
+import io
+import time
+from collections import OrderedDict
+import numpy
+from helper.parallel import get_worker_count, run_in_processes, split_range
+
+# a KD-tree answers exact queries fastest in few dimensions, a ball tree degrades more gracefully in many
+KD_TREE_MAXIMUM_DIMENSIONS = 16
+# indexes of this many datasets and feature sets stay in memory for the following jobs of a warm container
+NEIGHBOUR_INDEX_CACHE_SIZE = 2
+# the rows of larger matrices are queried in chunks over the worker processes
+NEIGHBOUR_QUERY_PARTITION_MINIMUM_ROWS = 20000
+# persisted neighbour graphs are stored under this prefix of the raw data bucket, keyed by the index fingerprint
+NEIGHBOUR_INDEX_OBJECT_KEY_PREFIX = 'neighbour_index/'
+
+class NeighbourIndex:
+    '''Exact nearest neighbours of every row of one feature matrix. The tree
+    is built on the first query and the neighbour graph of every number of
+    neighbours is computed once, so that repeated searches are lookups.
+    '''
+
+    def __init__(self, fingerprint, matrix):
+        self.fingerprint = fingerprint
+        self.matrix = matrix
+        self.tree = None
+        # number of neighbours -> (distances, indices), each of shape (rows, number of neighbours), nearest first
+        self.graphs = dict()
+        self.modified = False
+
+    def kneighbors(self, k):
+        # a graph of more neighbours answers fewer neighbours as well
+        for graph_k, (distances, indices) in sorted(self.graphs.items()):
+            if graph_k >= k:
+                return distances[:, :k], indices[:, :k]
+        if self.tree is None:
+            self.tree = build_tree(self.matrix)
+        query_start_time = time.perf_counter()
+        worker_count = get_worker_count() if self.matrix.shape[0] >= NEIGHBOUR_QUERY_PARTITION_MINIMUM_ROWS else 1
+        # the forked workers share the tree with this process
+        results = run_in_processes([(self.tree.query, (self.matrix[start:stop], k)) for start, stop in split_range(self.matrix.shape[0], worker_count)], worker_count)
+        distances = numpy.concatenate([result[0] for result in results])
+        indices = numpy.concatenate([result[1] for result in results])
+        print('Computed the {}-neighbour graph of neighbour index {} ({} rows, {} features) in {:.0f} ms'.format(k, self.fingerprint[:12], self.matrix.shape[0], self.matrix.shape[1], (time.perf_counter() - query_start_time) * 1000))
+        self.graphs[k] = (distances, indices.astype(numpy.int32 if self.matrix.shape[0] < 2 ** 31 else numpy.int64))
+        self.modified = True
+        return self.graphs[k]
+
+def build_tree(matrix):
+    from sklearn.neighbors import BallTree, KDTree
+    build_start_time = time.perf_counter()
+    tree = KDTree(matrix) if matrix.shape[1] <= KD_TREE_MAXIMUM_DIMENSIONS else BallTree(matrix)
+    print('Built {} of {} rows, {} features in {:.0f} ms'.format(type(tree).__name__, matrix.shape[0], matrix.shape[1], (time.perf_counter() - build_start_time) * 1000))
+    return tree
+
+# in-memory indexes, least recently used first
+neighbour_indexes = OrderedDict()
+# (s3 client, bucket name) of the persisted neighbour graphs, persistence is disabled without it
+neighbour_index_store = None
+
+def configure_neighbour_index_store(s3_client, bucket_name):
+    global neighbour_index_store
+    neighbour_index_store = (s3_client, bucket_name) if bucket_name else None
+
+# the fingerprint covers the feature values themselves, so identical data uploaded again finds the same index
+def compute_neighbour_index_fingerprint(matrix, feature_set):
+    fingerprint = hashlib.sha256('{}:{}'.format(feature_set, matrix.shape).encode('utf-8'))
+    fingerprint.update(numpy.ascontiguousarray(matrix, dtype = numpy.float64).tobytes())
+    return fingerprint.hexdigest()
+
+# feature_set: names how the matrix was derived from the dataset, e.g. the scaling, since the same dataset gives a different matrix per method
+def get_neighbour_index(matrix, feature_set):
+    matrix = numpy.ascontiguousarray(matrix, dtype = numpy.float64)
+    fingerprint = compute_neighbour_index_fingerprint(matrix, feature_set)
+    if fingerprint in neighbour_indexes:
+        neighbour_indexes.move_to_end(fingerprint)
+        print('Reused in-memory neighbour index {} ({})'.format(fingerprint[:12], feature_set))
+        return neighbour_indexes[fingerprint]
+    neighbour_index = NeighbourIndex(fingerprint, matrix)
+    load_neighbour_index_graphs(neighbour_index)
+    neighbour_indexes[fingerprint] = neighbour_index
+    while len(neighbour_indexes) > NEIGHBOUR_INDEX_CACHE_SIZE:
+        neighbour_indexes.popitem(last = False)
+    return neighbour_index
+
+def get_neighbour_index_object_key(fingerprint):
+    return NEIGHBOUR_INDEX_OBJECT_KEY_PREFIX + fingerprint + '.npz'
+
+# the persisted graphs are an optimization only, so a failing load is a miss
+def load_neighbour_index_graphs(neighbour_index):
+    if neighbour_index_store is None:
+        return
+    s3_client, bucket_name = neighbour_index_store
+    object_key = get_neighbour_index_object_key(neighbour_index.fingerprint)
+    try:
+        body = s3_client.get_object(Bucket = bucket_name, Key = object_key)['Body'].read()
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') not in ('NoSuchKey', '404'):
+            print('Neighbour index lookup failed: {}'.format(e))
+        return
+    with numpy.load(io.BytesIO(body), allow_pickle = False) as graphs:
+        for name in graphs.files:
+            if name.startswith('indices_'):
+                k = int(name[len('indices_'):])
+                neighbour_index.graphs[k] = (graphs['distances_{}'.format(k)], graphs[name])
+    print('Loaded neighbour index {} with {}-neighbour graphs from bucket {}'.format(neighbour_index.fingerprint[:12], ', '.join(str(k) for k in sorted(neighbour_index.graphs)), bucket_name))
+
+# upload the graphs computed since the last save, failures are logged and otherwise ignored
+def save_neighbour_indexes():
+    if neighbour_index_store is None:
+        return
+    s3_client, bucket_name = neighbour_index_store
+    for neighbour_index in neighbour_indexes.values():
+        if not neighbour_index.modified:
+            continue
+        graphs = dict()
+        for k, (distances, indices) in neighbour_index.graphs.items():
+            graphs['distances_{}'.format(k)] = distances
+            graphs['indices_{}'.format(k)] = indices
+        buffer = io.BytesIO()
+        numpy.savez_compressed(buffer, **graphs)
+        try:
+            s3_client.put_object(Bucket = bucket_name, Key = get_neighbour_index_object_key(neighbour_index.fingerprint), Body = buffer.getvalue())
+            neighbour_index.modified = False
+        except Exception as e:
+            print('Neighbour index upload failed: {}'.format(e))
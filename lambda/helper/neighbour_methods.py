@@ -0,0 +1,186 @@
+'''Drop-in replacements of inner functions of ImbalancedLearningRegression
+that answer their neighbour searches from the shared neighbour index of
+helper/neighbour_index.py, with the results of the library.
+
+Supported: enn (under_sampling_enn) and tomeklinks (under_sampling_tomeklinks),
+of the library versions in INDEXED_LIBRARY_VERSIONS only. Any other version, or
+inner functions of other signatures, run the library unchanged.
+
+Unsupported: smote, adasyn and cnn, which search neighbours within the method
+bodies of the library, so there is no inner function to replace.
+'''
+import inspect
+import sys
+import numpy
+import pandas
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.preprocessing import MinMaxScaler
+from helper.neighbour_index import get_neighbour_index
+
+# ImbalancedLearningRegression tells feature types apart by these dtype names
+NUMERIC_DTYPES = ["int64", "float64"]
+NOMINAL_DTYPES = ["object", "bool", "datetime64"]
+
+# leave-one-out neighbour distances this close to each other count as a tie, which the index may break unlike the classifier
+ENN_DISTANCE_TIE_TOLERANCE = 1e-9
+
+# method module -> name of its inner function, whose neighbour search is answered by the shared neighbour index
+indexed_functions = {
+    'ImbalancedLearningRegression.enn': 'under_sampling_enn',
+    'ImbalancedLearningRegression.tomeklinks': 'under_sampling_tomeklinks'
+}
+# the versions of the library whose inner functions the replacements reproduce, and the signatures of those functions
+INDEXED_LIBRARY_VERSIONS = ('0.0.2',)
+INDEXED_FUNCTION_SIGNATURES = {
+    'under_sampling_enn': '(data, index, estimator, rare_indices)',
+    'under_sampling_tomeklinks': '(data, label, option, k=1)'
+}
+# the replaced inner functions, for the inputs the index does not cover
+original_functions = dict()
+
+# called once ImbalancedLearningRegression is imported, see the methods dict in resampling.py
+# the library is left as it is unless it is a version the replacements were written for
+def use_neighbour_index(module):
+    replacements = {
+        'under_sampling_enn': under_sampling_enn,
+        'under_sampling_tomeklinks': under_sampling_tomeklinks
+    }
+    if not is_indexed_library(module, replacements):
+        print('Not using the neighbour index: ImbalancedLearningRegression {} is not one of the versions {} with the inner functions {}'.format(
+            getattr(module, '__version__', None), INDEXED_LIBRARY_VERSIONS, INDEXED_FUNCTION_SIGNATURES))
+        return
+    for module_name, function_name in indexed_functions.items():
+        method_module = sys.modules[module_name]
+        if getattr(method_module, function_name) is not replacements[function_name]:
+            original_functions[function_name] = getattr(method_module, function_name)
+            setattr(method_module, function_name, replacements[function_name])
+
+def is_indexed_library(module, replacements):
+    if getattr(module, '__version__', None) not in INDEXED_LIBRARY_VERSIONS:
+        return False
+    for module_name, function_name in indexed_functions.items():
+        function = getattr(sys.modules.get(module_name), function_name, None)
+        if function is replacements[function_name]:
+            continue
+        if not callable(function) or str(inspect.signature(function)) != INDEXED_FUNCTION_SIGNATURES[function_name]:
+            return False
+    return True
+
+# only the default classifier of enn() is answered from the index: uniform votes of euclidean neighbours
+def is_indexed_estimator(estimator):
+    return type(estimator) is KNeighborsClassifier and estimator.weights == 'uniform' and estimator.metric == 'minkowski' and estimator.p == 2 and estimator.metric_params is None
+
+# drop-in replacement of ImbalancedLearningRegression's under_sampling_enn with the same result: rather than
+# fitting a scaler and a classifier on all other rows for every majority row, one index over the min-max scaled
+# features answers the leave-one-out neighbours of every row whose k nearest other rows are unambiguous
+def under_sampling_enn(data, index, estimator, rare_indices):
+    n = len(data)
+    d = len(data.columns)
+    if not is_indexed_estimator(estimator) or n < estimator.n_neighbors + 2:
+        return original_functions['under_sampling_enn'](data = data, index = index, estimator = estimator, rare_indices = rare_indices)
+    k = estimator.n_neighbors
+
+    # pre-processing, as in the original
+    feat_non_neg = [j for j in range(d) if data.iloc[:, j].dtype in NUMERIC_DTYPES and any(data.iloc[:, j] > 0)]
+    data_var = data.copy()
+    feat_list_nom = [j for j in range(d) if data.dtypes[j] in NOMINAL_DTYPES]
+    for j in feat_list_nom:
+        data.iloc[:, j] = pandas.Categorical(pandas.factorize(data.iloc[:, j])[0])
+    data = data.apply(pandas.to_numeric)
+    data_X = data.iloc[:, :(d - 1)].to_numpy(dtype = numpy.float64)
+    if numpy.isnan(data_X).any():
+        return original_functions['under_sampling_enn'](data = data_var, index = index, estimator = estimator, rare_indices = rare_indices)
+    class_y = numpy.isin(numpy.arange(n), rare_indices).astype(int)
+
+    # rows are edited exactly as in the original where the index may not give the same answer:
+    # leaving out a row changes the scaling if the row holds the sole minimum or maximum of a feature,
+    # and the classifier breaks ties at the k-th nearest other row, or between a row and its duplicates, its own way
+    exact = numpy.zeros(n, dtype = bool)
+    for column in data_X.T:
+        for bound in (column.min(), column.max()):
+            at_bound = column == bound
+            if numpy.count_nonzero(at_bound) == 1:
+                exact |= at_bound
+    _, inverse, counts = numpy.unique(data_X, axis = 0, return_inverse = True, return_counts = True)
+    exact |= counts[inverse.ravel()] > 1
+    neighbour_index = get_neighbour_index(MinMaxScaler().fit_transform(data_X), 'enn:minmax')
+    # the k + 1 nearest other rows of every row that is its own nearest, as every row without duplicates should be
+    distances, neighbours = neighbour_index.kneighbors(k + 2)
+    exact |= neighbours[:, 0] != numpy.arange(n)
+    distances, neighbours = distances[:, 1:], neighbours[:, 1:]
+    exact |= distances[:, k] <= distances[:, k - 1] * (1 + ENN_DISTANCE_TIE_TOLERANCE)
+
+    chosen_indices = list()
+    for i in index:
+        if exact[i]:
+            train_X = numpy.delete(data_X, i, axis = 0)
+            train_y = numpy.delete(class_y, i)
+            min_max_scaler = MinMaxScaler()
+            estimator.fit(min_max_scaler.fit_transform(train_X), train_y)
+            predict_y = estimator.predict(min_max_scaler.transform(data_X[i].reshape(1, -1)))[0]
+        else:
+            row_neighbours = neighbours[i][:k]
+            # ties go to the majority class, like the smallest-label mode of KNeighborsClassifier
+            predict_y = 1 if 2 * class_y[row_neighbours].sum() > k else 0
+        if predict_y == 0:
+            chosen_indices.append(i)
+
+    # post-processing, as in the original
+    data_new = pandas.DataFrame()
+    data_new = pandas.concat([data.iloc[chosen_indices], data_new], ignore_index = True)
+    for j in feat_list_nom:
+        code_list = data.iloc[:, j].unique()
+        cat_list = data_var.iloc[:, j].unique()
+        for x in code_list:
+            data_new.iloc[:, j] = data_new.iloc[:, j].replace(x, cat_list[x])
+    for j in feat_non_neg:
+        data_new.iloc[:, j] = data_new.iloc[:, j].clip(lower = 0)
+    return data_new
+
+# drop-in replacement of ImbalancedLearningRegression's under_sampling_tomeklinks with the same result on numeric
+# data without duplicate rows: the nearest neighbour of every row comes from the index instead of an n x n distance matrix
+def under_sampling_tomeklinks(data, label, option, k = 1):
+    n = len(data)
+    d = len(data.columns)
+    feat_const = data.columns[data.nunique() == 1]
+    data_var = data.drop(data.columns[feat_const], axis = 1)
+    # nominal features use the heom and overlap distances of the original
+    if n < 3 or len(data_var.columns) == 0 or any(dtype in NOMINAL_DTYPES for dtype in data_var.dtypes):
+        return original_functions['under_sampling_tomeklinks'](data = data, label = label, option = option, k = k)
+    values = data_var.apply(pandas.to_numeric).to_numpy(dtype = numpy.float64)
+    # the original breaks distance ties by sort order, which only an identical distance matrix reproduces
+    if numpy.isnan(values).any() or len(numpy.unique(values, axis = 0)) < n:
+        return original_functions['under_sampling_tomeklinks'](data = data, label = label, option = option, k = k)
+
+    feat_non_neg = [j for j in range(d) if data.iloc[:, j].dtype in NUMERIC_DTYPES and any(data.iloc[:, j] > 0)]
+    neighbour_index = get_neighbour_index(values, 'tomeklinks:euclidean')
+    _, neighbours = neighbour_index.kneighbors(2)
+    nearest = neighbours[:, 1]
+
+    # a tomek link is a pair of mutual nearest neighbours with different labels
+    label = numpy.asarray(label)
+    linked = (nearest[nearest] == numpy.arange(n)) & (label != label[nearest])
+    tomeklink_majority = numpy.flatnonzero(linked & (label == -1))
+    tomeklink_minority = numpy.flatnonzero(linked & (label != -1))
+    remove_index = []
+    if option == "majority" or option == "not_minority":
+        remove_index = tomeklink_majority
+    if option == "minority" or option == "not_majority":
+        remove_index = tomeklink_minority
+    if option == "both" or option == "all":
+        remove_index = numpy.concatenate([tomeklink_majority, tomeklink_minority])
+    new_index = numpy.setxor1d(numpy.arange(n), remove_index)
+
+    # post-processing, as in the original
+    data_new = pandas.DataFrame(values[new_index])
+    if len(feat_const) > 0:
+        data_new.columns = list(data_var.columns.values)
+        for j in range(len(feat_const)):
+            data_new.insert(
+                loc = int(feat_const[j]),
+                column = feat_const[j],
+                value = numpy.repeat(data.iloc[0, feat_const[j]], len(new_index))
+            )
+    for j in feat_non_neg:
+        data_new.iloc[:, j] = data_new.iloc[:, j].clip(lower = 0)
+    return data_new
@@ -0,0 +1,97 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+
+# set in the worker processes, so that work done there does not start workers of its own
+in_worker_process = False
+# set while a stage of a profiled job runs, so that its work stays in the profiled process, see helper/job_profiler.py
+in_profiled_stage = False
+
+# number of processes the resampling function may use, 1 (the default) runs everything sequentially
+# 'auto' uses every CPU, at 3008 MB a Lambda function has 2 vCPUs
+def get_worker_count():
+    if in_worker_process or in_profiled_stage:
+        return 1
+    worker_count = os.environ.get('resamplingWorkerCount', '1').strip().lower()
+    if worker_count == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(worker_count))
+    except ValueError:
+        raise Exception('Invalid resampling worker count {}! Should be a positive integer or auto!'.format(worker_count))
+
+# run every (function, arguments) task in a forked process, at most worker_count at a time, and return the results in task order
+# note: multiprocessing.Pool and concurrent.futures.ProcessPoolExecutor need /dev/shm, which Lambda does not provide,
+# so every task gets its own process and sends its result back through a pipe
+def run_in_processes(tasks, worker_count, initializer = None):
+    if worker_count <= 1 or len(tasks) <= 1:
+        return [function(*arguments) for function, arguments in tasks]
+    context = multiprocessing.get_context('fork')
+    results = [None] * len(tasks)
+    pending = list(enumerate(tasks))
+    running = dict()
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0 and len(running) < worker_count:
+                index, (function, arguments) = pending.pop(0)
+                receiver, sender = context.Pipe(duplex = False)
+                process = context.Process(target = run_in_worker_process, args = (sender, initializer, function, arguments), daemon = True)
+                process.start()
+                sender.close()
+                running[receiver] = (process, index)
+            for receiver in multiprocessing.connection.wait(list(running)):
+                process, index = running.pop(receiver)
+                try:
+                    succeeded, result = receiver.recv()
+                except EOFError:
+                    process.join()
+                    succeeded, result = False, 'Worker process exited with code {}!'.format(process.exitcode)
+                receiver.close()
+                process.join()
+                if not succeeded:
+                    raise Exception(result)
+                results[index] = result
+    finally:
+        for receiver, (process, index) in running.items():
+            process.terminate()
+            receiver.close()
+    return results
+
+def run_in_worker_process(sender, initializer, function, arguments):
+    global in_worker_process
+    in_worker_process = True
+    # forked processes inherit the state of numpy's global random generator, which the resampling methods draw from
+    # numpy is imported here rather than with this module, which the resampling function imports at cold start
+    import numpy
+    numpy.random.seed()
+    try:
+        if initializer != None:
+            initializer()
+        sender.send((True, function(*arguments)))
+    except Exception as e:
+        sender.send((False, str(e)))
+    finally:
+        sender.close()
+
+# run function(*arguments) on a background thread when stages may overlap, otherwise right away,
+# either way the result (or the exception) comes from .result() of the returned future
+# note: threads are only for stages that wait on the network or release the GIL, and must be done before forking workers
+def start_stage(overlap, function, *arguments):
+    if overlap:
+        executor = ThreadPoolExecutor(max_workers = 1)
+        future = executor.submit(function, *arguments)
+        executor.shutdown(wait = False)
+        return future
+    future = Future()
+    try:
+        future.set_result(function(*arguments))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+# split range(size) into at most chunk_count contiguous (start, stop) ranges of nearly equal length
+def split_range(size, chunk_count):
+    chunk_count = max(1, min(chunk_count, size))
+    bounds = [size * index // chunk_count for index in range(chunk_count + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,54 @@
+import numpy
+import pandas
+from ImbalancedLearningRegression.phi import phi
+from ImbalancedLearningRegression.phi_ctrl_pts import phi_ctrl_pts
+from helper.parallel import run_in_processes
+
+# a method is only partitioned when every worker gets at least this many rows
+PARTITION_MINIMUM_ROWS_PER_WORKER = 5000
+# and every relevance bump at least this many rows per worker
+PARTITION_MINIMUM_BUMP_ROWS_PER_WORKER = 10
+
+# ro, ru and gn resample every relevance bump on its own, from its own rows only, so rows dealt out to the workers
+# in order of the target keep the share of every bump, and the union of the resampled chunks is a sample of the
+# same distribution as a sequential run; the relevance function is fixed on the whole data beforehand
+def resample_partitioned(method_function, data, y, method_parameters, worker_count):
+    method_parameters = dict(method_parameters)
+    chunk_positions = plan_partitions(data, y, method_parameters, worker_count)
+    if chunk_positions is None:
+        return method_function(data = data.copy(deep = False), y = y, **method_parameters)
+    print('Resampling {} rows in {} partitions'.format(len(data), len(chunk_positions)))
+    resampled_chunks = run_in_processes([(resample_partition, (method_function, data, y, method_parameters, positions)) for positions in chunk_positions], worker_count)
+    return pandas.concat(resampled_chunks, ignore_index = True)
+
+def resample_partition(method_function, data, y, method_parameters, positions):
+    # the methods expect a range index
+    return method_function(data = data.iloc[positions].reset_index(drop = True), y = y, **method_parameters)
+
+# row positions of every partition, or None when the data should be resampled in one piece
+# note: fixes the relevance control points in method_parameters, so that every partition uses the same relevance function
+def plan_partitions(data, y, method_parameters, worker_count):
+    return plan_target_partitions(data, y, method_parameters, min(worker_count, len(data) // PARTITION_MINIMUM_ROWS_PER_WORKER), PARTITION_MINIMUM_BUMP_ROWS_PER_WORKER)
+
+# row positions of chunk_count partitions dealt out in order of the target, where every relevance bump has at least
+# minimum_bump_rows rows per partition, or None when the data cannot be partitioned so, see plan_partitions()
+def plan_target_partitions(data, y, method_parameters, chunk_count, minimum_bump_rows):
+    # rows and columns with missing values are dropped per partition, which could leave the partitions with different columns
+    if chunk_count < 2 or data.isna().to_numpy().any():
+        return None
+    y_sort = data[y].sort_values()
+    if method_parameters.get('rel_method', 'auto') == 'auto':
+        phi_params = phi_ctrl_pts(y = y_sort, method = 'auto', xtrm_type = method_parameters.get('rel_xtrm_type', 'both'), coef = method_parameters.get('rel_coef', 1.5))
+        method_parameters['rel_method'] = 'manual'
+        method_parameters['rel_ctrl_pts_rg'] = numpy.reshape(phi_params['ctrl_pts'], (-1, 3)).tolist()
+    else:
+        phi_params = phi_ctrl_pts(y = y_sort, method = 'manual', ctrl_pts = method_parameters.get('rel_ctrl_pts_rg'))
+    rare = numpy.asarray(phi(y = y_sort, ctrl_pts = phi_params)) >= method_parameters.get('rel_thres', 0.5)
+    # a data set with a single bump fails in the method itself
+    if rare.all() or not rare.any():
+        return None
+    bumps = numpy.concatenate([[0], numpy.flatnonzero(rare[1:] != rare[:-1]) + 1, [len(rare)]])
+    if numpy.diff(bumps).min() < minimum_bump_rows * chunk_count:
+        return None
+    order = numpy.argsort(data[y].to_numpy(), kind = 'stable')
+    return [numpy.sort(order[chunk::chunk_count]) for chunk in range(chunk_count)]
@@ -0,0 +1,60 @@
+import hashlib
+import json
+from helper.datetime_converter import get_current_timestamp
+
+# result cache fields: { cacheKey, s3ResampledDataBucketName, s3ResampledDataObjectKey, chartDataPoints, sourceRequestId, recordCreationTime, recordExpirationTime }
+# entries expire together with the record that produced them, just like the resampled object in S3
+
+# cached objects are copied for the new request, so an entry needs to outlive the copy by a small margin
+RESULT_CACHE_MINIMUM_REMAINING_SECONDS = 300
+
+# the raw object is identified by its S3 ETag and size: presigned PUT uploads are single-part,
+# so the ETag is the MD5 digest of the content with S3-managed encryption
+# the execution mode and the Content-Encoding of the resampled data are part of the key only when they are not the default,
+# so that the keys of earlier results stay the same
+def compute_result_cache_key(raw_data_etag, raw_data_size, method, y, method_parameters, chart_data_size, resampled_data_format, execution_mode = 'exact', resampled_data_content_encoding = None):
+    key_fields = {
+        'rawDataETag': raw_data_etag.strip('"'),
+        'rawDataSize': int(raw_data_size),
+        'method': method,
+        'y': y,
+        'methodParameters': method_parameters or {},
+        'chartDataSize': int(chart_data_size),
+        'resampledDataFormat': resampled_data_format
+    }
+    if execution_mode != 'exact':
+        key_fields['executionMode'] = execution_mode
+    if resampled_data_content_encoding != None:
+        key_fields['resampledDataContentEncoding'] = resampled_data_content_encoding
+    key_material = json.dumps(key_fields, sort_keys = True, default = str)
+    return hashlib.sha256(key_material.encode('utf-8')).hexdigest()
+
+def get_cached_result(result_cache_table, cache_key):
+    if result_cache_table is None:
+        return None
+    # the cache is an optimization only, so a failing lookup is a miss
+    try:
+        item = result_cache_table.get_item(Key = {'cacheKey': cache_key}).get('Item')
+    except Exception as e:
+        print('Result cache lookup failed: {}'.format(e))
+        return None
+    # dynamodb deletes expired items lazily, so check the expiration time here as well
+    if item is None or int(item['recordExpirationTime']) - get_current_timestamp('int') < RESULT_CACHE_MINIMUM_REMAINING_SECONDS:
+        return None
+    return item
+
+def put_cached_result(result_cache_table, cache_key, s3_resampled_data_bucket_name, s3_resampled_data_object_key, chart_data_points, source_request_id, record_expiration_time):
+    if result_cache_table is None:
+        return
+    try:
+        result_cache_table.put_item(Item = {
+            'cacheKey': cache_key,
+            's3ResampledDataBucketName': s3_resampled_data_bucket_name,
+            's3ResampledDataObjectKey': s3_resampled_data_object_key,
+            'chartDataPoints': chart_data_points,
+            'sourceRequestId': source_request_id,
+            'recordCreationTime': get_current_timestamp('int'),
+            'recordExpirationTime': int(record_expiration_time)
+        }, ReturnValues = 'NONE')
+    except Exception as e:
+        print('Result cache insertion failed: {}'.format(e))
@@ -1,26 +1,56 @@
-import boto3 
-from mimetypes import guess_type
+import time
+from collections import OrderedDict
+from helper.file_format import get_content_type
+from helper.aws_clients import lazy_client
 
 # Create S3 client
-s3_client = boto3.client('s3')
+s3_client = lazy_client('s3')
 
-def generate_presigned_url(bucket_name, object_key, file_name, client_method="get", expires_in=3600):
-    content_type = guess_type(file_name)[0]
-    if type(content_type) != str:
-        content_type = "application/octet-stream"
+# signed get urls are reused while they are valid for at least this many more seconds
+PRESIGNED_URL_CACHE_MINIMUM_REMAINING_SECONDS = 300
+# and for at most this many seconds after signing, well within the lifetime of the function's temporary credentials
+PRESIGNED_URL_CACHE_MAXIMUM_AGE_SECONDS = 900
+PRESIGNED_URL_CACHE_SIZE = 1024
+
+# (bucket name, object key) -> (url, signing time, expiration time), least recently used first
+presigned_urls = OrderedDict()
+
+# content_encoding: the Content-Encoding a put has to send, for compressed uploads
+def generate_presigned_url(bucket_name, object_key, file_name, client_method="get", expires_in=3600, content_encoding=None):
+    content_type = get_content_type(file_name)
     if client_method == "post":
         return generate_presigned_post(bucket_name, object_key, expires_in)
     elif client_method == "put":
+        params = {"Bucket": bucket_name, "Key": object_key, "ContentType": content_type}
+        if content_encoding != None:
+            params["ContentEncoding"] = content_encoding
         return s3_client.generate_presigned_url(
-            ClientMethod="put_object", Params={"Bucket": bucket_name, "Key": object_key, "ContentType": content_type}, ExpiresIn=expires_in
+            ClientMethod="put_object", Params=params, ExpiresIn=expires_in
         )
     elif client_method == "get":
-        return s3_client.generate_presigned_url(
-            ClientMethod="get_object", Params={"Bucket": bucket_name, "Key": object_key}, ExpiresIn=expires_in
-        )
+        return get_cached_presigned_url(bucket_name, object_key, expires_in)
     else:
         raise Exception("Unexpected input client_method: {}, in generate_presigned_url() in s3_presigned_url.py!".format(client_method))
 
+# a cached url is only reused if it expires no later than a new one would, so the expiry stays capped by expires_in
+def get_cached_presigned_url(bucket_name, object_key, expires_in):
+    now = time.time()
+    cached = presigned_urls.get((bucket_name, object_key))
+    if cached != None:
+        url, signing_time, expiration_time = cached
+        # expires_in is computed from whole seconds, hence the second of slack
+        if now - signing_time <= PRESIGNED_URL_CACHE_MAXIMUM_AGE_SECONDS and PRESIGNED_URL_CACHE_MINIMUM_REMAINING_SECONDS <= expiration_time - now <= expires_in + 1:
+            presigned_urls.move_to_end((bucket_name, object_key))
+            return url
+    url = s3_client.generate_presigned_url(
+        ClientMethod="get_object", Params={"Bucket": bucket_name, "Key": object_key}, ExpiresIn=expires_in
+    )
+    presigned_urls[(bucket_name, object_key)] = (url, now, now + expires_in)
+    presigned_urls.move_to_end((bucket_name, object_key))
+    while len(presigned_urls) > PRESIGNED_URL_CACHE_SIZE:
+        presigned_urls.popitem(last = False)
+    return url
+
 def generate_presigned_post(bucket_name, object_key, expires_in=3600):
     dict = s3_client.generate_presigned_post(
             Bucket=bucket_name, Key=object_key, ExpiresIn=expires_in
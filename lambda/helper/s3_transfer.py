@@ -0,0 +1,184 @@
+import collections
+import io
+import math
+import threading
+import time
+
+MEBIBYTE = 1024 * 1024
+# objects up to this size are transferred in one request
+S3_TRANSFER_MULTIPART_THRESHOLD_BYTES = 16 * MEBIBYTE
+# parts are at least this large, and large enough for the object to fit in the 10000 parts S3 allows
+S3_TRANSFER_MINIMUM_PART_SIZE_BYTES = 8 * MEBIBYTE
+S3_MAXIMUM_PART_COUNT = 10000
+# parts transferred at once, within the pooled connections of helper/aws_clients.py
+S3_TRANSFER_MAXIMUM_CONCURRENCY = 16
+# a written stream is cut into chunks of this size before it is handed to the upload
+PIPE_CHUNK_SIZE_BYTES = MEBIBYTE
+
+# the part size and concurrency for an object of size_bytes: one part per thread for objects of a few parts, at most S3_TRANSFER_MAXIMUM_CONCURRENCY
+def get_transfer_config(size_bytes):
+    # boto3 is imported with the first transfer, as with the first client in helper/aws_clients.py
+    from boto3.s3.transfer import TransferConfig
+    part_size = max(S3_TRANSFER_MINIMUM_PART_SIZE_BYTES, math.ceil(size_bytes / S3_MAXIMUM_PART_COUNT / MEBIBYTE) * MEBIBYTE)
+    return TransferConfig(
+        multipart_threshold = S3_TRANSFER_MULTIPART_THRESHOLD_BYTES,
+        multipart_chunksize = part_size,
+        max_concurrency = max(1, min(S3_TRANSFER_MAXIMUM_CONCURRENCY, math.ceil(size_bytes / part_size)))
+    )
+
+class Pipe:
+    '''A bounded pipe between a writer thread and a reader thread: writer
+    is a writable file object whose writes block while max_buffered_bytes
+    are waiting to be read, and reader a readable one that ends when the
+    writer is closed, or raises the error the writer was closed with.
+    '''
+
+    def __init__(self, max_buffered_bytes):
+        self.max_buffered_bytes = max_buffered_bytes
+        self.condition = threading.Condition()
+        self.chunks = collections.deque()
+        self.buffered_bytes = 0
+        self.written_bytes = 0
+        self.write_closed = False
+        self.read_closed = False
+        self.error = None
+        self.writer = PipeWriter(self)
+        self.reader = PipeReader(self)
+
+    def put(self, chunk):
+        with self.condition:
+            while self.buffered_bytes >= self.max_buffered_bytes and not self.read_closed:
+                self.condition.wait()
+            if self.read_closed:
+                raise Exception('The upload of the written data has ended!')
+            self.chunks.append(chunk)
+            self.buffered_bytes += len(chunk)
+            self.condition.notify_all()
+
+    def get(self, size):
+        with self.condition:
+            while len(self.chunks) == 0 and not self.write_closed:
+                self.condition.wait()
+            if self.error != None:
+                raise self.error
+            if len(self.chunks) == 0:
+                return b''
+            chunk = self.chunks.popleft()
+            if len(chunk) > size:
+                self.chunks.appendleft(chunk[size:])
+                chunk = chunk[:size]
+            self.buffered_bytes -= len(chunk)
+            self.condition.notify_all()
+            return chunk
+
+    def close_writer(self, error = None):
+        with self.condition:
+            self.write_closed = True
+            self.error = error
+            self.condition.notify_all()
+
+    def close_reader(self):
+        with self.condition:
+            self.read_closed = True
+            self.condition.notify_all()
+
+class PipeWriter(io.RawIOBase):
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.pending = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pending += data
+        if len(self.pending) >= PIPE_CHUNK_SIZE_BYTES:
+            self.pipe.put(bytes(self.pending))
+            self.pending = bytearray()
+        self.pipe.written_bytes += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pipe.written_bytes
+
+    def flush(self):
+        if len(self.pending) > 0 and not self.closed:
+            self.pipe.put(bytes(self.pending))
+            self.pending = bytearray()
+
+    # the end of the stream, which writers such as pyarrow's may close themselves
+    def close(self):
+        if not self.closed:
+            self.flush()
+            self.pipe.close_writer()
+        super().close()
+
+class PipeReader(io.RawIOBase):
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    def readable(self):
+        return True
+
+    # the upload takes a short read for the end of the stream, so reads wait until the buffer is full
+    def readinto(self, buffer):
+        size = 0
+        while size < len(buffer):
+            chunk = self.pipe.get(len(buffer) - size)
+            if len(chunk) == 0:
+                break
+            buffer[size : size + len(chunk)] = chunk
+            size += len(chunk)
+        return size
+
+# uploads what write(file) writes to bucket/key while it is written, through a multipart upload for large data, without a file on disk
+# estimated_size_bytes sizes the parts, since the size is only known at the end
+# returns { bytes, durationMs, throughputMbPerSecond }
+def upload_written_object(s3_client, bucket, key, write, estimated_size_bytes, extra_args = None):
+    config = get_transfer_config(estimated_size_bytes)
+    # the upload reads ahead a part per thread itself, the pipe only keeps it from waiting on the writer
+    pipe = Pipe(2 * config.multipart_chunksize)
+    upload_errors = list()
+    def upload():
+        try:
+            s3_client.upload_fileobj(pipe.reader, bucket, key, ExtraArgs = extra_args, Config = config)
+        except Exception as e:
+            upload_errors.append(e)
+        finally:
+            # a writer still waiting fails instead of blocking forever
+            pipe.close_reader()
+    start_time = time.perf_counter()
+    upload_thread = threading.Thread(target = upload, daemon = True)
+    upload_thread.start()
+    try:
+        write(pipe.writer)
+        pipe.writer.close()
+    except Exception as e:
+        # a write fails once the upload has failed, otherwise the upload reads the error of the write and aborts
+        upload_failed_first = pipe.read_closed
+        pipe.close_writer(e)
+        upload_thread.join()
+        if upload_failed_first and len(upload_errors) > 0:
+            raise upload_errors[0]
+        raise e
+    upload_thread.join()
+    if len(upload_errors) > 0:
+        raise upload_errors[0]
+    return get_transfer_summary(pipe.written_bytes, time.perf_counter() - start_time)
+
+# downloads bucket/key of size_bytes into memory, in parts on several threads for large objects
+# returns (file object at the start of the data, { bytes, durationMs, throughputMbPerSecond })
+def download_object(s3_client, bucket, key, size_bytes):
+    start_time = time.perf_counter()
+    buffer = io.BytesIO()
+    s3_client.download_fileobj(bucket, key, buffer, Config = get_transfer_config(size_bytes))
+    transfer = get_transfer_summary(buffer.getbuffer().nbytes, time.perf_counter() - start_time)
+    buffer.seek(0)
+    return buffer, transfer
+
+def get_transfer_summary(size_bytes, seconds):
+    return {
+        'bytes': size_bytes,
+        'durationMs': round(seconds * 1000, 1),
+        'throughputMbPerSecond': round(size_bytes / MEBIBYTE / seconds, 1) if seconds > 0 else None
+    }
@@ -1,10 +1,10 @@
-import boto3 
 import os
 import json
 from helper.datetime_converter import timestamp_to_string
+from helper.aws_clients import lazy_client
 
 # Create SNS client
-sns_client = boto3.client('sns')
+sns_client = lazy_client('sns')
 
 resampling_method_names = {
     'ro': 'Random Oversampling',
@@ -17,6 +17,10 @@ resampling_method_names = {
     'enn': 'Edited Nearest Neighbor'
 }
 
+# method is a key of resampling_method_names, or several of them separated by commas for batch requests
+def get_resampling_method_name(method):
+    return ', '.join(resampling_method_names[method_key.strip()] for method_key in method.split(','))
+
 def subscribe_sns_email(email):
     task_status_sns_topic_subscription_response = sns_client.subscribe(
       TopicArn=os.environ['taskStatusSnsTopicArn'],
@@ -30,17 +34,17 @@ def subscribe_sns_email(email):
     )
     return task_status_sns_topic_subscription_response['SubscriptionArn']
 
-def send_on_resample_start_email(topic_arn, request_id, email, method, y, fileName, record_creation_time):
-    sns_message = prepare_on_resample_start_sns_message(request_id, method, y, fileName, record_creation_time)
-    on_resample_start_sns_publish_response = sns_client.publish(
-        TopicArn=topic_arn,
-        Message=json.dumps({
+# the message goes to the subscription of email only, see the filter policy of subscribe_sns_email()
+def prepare_sns_publish(topic_arn, request_id, email, subject, sns_message):
+    return {
+        'TopicArn': topic_arn,
+        'Message': json.dumps({
             'default': sns_message,
             "email": sns_message
         }),
-        Subject='ImbalancedLearningRegression - Demo: Resampling Started!',
-        MessageStructure='json',
-        MessageAttributes={
+        'Subject': subject,
+        'MessageStructure': 'json',
+        'MessageAttributes': {
             'requestId': {
                 'DataType': 'String',
                 'StringValue': request_id
@@ -50,8 +54,14 @@ def send_on_resample_start_email(topic_arn, request_id, email, method, y, fileNa
                 'StringValue': email
             }
         }
-    )
-    return on_resample_start_sns_publish_response['MessageId']
+    }
+
+def send_on_resample_start_email(topic_arn, request_id, email, method, y, fileName, record_creation_time):
+    return sns_client.publish(**prepare_on_resample_start_sns_publish(topic_arn, request_id, email, method, y, fileName, record_creation_time))['MessageId']
+
+# the arguments of sns_client.publish, which helper/sns_outbox.py publishes in batches instead
+def prepare_on_resample_start_sns_publish(topic_arn, request_id, email, method, y, fileName, record_creation_time):
+    return prepare_sns_publish(topic_arn, request_id, email, 'ImbalancedLearningRegression - Demo: Resampling Started!', prepare_on_resample_start_sns_message(request_id, method, y, fileName, record_creation_time))
 
 def prepare_on_resample_start_sns_message(request_id, method, y, fileName, record_creation_time):
     sns_message = '''
@@ -64,33 +74,16 @@ def prepare_on_resample_start_sns_message(request_id, method, y, fileName, recor
         fileName, 
         y, 
         request_id, 
-        resampling_method_names[method], 
+        get_resampling_method_name(method), 
         timestamp_to_string(record_creation_time)
     )
     return sns_message
 
 def send_on_resample_complete_email(topic_arn, request_id, email, method, y, fileName, record_creation_time, record_expiration_time, resampling_start_time, resampling_end_time, get_raw_data_url, get_resampled_data_url):
-    sns_message = prepare_on_resample_complete_sns_message(request_id, method, y, fileName, record_creation_time, record_expiration_time, resampling_start_time, resampling_end_time, get_raw_data_url, get_resampled_data_url)
-    on_resample_complete_sns_publish_response = sns_client.publish(
-        TopicArn=topic_arn,
-        Message=json.dumps({
-            'default': sns_message,
-            "email": sns_message
-        }),
-        Subject='ImbalancedLearningRegression - Demo: Resampling Completed!',
-        MessageStructure='json',
-        MessageAttributes={
-            'requestId': {
-                'DataType': 'String',
-                'StringValue': request_id
-            },
-            'email': {
-                'DataType': 'String',
-                'StringValue': email
-            }
-        }
-    )
-    return on_resample_complete_sns_publish_response['MessageId']
+    return sns_client.publish(**prepare_on_resample_complete_sns_publish(topic_arn, request_id, email, method, y, fileName, record_creation_time, record_expiration_time, resampling_start_time, resampling_end_time, get_raw_data_url, get_resampled_data_url))['MessageId']
+
+def prepare_on_resample_complete_sns_publish(topic_arn, request_id, email, method, y, fileName, record_creation_time, record_expiration_time, resampling_start_time, resampling_end_time, get_raw_data_url, get_resampled_data_url):
+    return prepare_sns_publish(topic_arn, request_id, email, 'ImbalancedLearningRegression - Demo: Resampling Completed!', prepare_on_resample_complete_sns_message(request_id, method, y, fileName, record_creation_time, record_expiration_time, resampling_start_time, resampling_end_time, get_raw_data_url, get_resampled_data_url))
 
 def prepare_on_resample_complete_sns_message(request_id, method, y, fileName, record_creation_time, record_expiration_time, resampling_start_time, resampling_end_time, get_raw_data_url, get_resampled_data_url):
     sns_message = '''
@@ -112,7 +105,7 @@ def prepare_on_resample_complete_sns_message(request_id, method, y, fileName, re
         fileName, 
         y, 
         request_id, 
-        resampling_method_names[method], 
+        get_resampling_method_name(method), 
         timestamp_to_string(record_creation_time), 
         timestamp_to_string(resampling_end_time), 
         str(resampling_end_time - resampling_start_time), 
@@ -123,27 +116,10 @@ def prepare_on_resample_complete_sns_message(request_id, method, y, fileName, re
     return sns_message
 
 def send_on_resample_fail_email(topic_arn, request_id, email, method, y, fileName, record_creation_time, error_message):
-    sns_message = prepare_on_resample_fail_sns_message(request_id, method, y, fileName, record_creation_time, error_message)
-    on_resample_fail_sns_publish_response = sns_client.publish(
-        TopicArn=topic_arn,
-        Message=json.dumps({
-            'default': sns_message,
-            "email": sns_message
-        }),
-        Subject='ImbalancedLearningRegression - Demo: Resampling Failed!',
-        MessageStructure='json',
-        MessageAttributes={
-            'requestId': {
-                'DataType': 'String',
-                'StringValue': request_id
-            },
-            'email': {
-                'DataType': 'String',
-                'StringValue': email
-            }
-        }
-    )
-    return on_resample_fail_sns_publish_response['MessageId']
+    return sns_client.publish(**prepare_on_resample_fail_sns_publish(topic_arn, request_id, email, method, y, fileName, record_creation_time, error_message))['MessageId']
+
+def prepare_on_resample_fail_sns_publish(topic_arn, request_id, email, method, y, fileName, record_creation_time, error_message):
+    return prepare_sns_publish(topic_arn, request_id, email, 'ImbalancedLearningRegression - Demo: Resampling Failed!', prepare_on_resample_fail_sns_message(request_id, method, y, fileName, record_creation_time, error_message))
 
 def prepare_on_resample_fail_sns_message(request_id, method, y, fileName, record_creation_time, error_message):
     sns_message = '''
@@ -159,7 +135,7 @@ def prepare_on_resample_fail_sns_message(request_id, method, y, fileName, record
         fileName, 
         y, 
         request_id, 
-        resampling_method_names[method], 
+        get_resampling_method_name(method), 
         timestamp_to_string(record_creation_time),
         error_message
     )
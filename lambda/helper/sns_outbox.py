@@ -0,0 +1,169 @@
+import threading
+import time
+import uuid
+from helper import sns
+from helper.lazy_import import lazy_function
+
+# the condition builders import boto3, which the small jobs otherwise import with their first client
+Attr = lazy_function('boto3.dynamodb.conditions', 'Attr')
+
+# PublishBatch takes at most this many messages per call
+SNS_PUBLISH_BATCH_MAXIMUM_ENTRIES = 10
+# a notification is published at most this many times, the retries wait twice as long as the one before, starting with the base delay
+SNS_OUTBOX_MAXIMUM_ATTEMPTS = 5
+SNS_OUTBOX_RETRY_BASE_DELAY_SECONDS = 0.2
+# a job waits at most this long for its notifications when it ends
+SNS_OUTBOX_FLUSH_TIMEOUT_SECONDS = 10
+# a dispatch of the saved outboxes, see dispatch_saved_sns_outboxes(), publishes those of at most this many records
+SNS_OUTBOX_DISPATCH_MAXIMUM_REQUESTS = 100
+
+class SnsOutbox:
+    '''The notifications of one job. add() records a notification and
+    returns at once: a background thread publishes the recorded ones with
+    PublishBatch and retries those that fail, so that the job only waits on
+    SNS in flush(), after its result has been recorded.
+    '''
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.condition = threading.Condition()
+        self.pending = list()
+        self.undelivered = list()
+        # db field -> message id of the published notifications
+        self.message_ids = dict()
+        self.thread = None
+
+    # field: the db field of the message id, publish_arguments: see prepare_sns_publish() of helper/sns.py
+    def add(self, field, publish_arguments):
+        with self.condition:
+            self.pending.append({'id': uuid.uuid4().hex, 'field': field, 'publishArguments': publish_arguments, 'attempts': 0, 'notBefore': 0})
+            if self.thread is None:
+                self.thread = threading.Thread(target = self.dispatch, daemon = True)
+                self.thread.start()
+            self.condition.notify_all()
+
+    def dispatch(self):
+        while True:
+            with self.condition:
+                while True:
+                    if len(self.pending) == 0:
+                        self.thread = None
+                        self.condition.notify_all()
+                        return
+                    now = time.monotonic()
+                    ready = [event for event in self.pending if event['notBefore'] <= now]
+                    if len(ready) > 0:
+                        break
+                    self.condition.wait(min(event['notBefore'] for event in self.pending) - now)
+                self.pending = [event for event in self.pending if event['notBefore'] > now]
+            results = publish_events(ready)
+            with self.condition:
+                for event in ready:
+                    message_id, retryable = results[event['id']]
+                    event['attempts'] += 1
+                    if message_id != None:
+                        self.message_ids[event['field']] = message_id
+                    elif retryable and event['attempts'] < SNS_OUTBOX_MAXIMUM_ATTEMPTS:
+                        event['notBefore'] = time.monotonic() + SNS_OUTBOX_RETRY_BASE_DELAY_SECONDS * 2 ** (event['attempts'] - 1)
+                        self.pending.append(event)
+                    else:
+                        print('Could not publish {} of request {} after {} attempt(s)'.format(event['field'], self.request_id, event['attempts']))
+                        event['retryable'] = retryable
+                        self.undelivered.append(event)
+
+    # waits until every notification is published or given up, returns whether all were published
+    def flush(self, timeout = SNS_OUTBOX_FLUSH_TIMEOUT_SECONDS):
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            while self.thread != None and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+            return self.thread is None and len(self.undelivered) == 0
+
+    # the notifications that were given up, or are still retried, but not those that failed for a fault of the sender, which fail again
+    def get_undelivered_events(self):
+        with self.condition:
+            return [{'field': event['field'], 'publishArguments': event['publishArguments']} for event in self.undelivered + self.pending if event.get('retryable', True)]
+
+# returns { event id: (message id or None, whether a failure may succeed when retried) }
+def publish_events(events):
+    results = dict()
+    topics = dict()
+    for event in events:
+        topics.setdefault(event['publishArguments']['TopicArn'], list()).append(event)
+    for topic_arn, topic_events in topics.items():
+        for start in range(0, len(topic_events), SNS_PUBLISH_BATCH_MAXIMUM_ENTRIES):
+            batch_events = topic_events[start : start + SNS_PUBLISH_BATCH_MAXIMUM_ENTRIES]
+            try:
+                response = sns.sns_client.publish_batch(
+                    TopicArn=topic_arn,
+                    PublishBatchRequestEntries=[
+                        dict({key: value for key, value in event['publishArguments'].items() if key != 'TopicArn'}, Id = event['id']) for event in batch_events
+                    ]
+                )
+            except Exception as e:
+                print(e)
+                response = {'Successful': [], 'Failed': [{'Id': event['id'], 'SenderFault': False} for event in batch_events]}
+            for entry in response.get('Successful', []):
+                results[entry['Id']] = (entry['MessageId'], False)
+            # faults of the sender, such as an invalid message, fail again
+            for entry in response.get('Failed', []):
+                results[entry['Id']] = (None, not entry.get('SenderFault', False))
+    return results
+
+# db updates: { onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, notificationOutbox, recordVersion }
+# notificationOutbox: [{ field, publishArguments }, ...], the notifications that could not be published, see dispatch_saved_sns_outboxes()
+# the outbox of a record is always written when it was saved before, to empty it even when none of its notifications is published
+def save_sns_outbox(metadata_table, outbox, timeout = SNS_OUTBOX_FLUSH_TIMEOUT_SECONDS, saved = False):
+    outbox.flush(timeout)
+    with outbox.condition:
+        message_ids = dict(outbox.message_ids)
+    undelivered_events = outbox.get_undelivered_events()
+    if len(message_ids) == 0 and len(undelivered_events) == 0 and not saved:
+        return
+    expression_attribute_names = {'#NO': 'notificationOutbox', '#RV': 'recordVersion'}
+    expression_attribute_values = {':no': {'L': undelivered_events}, ':rv': 1}
+    update_expressions = ['#NO = :no']
+    for index, (field, message_id) in enumerate(message_ids.items()):
+        expression_attribute_names['#F{}'.format(index)] = field
+        expression_attribute_values[':f{}'.format(index)] = {'S': message_id}
+        update_expressions.append('#F{0} = :f{0}'.format(index))
+    metadata_table.update_item(
+        ExpressionAttributeNames=expression_attribute_names,
+        ExpressionAttributeValues=expression_attribute_values,
+        Key={ 'requestId': outbox.request_id },
+        ReturnValues='NONE',
+        UpdateExpression='SET {} ADD #RV :rv'.format(', '.join(update_expressions))
+    )
+
+# publishes the notifications a job could not, when the resampling function is invoked with { notificationOutbox: { requestId } }
+def dispatch_saved_sns_outbox(metadata_table, request_id, timeout = SNS_OUTBOX_FLUSH_TIMEOUT_SECONDS):
+    item = metadata_table.get_item(
+        Key={ 'requestId': request_id },
+        ProjectionExpression='#NO',
+        ExpressionAttributeNames={'#NO': 'notificationOutbox'}
+    ).get('Item', {})
+    events = item.get('notificationOutbox', {}).get('L', [])
+    if len(events) == 0:
+        return
+    outbox = SnsOutbox(request_id)
+    for event in events:
+        outbox.add(event['field'], event['publishArguments'])
+    save_sns_outbox(metadata_table, outbox, timeout, saved = True)
+
+# publishes the saved notifications of the records whose notificationOutbox is not empty, up to maximum_requests of them, when the
+# schedule of the stack invokes the resampling function with { notificationOutbox: {} }
+# returns { requestIds: the records dispatched }
+def dispatch_saved_sns_outboxes(metadata_table, maximum_requests = SNS_OUTBOX_DISPATCH_MAXIMUM_REQUESTS, timeout = SNS_OUTBOX_FLUSH_TIMEOUT_SECONDS):
+    request_ids = list()
+    scan_arguments = {'FilterExpression': Attr('notificationOutbox.L').size().gt(0), 'ProjectionExpression': 'requestId'}
+    while len(request_ids) < maximum_requests:
+        response = metadata_table.scan(**scan_arguments)
+        request_ids.extend(item['requestId'] for item in response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_arguments['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    request_ids = request_ids[:maximum_requests]
+    for request_id in request_ids:
+        dispatch_saved_sns_outbox(metadata_table, request_id, timeout)
+    print('Dispatched the saved notifications of {} request(s)'.format(len(request_ids)))
+    return {'requestIds': request_ids}
@@ -0,0 +1,401 @@
+import json
+import math
+import os
+import pandas
+from boto3.dynamodb.conditions import Key
+import resampling
+from helper.sns import prepare_on_resample_complete_sns_publish, prepare_on_resample_fail_sns_publish
+from helper.sns_outbox import SnsOutbox, save_sns_outbox
+from helper.datetime_converter import get_current_timestamp, get_presigned_url_expires_in_maximum_seconds
+from helper.s3_presigned_url import generate_presigned_url
+from helper.kde import compute_kde_on_shared_grid
+from helper.dataset_io import read_dataset_from_s3
+from helper.file_format import get_data_file_format
+from helper.result_cache import put_cached_result
+from helper.method_parameters import normalize_method_parameters, from_dynamodb_method_parameters
+from helper.partitioned_methods import plan_partitions
+from helper.method_cost_model import predict_method_cost, get_cost_limits, is_over_cost_limits
+from helper.job_metrics import JobMetrics
+from helper.aws_clients import lazy_client
+
+# a partitioned job is split into partitions of about this many rows, each resampled in an invocation of its own
+PARTITIONED_JOB_ROWS_PER_PARTITION = 50000
+# or into smaller ones, of which the resampling is predicted to take at most this share of the limits of the function,
+# leaving the rest to the read and the upload of the partition
+PARTITION_COST_LIMIT_SHARE = 0.5
+# a partition is attempted this often, the first invocation and the two retries of an asynchronous Lambda invocation
+PARTITION_MAXIMUM_ATTEMPTS = 3
+# partition inputs and outputs are kept under this prefix of the resampled data bucket until the job ends
+PARTITION_OBJECT_KEY_PREFIX = 'partitions/'
+
+# Create Lambda client
+lambda_client = lazy_client('lambda')
+
+# partitioned job db fields: { partitionedJob, partitionedJobStatus, completedPartitions, partitionAttempts, partitionedJobEndClaimTime }
+# partitionedJob: { partitionCount, methodParameters, resultCacheKey }, partitionedJobStatus: running, completed or failed
+# completedPartitions (number set, created by the first completed partition) and partitionAttempts (map) are the checkpoints,
+# written without type wrappers so that they can be updated in place
+
+# the planner: split the raw data into partitions by target relevance and store them
+# returns the partitionedJob of the plan, see start_partitioned_job(), or None when the data cannot be partitioned, and the job is
+# resampled in one piece instead
+def plan_partitioned_job(metadata, raw_data, method_parameters, result_cache_key):
+    request_id = metadata['requestId']
+    partition_count = get_partition_count(metadata['method'], len(raw_data), raw_data.shape[1] - 1)
+    # the relevance function of the whole data is fixed in the method parameters of every partition
+    method_parameters = dict(method_parameters)
+    partition_positions = plan_partitions(raw_data, metadata['y'], method_parameters, partition_count)
+    if partition_positions is None:
+        return None
+    print('Planned partitioned job {}: {} rows in {} partitions'.format(request_id, len(raw_data), len(partition_positions)))
+    for partition, positions in enumerate(partition_positions):
+        resampling.upload_resampled_data(raw_data.iloc[positions], metadata['s3ResampledDataBucketName'], get_partition_object_key(request_id, partition, 'input'), get_partition_file_name(request_id, partition, 'input'), 'parquet')
+    return {
+        'partitionCount': len(partition_positions),
+        'methodParameters': normalize_method_parameters(method_parameters),
+        'resultCacheKey': result_cache_key
+    }
+
+# one partition per PARTITIONED_JOB_ROWS_PER_PARTITION rows, or as many more as it takes for the predicted cost of method on a partition
+# to stay within PARTITION_COST_LIMIT_SHARE of the limits, e.g. for smaller data that preflight predicted to exceed them in one piece
+def get_partition_count(method, rows, features):
+    partition_count = math.ceil(rows / PARTITIONED_JOB_ROWS_PER_PARTITION)
+    limits = {name: limit * PARTITION_COST_LIMIT_SHARE for name, limit in get_cost_limits().items()}
+    while partition_count < rows:
+        prediction = predict_method_cost(method, math.ceil(rows / partition_count), features)
+        if prediction is None or not is_over_cost_limits(prediction, limits):
+            break
+        partition_count += 1
+    return partition_count
+
+# records the partitioned job and starts one worker per partition
+# planning_record: { db field: dynamodb value } of the planning invocation, such as its resamplingMetrics, written with the job so that
+# the finalizer finds them, however soon the partitions end
+def start_partitioned_job(request_id, partitioned_job, resampling_start_time, planning_record):
+    expression_attribute_names = {
+        '#PJ': 'partitionedJob',
+        '#PJS': 'partitionedJobStatus',
+        '#PA': 'partitionAttempts',
+        '#RST': 'resamplingStartTime'
+    }
+    expression_attribute_values = {
+        ':pj': {
+            'M': partitioned_job
+        },
+        ':pjs': {
+            'S': 'running'
+        },
+        ':pa': {str(partition): 0 for partition in range(partitioned_job['partitionCount'])},
+        ':rst': {
+            'N': resampling_start_time,
+        }
+    }
+    update_expressions = ['#PJ = :pj', '#PJS = :pjs', '#PA = :pa', '#RST = :rst']
+    for index, (field, value) in enumerate(planning_record.items()):
+        expression_attribute_names['#F{}'.format(index)] = field
+        expression_attribute_values[':f{}'.format(index)] = value
+        update_expressions.append('#F{0} = :f{0}'.format(index))
+    metadata_table_update_item(request_id, 'SET {}'.format(', '.join(update_expressions)), expression_attribute_names, expression_attribute_values)
+    for partition in range(partitioned_job['partitionCount']):
+        partition_dispatcher(request_id, partition)
+
+# the worker: resample one partition and checkpoint it, the last partition to complete runs the finalizer
+def resample_job_partition(request_id, partition):
+    metadata = get_metadata(request_id)
+    partitioned_job = metadata['partitionedJob']['M']
+    partition_count = int(partitioned_job['partitionCount'])
+    s3_resampled_data_bucket_name = metadata['s3ResampledDataBucketName']
+    completed_partitions = metadata.get('completedPartitions', set())
+    # a worker whose partition is resampled still runs when all are, as the retry of a finalizer that failed
+    if metadata['partitionedJobStatus']['S'] != 'running' or (partition in completed_partitions and len(completed_partitions) < partition_count):
+        print('Skipped partition {} of job {}: already resampled or the job has ended'.format(partition, request_id))
+        return
+    # the attempt is counted before it starts, so that the attempts that no handler ends, by a timeout or by running out of memory, count too
+    attempts = metadata_table_update_item(
+        request_id,
+        'SET #PA.#P = #PA.#P + :one',
+        {'#PA': 'partitionAttempts', '#P': str(partition)},
+        {':one': 1},
+        'UPDATED_NEW'
+    )['partitionAttempts'][str(partition)]
+    if attempts > PARTITION_MAXIMUM_ATTEMPTS:
+        fail_partitioned_job(metadata, 'Partition {} did not complete in {} attempts'.format(partition, PARTITION_MAXIMUM_ATTEMPTS))
+        return
+
+    if partition not in completed_partitions:
+        # the stages of the partition workers are logged only, the finalizer records those of the whole job
+        job_metrics = JobMetrics(request_id)
+        try:
+            with job_metrics.measure('read', partition = partition) as stage_metrics:
+                data = read_dataset_from_s3(resampling.s3_client, s3_resampled_data_bucket_name, get_partition_object_key(request_id, partition, 'input'), 'parquet')
+                stage_metrics.update(rows = data.shape[0], columns = data.shape[1])
+            with job_metrics.measure('resample', partition = partition, method = metadata['method']) as stage_metrics:
+                resampled_data = resampling.resample_data(data, metadata['method'], metadata['y'], from_dynamodb_method_parameters(partitioned_job['methodParameters']))
+                stage_metrics.update(rows = resampled_data.shape[0], columns = resampled_data.shape[1])
+            resampling.upload_resampled_data(resampled_data, s3_resampled_data_bucket_name, get_partition_object_key(request_id, partition, 'output'), get_partition_file_name(request_id, partition, 'output'), 'parquet', job_metrics)
+        except Exception as e:
+            print(e)
+            # raising makes Lambda retry the invocation, from the checkpoints
+            if attempts < PARTITION_MAXIMUM_ATTEMPTS:
+                raise e
+            fail_partitioned_job(metadata, 'Partition {} failed {} times: {}'.format(partition, attempts, e))
+            return
+
+        completed_partitions = metadata_table_update_item(
+            request_id,
+            'ADD #CP :partition',
+            {'#CP': 'completedPartitions'},
+            {':partition': {partition}},
+            'UPDATED_NEW'
+        )['completedPartitions']
+        print('Resampled partition {} of job {}: {} of {} partitions done'.format(partition, request_id, len(completed_partitions), partition_count))
+    if len(completed_partitions) == partition_count:
+        try:
+            finalize_partitioned_job(metadata)
+        except Exception as e:
+            print(e)
+            # the finalizer takes the end of the job only once the merged data is uploaded, so that a retry finalizes it again
+            if attempts < PARTITION_MAXIMUM_ATTEMPTS:
+                raise e
+            fail_partitioned_job(metadata, 'Finalizing failed {} times: {}'.format(attempts, e))
+
+# the records of the partition failure queue, the onFailure destination of the asynchronous invocations of the resampling function:
+# the partition workers that failed every attempt, also those that no handler ended, fail their job
+def fail_partition_invocations(event):
+    for record in event['Records']:
+        invocation_record = json.loads(record['body'])
+        payload = invocation_record.get('requestPayload') or {}
+        if 'partitionedJob' not in payload:
+            print('Skipped failed invocation: {}'.format(json.dumps(payload)))
+            continue
+        request_id = payload['partitionedJob']['requestId']
+        partition = int(payload['partitionedJob']['partition'])
+        metadata = get_metadata(request_id)
+        if metadata['partitionedJobStatus']['S'] == 'running':
+            fail_partitioned_job(metadata, 'Partition {} did not complete: {}'.format(partition, invocation_record.get('requestContext', {}).get('condition')))
+
+# the finalizer: merge the resampled partitions, compute the chart and notify, like the end of resampling.resample()
+def finalize_partitioned_job(metadata):
+    request_id = metadata['requestId']
+    partitioned_job = metadata['partitionedJob']['M']
+    partition_count = int(partitioned_job['partitionCount'])
+    y = metadata['y']
+    s3_resampled_data_bucket_name = metadata['s3ResampledDataBucketName']
+    record_expiration_time = metadata['recordExpirationTime']
+    resampling_start_time = metadata['resamplingStartTime']['N']
+    job_metrics = JobMetrics(request_id)
+
+    with job_metrics.measure('merge', partitions = partition_count) as stage_metrics:
+        resampled_data = pandas.concat([
+            read_dataset_from_s3(resampling.s3_client, s3_resampled_data_bucket_name, get_partition_object_key(request_id, partition, 'output'), 'parquet') for partition in range(partition_count)
+        ], ignore_index = True)
+        # the raw targets are collected from the partition inputs, which together hold the raw data
+        raw_targets = pandas.concat([
+            read_dataset_from_s3(resampling.s3_client, s3_resampled_data_bucket_name, get_partition_object_key(request_id, partition, 'input'), 'parquet')[y] for partition in range(partition_count)
+        ], ignore_index = True)
+        stage_metrics.update(rows = resampled_data.shape[0], columns = resampled_data.shape[1])
+    resampling.upload_resampled_data(resampled_data, s3_resampled_data_bucket_name, metadata['s3ResampledDataObjectKey'], metadata['s3ResampledDataFileName'], get_data_file_format(metadata.get('resampledFileNameSuffix', metadata['originalFileNameSuffix'])), job_metrics, metadata.get('resampledDataContentEncoding'))
+    resampling_end_time = get_current_timestamp('int')
+
+    # chart visualization data computation
+    with job_metrics.measure('chart', rows = len(raw_targets) + len(resampled_data)):
+        target_list, (density_list_raw, density_list_resampled) = compute_kde_on_shared_grid([raw_targets, resampled_data[y]], int(metadata['chartDataSize']))
+        chart_data_points = resampling.format_kde_plot_data_points(target_list, density_list_raw, density_list_resampled)
+    with job_metrics.measure('cacheInsert'):
+        put_cached_result(resampling.result_cache_table, partitioned_job['resultCacheKey'], s3_resampled_data_bucket_name, metadata['s3ResampledDataObjectKey'], chart_data_points, request_id, record_expiration_time)
+
+    # s3 download urls generation
+    with job_metrics.measure('presignedUrls'):
+        get_raw_data_url = generate_presigned_url(metadata['s3RawDataBucketName'], metadata['s3RawDataObjectKey'], metadata['s3RawDataFileName'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
+        get_resampled_data_url = generate_presigned_url(s3_resampled_data_bucket_name, metadata['s3ResampledDataObjectKey'], metadata['s3ResampledDataFileName'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
+
+    # SNS email notification on resample complete
+    notification_outbox = SnsOutbox(request_id)
+    if metadata['taskStatusSnsTopicSubscriptionOption'] != 'reject':
+        notification_outbox.add('onResampleCompleteSnsPublishMessageId', prepare_on_resample_complete_sns_publish(
+            metadata['taskStatusSnsTopicArn'],
+            request_id,
+            metadata['email'],
+            metadata['method'],
+            y,
+            metadata['originalFileName'],
+            metadata['recordCreationTime'],
+            record_expiration_time,
+            resampling_start_time,
+            resampling_end_time,
+            get_raw_data_url,
+            get_resampled_data_url
+        ))
+
+    # exactly one of the finalizers that got this far ends the job, the others uploaded the same merged data
+    if not claim_partitioned_job_end(request_id):
+        print('Skipped the end of job {}: ended by another invocation'.format(request_id))
+        return
+    try:
+        update_completed_partitioned_job(request_id, chart_data_points, resampling_end_time, merge_resampling_metrics(metadata.get('resamplingMetrics', {}).get('M'), job_metrics.to_dynamodb()))
+    except Exception as e:
+        print(e)
+        fail_partitioned_job(metadata, str(e), claimed = True)
+        return
+    delete_partition_objects(metadata)
+    with job_metrics.measure('notifications'):
+        save_sns_outbox(resampling.metadata_table, notification_outbox)
+
+def update_completed_partitioned_job(request_id, chart_data_points, resampling_end_time, resampling_metrics):
+    metadata_table_update_item(
+        request_id,
+        'SET #CDP = :cdp, #RET = :ret, #RCH = :rch, #PJS = :pjs, #RM = :rm',
+        {
+            '#CDP': 'chartDataPoints',
+            '#RET': 'resamplingEndTime',
+            '#RCH': 'resultCacheHit',
+            '#PJS': 'partitionedJobStatus',
+            '#RM': 'resamplingMetrics'
+        },
+        {
+            ':cdp': {
+                'M': chart_data_points,
+            },
+            ':ret': {
+                'N': resampling_end_time,
+            },
+            ':rch': {
+                'BOOL': False,
+            },
+            ':pjs': {
+                'S': 'completed',
+            },
+            ':rm': {
+                'M': resampling_metrics,
+            }
+        }
+    )
+
+# the metrics of the planning invocation, followed by those of the finalizer, the partitions ran in invocations of their own in between
+def merge_resampling_metrics(planning_metrics, finalizer_metrics):
+    if planning_metrics is None:
+        return finalizer_metrics
+    return {
+        'totalMs': planning_metrics['totalMs'] + finalizer_metrics['totalMs'],
+        'peakRssMb': max(planning_metrics['peakRssMb'], finalizer_metrics['peakRssMb']),
+        'stages': planning_metrics['stages'] + finalizer_metrics['stages']
+    }
+
+def fail_partitioned_job(metadata, error_message, claimed = False):
+    request_id = metadata['requestId']
+    if not claimed and not claim_partitioned_job_end(request_id):
+        return
+    notification_outbox = SnsOutbox(request_id)
+    if metadata['taskStatusSnsTopicSubscriptionOption'] != 'reject':
+        notification_outbox.add('onResampleFailSnsPublishMessageId', prepare_on_resample_fail_sns_publish(
+            metadata['taskStatusSnsTopicArn'],
+            request_id,
+            metadata['email'],
+            metadata['method'],
+            metadata['y'],
+            metadata['originalFileName'],
+            metadata['recordCreationTime'],
+            error_message
+        ))
+    metadata_table_update_item(
+        request_id,
+        'SET #PJS = :pjs',
+        {
+            '#PJS': 'partitionedJobStatus'
+        },
+        {
+            ':pjs': {
+                'S': 'failed',
+            }
+        }
+    )
+    delete_partition_objects(metadata)
+    save_sns_outbox(resampling.metadata_table, notification_outbox)
+
+# exactly one invocation ends a job, either by finalizing it or by failing it
+def claim_partitioned_job_end(request_id):
+    try:
+        resampling.metadata_table.update_item(
+            ExpressionAttributeNames={'#PJECT': 'partitionedJobEndClaimTime', '#RV': 'recordVersion'},
+            ExpressionAttributeValues={':pject': get_current_timestamp('int'), ':rv': 1},
+            Key={ 'requestId': request_id },
+            ReturnValues='NONE',
+            UpdateExpression='SET #PJECT = :pject ADD #RV :rv',
+            ConditionExpression='attribute_not_exists(#PJECT)'
+        )
+        return True
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+            return False
+        raise e
+
+def delete_partition_objects(metadata):
+    request_id = metadata['requestId']
+    for partition in range(int(metadata['partitionedJob']['M']['partitionCount'])):
+        for stage in ('input', 'output'):
+            try:
+                resampling.s3_client.delete_object(Bucket = metadata['s3ResampledDataBucketName'], Key = get_partition_object_key(request_id, partition, stage))
+            # the objects expire with the bucket lifecycle rule anyway
+            except Exception as e:
+                print(e)
+
+def get_metadata(request_id):
+    metadata = resampling.metadata_table.query(
+        KeyConditionExpression=Key('requestId').eq(request_id)
+    )
+    if len(metadata['Items']) > 0:
+        return metadata['Items'][0]
+    raise Exception("Record with requestId " + request_id + " does not exist!")
+
+# returns the updated attributes when return_values is UPDATED_NEW
+# every update increments the recordVersion of the record, which retrieve() derives its etag from
+def metadata_table_update_item(request_id, update_expression, expression_attribute_names, expression_attribute_values, return_values = 'NONE'):
+    update_expression += ', #RV :rv' if 'ADD ' in update_expression else ' ADD #RV :rv'
+    response = resampling.metadata_table.update_item(
+        ExpressionAttributeNames=dict(expression_attribute_names, **{'#RV': 'recordVersion'}),
+        ExpressionAttributeValues=dict(expression_attribute_values, **{':rv': 1}),
+        Key={ 'requestId': request_id },
+        ReturnValues=return_values,
+        UpdateExpression=update_expression,
+    )
+    return response.get('Attributes')
+
+# stage: input or output
+def get_partition_object_key(request_id, partition, stage):
+    return PARTITION_OBJECT_KEY_PREFIX + request_id + '/' + get_partition_file_name(request_id, partition, stage)
+
+def get_partition_file_name(request_id, partition, stage):
+    return 'partition_{}_{}_{}.parquet'.format(request_id, partition, stage)
+
+# every partition worker is an asynchronous invocation of this function, which Lambda retries twice on failure
+def invoke_partition_worker(request_id, partition):
+    lambda_client.invoke(
+        FunctionName=os.environ['AWS_LAMBDA_FUNCTION_NAME'],
+        InvocationType='Event',
+        Payload=json.dumps({'partitionedJob': {'requestId': request_id, 'partition': partition}})
+    )
+
+partition_dispatcher = invoke_partition_worker
+
+def run_locally(bucket, key):
+    '''Stand in for the Lambda orchestration of a resampling request: handle
+    the upload of key to bucket in this process and, for a partitioned job,
+    call the partition workers in turn instead of invoking them, retrying a
+    failed partition like Lambda retries an asynchronous invocation. The
+    AWS clients of resampling.py are used as they are, so they may be
+    replaced by local stand-ins beforehand.
+    '''
+    global partition_dispatcher
+    pending_partitions = list()
+    partition_dispatcher = lambda request_id, partition: pending_partitions.append((request_id, partition))
+    try:
+        resampling.resample(bucket, key)
+        while len(pending_partitions) > 0:
+            request_id, partition = pending_partitions.pop(0)
+            try:
+                resample_job_partition(request_id, partition)
+            except Exception as e:
+                print('Retrying partition {} of job {}: {}'.format(partition, request_id, e))
+                pending_partitions.append((request_id, partition))
+    finally:
+        partition_dispatcher = invoke_partition_worker
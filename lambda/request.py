@@ -1,24 +1,35 @@
-import boto3 
 from helper.s3_presigned_url import generate_presigned_url
-from helper.sns import subscribe_sns_email
-from helper.lambda_http import extract_request_body, generate_lambda_proxy_success_response, generate_lambda_proxy_exception_response
+from helper.sns import subscribe_sns_email, resampling_method_names
+from helper.method_parameters import normalize_method_parameters, normalize_execution_mode, get_batch_method_labels, BATCH_MAXIMUM_METHOD_COUNT
+from helper.lambda_http import extract_request_body, accepts_compressed_response, generate_lambda_proxy_success_response, generate_lambda_proxy_exception_response
 from helper.datetime_converter import get_current_datetime_interval, get_timestamp
+from helper.file_format import get_data_file_suffix, get_data_file_format, get_data_file_format_suffix, get_content_type, normalize_content_encoding
+from helper.aws_clients import lazy_client, lazy_table
 import os
 import uuid
 
-# Create the DynamoDB resource
-metadata_table = boto3.resource('dynamodb').Table(os.environ['metadataTableName'])
-# Create S3 client
-s3_client = boto3.client('s3')
+# the DynamoDB table and the S3 client, see helper/aws_clients.py
+metadata_table = lazy_table(os.environ['metadataTableName'])
+s3_client = lazy_client('s3')
 
-# db fields: { requestId, email, method, y, chartDataSize, chartDataPoints, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, originalFileName, originalFileNameSuffix, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime, resamplingStartTime, resamplingEndTime }
-# payload inputs: { email, method, y, chartDataSize, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, originalFileName }
-# db inserts: { requestId, email, method, y, chartDataSize, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, originalFileName, originalFileNameSuffix, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime }
-# db missing: { chartDataPoints, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, resamplingStartTime, resamplingEndTime }
+# db fields: { requestId, email, method, methodParameters, executionMode, batchMethods, batchResults, y, chartDataSize, chartDataPoints, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, originalFileName, originalFileNameSuffix, resampledFileNameSuffix, resampledDataContentEncoding, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime, resamplingStartTime, resamplingEndTime, resultCacheHit, resamplingMetrics, partitionedJob, partitionedJobStatus, completedPartitions, partitionAttempts, partitionedJobEndClaimTime, notificationOutbox, datasetProfile, approximationReport, profiling, jobProfile, recordVersion }
+# payload inputs: { email, method, methodParameters (optional), executionMode (optional: exact or approximate, exact by default), y, chartDataSize, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, originalFileName, outputFormat (optional: csv, csv.gz, csv.zst, parquet or feather, the original file format by default), outputContentEncoding (optional: gzip, zstd or identity for csv output, resampledDataContentEncoding of the stack by default), uploadContentEncoding (optional: gzip or zstd, the Content-Encoding the raw data will be uploaded with), profiling (optional: false by default, true to profile the stages of the job, see helper/job_profiler.py) }
+#   a batch request replaces method, methodParameters and executionMode with methods: [{ method, parameters (optional), executionMode (optional) }, ...]
+# db inserts: { requestId, email, method, methodParameters, executionMode, batchMethods, y, chartDataSize, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, originalFileName, originalFileNameSuffix, resampledFileNameSuffix, resampledDataContentEncoding, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime, profiling, recordVersion }
+# db missing: { batchResults, chartDataPoints, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, resamplingStartTime, resamplingEndTime, resultCacheHit, resamplingMetrics, partitionedJob, partitionedJobStatus, completedPartitions, partitionAttempts, partitionedJobEndClaimTime, notificationOutbox, datasetProfile, approximationReport, jobProfile }
+#   batch requests store method 'batch' and batchMethods: [{ method, label, parameters, executionMode, s3ResampledDataObjectKey, s3ResampledDataFileName }, ...], with no top-level resampled data object
 def request(payload):
     # metadata preparation
     payload['email'] = payload['email'].strip().lower()
-    payload['method'] = payload['method'].strip().lower()
+    if payload.get('methods') != None:
+      payload['methods'] = prepare_batch_methods(payload['methods'])
+      payload['method'] = 'batch'
+      payload['methodParameters'] = {}
+      payload['executionMode'] = 'exact'
+    else:
+      payload['method'] = prepare_method(payload['method'])
+      payload['methodParameters'] = normalize_method_parameters(payload.get('methodParameters'))
+      payload['executionMode'] = normalize_execution_mode(payload['method'], payload.get('executionMode'))
     # payload['y'] = payload['y'].strip(): csv headers may begin or end with white spaces, so remove .strip()
     payload['y'] = payload['y']
     payload['chartDataSize'] = int(payload['chartDataSize'])
@@ -30,13 +41,32 @@ def request(payload):
     
     request_id = uuid.uuid4().hex
     original_file_name = payload['originalFileName']
-    original_file_name_suffix = original_file_name[original_file_name.rindex("."):]
+    original_file_name_suffix = get_data_file_suffix(original_file_name)
+    resampled_file_name_suffix = get_data_file_format_suffix(payload['outputFormat']) if payload.get('outputFormat') else original_file_name_suffix
+    resampled_data_content_encoding = prepare_resampled_data_content_encoding(resampled_file_name_suffix, payload.get('outputContentEncoding'))
+    upload_content_encoding = prepare_upload_content_encoding(payload.get('uploadContentEncoding'))
     s3_raw_data_bucket_name = os.environ['rawDataBucketName']
     s3_raw_data_object_key = 'raw_' + request_id + original_file_name_suffix
     s3_raw_data_file_name = 'raw_' + request_id + original_file_name_suffix
     s3_resampled_data_bucket_name = os.environ['resampledDataBucketName']
-    s3_resampled_data_object_key = 'resampled_' + request_id + original_file_name_suffix
-    s3_resampled_data_file_name = 'resampled_' + request_id + original_file_name_suffix
+    s3_resampled_data_object_key = 'resampled_' + request_id + resampled_file_name_suffix
+    s3_resampled_data_file_name = 'resampled_' + request_id + resampled_file_name_suffix
+    batch_methods = None
+    if payload['method'] == 'batch':
+      # one resampled data object per batch entry instead of the top-level one
+      s3_resampled_data_object_key = None
+      s3_resampled_data_file_name = None
+      batch_methods = list()
+      for index, (batch_method, label) in enumerate(zip(payload['methods'], get_batch_method_labels([batch_method['method'] for batch_method in payload['methods']]))):
+        batch_method_file_name = 'resampled_' + request_id + '_' + str(index + 1) + '_' + batch_method['method'] + resampled_file_name_suffix
+        batch_methods.append({
+          'method': batch_method['method'],
+          'label': label,
+          'parameters': batch_method['parameters'],
+          'executionMode': batch_method['executionMode'],
+          's3ResampledDataObjectKey': batch_method_file_name,
+          's3ResampledDataFileName': batch_method_file_name
+        })
     record_creation_time_datetime, record_expiration_time_datetime = get_current_datetime_interval(os.environ['expirationDays'])
     record_creation_time = get_timestamp(record_creation_time_datetime, 'int')
     record_expiration_time = get_timestamp(record_expiration_time_datetime, 'int')  
@@ -46,6 +76,9 @@ def request(payload):
       'requestId': request_id, 
       'email': payload['email'],
       'method': payload['method'],
+      'methodParameters': payload['methodParameters'],
+      'executionMode': payload['executionMode'],
+      'batchMethods': batch_methods,
       'y': payload['y'],
       'chartDataSize': payload['chartDataSize'],
       'taskStatusSnsTopicArn': os.environ['taskStatusSnsTopicArn'], 
@@ -53,6 +86,8 @@ def request(payload):
       'taskStatusSnsTopicSubscriptionArn': payload['taskStatusSnsTopicSubscriptionArn'],
       'originalFileName': payload['originalFileName'],
       'originalFileNameSuffix': original_file_name_suffix, 
+      'resampledFileNameSuffix': resampled_file_name_suffix,
+      'resampledDataContentEncoding': resampled_data_content_encoding,
       's3RawDataBucketName': s3_raw_data_bucket_name, 
       's3RawDataObjectKey': s3_raw_data_object_key, 
       's3RawDataFileName': s3_raw_data_file_name,
@@ -60,17 +95,52 @@ def request(payload):
       's3ResampledDataObjectKey': s3_resampled_data_object_key, 
       's3ResampledDataFileName': s3_resampled_data_file_name,
       'recordCreationTime': record_creation_time, 
-      'recordExpirationTime': record_expiration_time
+      'recordExpirationTime': record_expiration_time,
+      'profiling': payload.get('profiling', False) == True,
+      'recordVersion': 0
     }
     metadata_table.put_item(Item=metadata, ReturnValues='NONE')
     
     # s3 upload url generation and request respond
     response_body = metadata
     response_body.update({
-        'putPresignedUrl': generate_presigned_url(s3_raw_data_bucket_name, s3_raw_data_object_key, s3_raw_data_file_name, 'put', 900)
+        'putPresignedUrl': generate_presigned_url(s3_raw_data_bucket_name, s3_raw_data_object_key, s3_raw_data_file_name, 'put', 900, upload_content_encoding),
+        'putPresignedUrlContentType': get_content_type(s3_raw_data_file_name),
+        'putPresignedUrlContentEncoding': upload_content_encoding
     })
     return response_body
 
+def prepare_method(method):
+    method = method.strip().lower()
+    if method not in resampling_method_names:
+      raise Exception('Invalid method {}! Should be one of {}!'.format(method, ', '.join(resampling_method_names)))
+    return method
+
+# csv output is stored compressed with a Content-Encoding, which browsers undo on download, the other formats as they are
+def prepare_resampled_data_content_encoding(resampled_file_name_suffix, content_encoding):
+    content_encoding = normalize_content_encoding(content_encoding or os.environ.get('resampledDataContentEncoding'))
+    if content_encoding == 'identity' or get_data_file_format(resampled_file_name_suffix) != 'csv':
+      return None
+    return content_encoding
+
+# a compressed upload is signed with its Content-Encoding, which the upload then has to send
+def prepare_upload_content_encoding(content_encoding):
+    content_encoding = normalize_content_encoding(content_encoding)
+    return content_encoding if content_encoding != 'identity' else None
+
+def prepare_batch_methods(batch_methods):
+    if not isinstance(batch_methods, list) or len(batch_methods) < 1 or len(batch_methods) > BATCH_MAXIMUM_METHOD_COUNT:
+      raise Exception('Invalid methods! Should be a list of 1 to {} methods!'.format(BATCH_MAXIMUM_METHOD_COUNT))
+    return [prepare_batch_method(batch_method) for batch_method in batch_methods]
+
+def prepare_batch_method(batch_method):
+    method = prepare_method(batch_method['method'])
+    return {
+      'method': method,
+      'parameters': normalize_method_parameters(batch_method.get('parameters')),
+      'executionMode': normalize_execution_mode(method, batch_method.get('executionMode'))
+    }
+
 def lambda_handler(event, context):
     '''Provide an event that contains the following keys:
       - operation: one of the operations in the operations dict below
@@ -81,7 +151,7 @@ def lambda_handler(event, context):
     try:
       request_body = extract_request_body(event)
       payload = request_body['payload']
-      return generate_lambda_proxy_success_response(request(payload))
+      return generate_lambda_proxy_success_response(request(payload), compress = accepts_compressed_response(event))
     except Exception as e:
       return generate_lambda_proxy_exception_response(e)
         
\ No newline at end of file
@@ -1,100 +1,159 @@
-import ImbalancedLearningRegression
-import pandas
-import seaborn
-import boto3 
-from boto3.dynamodb.conditions import Key
-from helper.sns import send_on_resample_start_email, send_on_resample_complete_email, send_on_resample_fail_email
+from helper.sns import prepare_on_resample_start_sns_publish, prepare_on_resample_complete_sns_publish, prepare_on_resample_fail_sns_publish
+from helper.sns_outbox import SnsOutbox, save_sns_outbox, dispatch_saved_sns_outbox, dispatch_saved_sns_outboxes
 from helper.datetime_converter import get_current_timestamp, get_presigned_url_expires_in_maximum_seconds
 from helper.s3_presigned_url import generate_presigned_url
+from helper.lazy_import import lazy_function
+from helper.method_cost_model import predict_method_cost, get_cost_limits, is_over_cost_limits
+from helper.s3_transfer import upload_written_object
+from helper.file_format import get_data_file_format, get_content_type
+from helper.result_cache import compute_result_cache_key, get_cached_result, put_cached_result
+from helper.method_parameters import from_dynamodb_method_parameters, APPROXIMATE_PARTITION_ROWS, APPROXIMATE_VALIDATION_ROWS
+from helper.parallel import get_worker_count, run_in_processes, start_stage
+from helper.job_metrics import JobMetrics, measure_stage, to_dynamodb_numbers
+from helper.job_queue import get_job_records, split_job_lanes, forward_jobs, delete_message, is_same_queue
+from helper.aws_clients import lazy_client, lazy_table, reset_clients
+from helper.chart_data import CHART_DATA_VERSION, CHART_DATA_DENSITY_ENCODING, CHART_DATA_DENSITY_QUANTIZATION_LEVELS, CHART_DATA_RAW_DENSITY_NAME, CHART_DATA_RESAMPLED_DENSITY_NAME
 from decimal import Decimal
+import base64
+import collections
+import json
 import os
-import urllib.parse
+import time
 
-# Create the DynamoDB resource
-metadata_table = boto3.resource('dynamodb').Table(os.environ['metadataTableName'])
-# Create S3 client
-s3_client = boto3.client('s3')
+# the DynamoDB tables and the S3 client, shared with the other modules and created on first use, see helper/aws_clients.py
+metadata_table = lazy_table(os.environ['metadataTableName'])
+s3_client = lazy_client('s3')
+sqs_client = lazy_client('sqs')
+# the result cache is disabled without a table name
+result_cache_table = lazy_table(os.environ['resultCacheTableName']) if os.environ.get('resultCacheTableName') else None
+# neighbour graphs are persisted next to the raw data for repeat runs on the same data, unless disabled
+neighbour_index_bucket_name = os.environ['rawDataBucketName'] if os.environ.get('neighbourIndexPersistence', 'false').strip().lower() == 'true' else None
 
+# boto3, numpy, pandas and pyarrow are imported with the first job that needs them, not at cold start, like the modules below
+Key = lazy_function('boto3.dynamodb.conditions', 'Key')
+read_dataset_from_s3 = lazy_function('helper.dataset_io', 'read_dataset_from_s3')
+write_dataset = lazy_function('helper.dataset_io', 'write_dataset')
+is_downcast_enabled = lazy_function('helper.dataset_io', 'is_downcast_enabled')
+profile_dataset = lazy_function('helper.dataset_profile', 'profile_dataset')
+validate_target = lazy_function('helper.dataset_profile', 'validate_target')
+compute_kde_on_shared_grid = lazy_function('helper.kde', 'compute_kde_on_shared_grid')
+# the neighbour index store is configured as the neighbour methods import the index
+configure_neighbour_index_store = lazy_function('helper.neighbour_index', 'configure_neighbour_index_store')
+save_neighbour_indexes = lazy_function('helper.neighbour_index', 'save_neighbour_indexes')
+
+# ImbalancedLearningRegression (and scikit-learn with it) is imported on the first resampling, not at cold start
+# note: its package __init__ imports every method module, so the first method used loads all of them
+# the neighbour searches of enn and tomeklinks then go through the shared neighbour index, see helper/neighbour_methods.py
+use_neighbour_index = lazy_function('helper.neighbour_methods', 'use_neighbour_index', lambda module: configure_neighbour_index_store(s3_client, neighbour_index_bucket_name))
 methods = {
-    'ro': ImbalancedLearningRegression.ro,
-    'smote': ImbalancedLearningRegression.smote,
-    'gn': ImbalancedLearningRegression.gn,
-    'adasyn': ImbalancedLearningRegression.adasyn,
-    'ru': ImbalancedLearningRegression.random_under,
-    'cnn': ImbalancedLearningRegression.cnn,
-    'tomeklinks': ImbalancedLearningRegression.tomeklinks,
-    'enn': ImbalancedLearningRegression.enn
+    'ro': lazy_function('ImbalancedLearningRegression', 'ro', use_neighbour_index),
+    'smote': lazy_function('ImbalancedLearningRegression', 'smote', use_neighbour_index),
+    'gn': lazy_function('ImbalancedLearningRegression', 'gn', use_neighbour_index),
+    'adasyn': lazy_function('ImbalancedLearningRegression', 'adasyn', use_neighbour_index),
+    'ru': lazy_function('ImbalancedLearningRegression', 'random_under', use_neighbour_index),
+    'cnn': lazy_function('ImbalancedLearningRegression', 'cnn', use_neighbour_index),
+    'tomeklinks': lazy_function('ImbalancedLearningRegression', 'tomeklinks', use_neighbour_index),
+    'enn': lazy_function('ImbalancedLearningRegression', 'enn', use_neighbour_index)
 }
+# these methods are resampled in partitions over the worker processes, see helper/partitioned_methods.py
+partitioned_methods = ('ro', 'ru', 'gn')
+resample_partitioned = lazy_function('helper.partitioned_methods', 'resample_partitioned')
+# from this many rows on, the partitioned methods run as a partitioned job: one invocation per partition, see partitioned_resampling.py
+partitioned_job_minimum_rows = int(os.environ.get('partitionedJobMinimumRows', '100000'))
+plan_partitioned_job = lazy_function('partitioned_resampling', 'plan_partitioned_job')
+start_partitioned_job = lazy_function('partitioned_resampling', 'start_partitioned_job')
+# raw data uploads arrive through the intake queue in batches, whose jobs run one after another in one warm invocation, see resample_jobs()
+# jobs of more than this many bytes go on to the large job queue, so that they do not hold up the small ones, unless there is none
+small_job_maximum_bytes = int(os.environ.get('smallJobMaximumBytes', str(1024 * 1024)))
+large_job_queue_url = os.environ.get('largeJobQueueUrl') or None
+# a job of a queue only starts with this much time left in the invocation, otherwise its message goes back to the queue
+intake_minimum_remaining_seconds = int(os.environ.get('intakeMinimumRemainingSeconds', '120'))
+# the neighbour-based methods run on partitions of the data when a request asks for the approximate executionMode, see helper/approximate_methods.py
+resample_approximately = lazy_function('helper.approximate_methods', 'resample_approximately')
+resample_job_partition = lazy_function('partitioned_resampling', 'resample_job_partition')
+# the partition workers that fail every attempt of their asynchronous invocation arrive through this queue, see fail_partition_invocations()
+partition_failure_queue_url = os.environ.get('partitionFailureQueueUrl') or None
+fail_partition_invocations = lazy_function('partitioned_resampling', 'fail_partition_invocations')
+# the raw data is profiled from a sample before it is read, so that jobs predicted to fail end before the download, unless disabled
+preflight_profiling = os.environ.get('preflightProfiling', 'true').strip().lower() == 'true'
+# the stages of every job are profiled when enabled, otherwise those of the requests that ask for it, see helper/job_profiler.py
+job_profiling = os.environ.get('jobProfiling', 'false').strip().lower() == 'true'
+JobProfiler = lazy_function('helper.job_profiler', 'JobProfiler')
 
-# db fields: { requestId, email, method, y, chartDataSize, chartDataPoints, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, originalFileName, originalFileNameSuffix, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime, resamplingStartTime, resamplingEndTime }
-# db updates: { chartDataPoints, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, resamplingStartTime, resamplingEndTime }
+# db fields: { requestId, email, method, methodParameters, executionMode, batchMethods, batchResults, y, chartDataSize, chartDataPoints, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, originalFileName, originalFileNameSuffix, resampledFileNameSuffix, resampledDataContentEncoding, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime, resamplingStartTime, resamplingEndTime, resultCacheHit, resamplingMetrics, partitionedJob, partitionedJobStatus, completedPartitions, partitionAttempts, partitionedJobEndClaimTime, notificationOutbox, datasetProfile, approximationReport, profiling, jobProfile, recordVersion }
+# db updates: { chartDataPoints, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, resamplingStartTime, resamplingEndTime, resultCacheHit, resamplingMetrics, datasetProfile, approximationReport, jobProfile, partitionedJob, partitionedJobStatus, partitionAttempts, notificationOutbox, recordVersion }
+# approximationReport: { partitions, partitionRows, validation }, see helper/approximate_methods.py, None for an exact run or a cached result
+# jobProfile: { s3ProfileStatsObjectKey, s3ProfileReportObjectKey } in the resampled data bucket, see helper/job_profiler.py, None for a job that is not profiled
 def resample(bucket, key): 
-    # file paths initialization - to delete the files afterwards
-    local_raw_data_file_path = None
-    local_resampled_data_file_path = None
-    
-    try:
-        # raw data local storage preparation
-        local_raw_data_file_directory = os.environ['localRawDataFileDirectory']
-        local_raw_data_file_name = key[key.rfind("/") + 1 : ]
-        local_raw_data_file_path = local_raw_data_file_directory + local_raw_data_file_name
-        if not os.path.exists(local_raw_data_file_directory):
-            os.makedirs(local_raw_data_file_directory)
-        
-        # raw data s3 downloads
-        try:
-            s3_client.download_file(Bucket = bucket, Key = key, Filename = local_raw_data_file_path)
-        except Exception as e:
-            print(e)
-            print('Error getting object {} from bucket {}. Make sure they exist and your bucket is in the same region as this function.'.format(key, bucket))
-            raise e
-        
-        # metadata retrieval
-        requestId = local_raw_data_file_name[4: local_raw_data_file_name.rindex(".")]
+    # metadata retrieval
+    raw_data_file_name = key[key.rfind("/") + 1 : ]
+    requestId = raw_data_file_name[4: raw_data_file_name.index(".")]
+    job_metrics = JobMetrics(requestId)
+    with job_metrics.measure('metadataQuery'):
         metadata = metadata_table.query(
             KeyConditionExpression=Key('requestId').eq(requestId)
         )
-        if len(metadata['Items']) > 0:
-            metadata = metadata['Items'][0]
-        else:
-            raise Exception("Record with requestId " + requestId + " does not exist!")
-            
-        # data preparation
-        method = metadata['method']
-        y = metadata['y']
-        task_status_sns_topic_subscription_option = metadata['taskStatusSnsTopicSubscriptionOption']
-        original_file_name = metadata['originalFileName']
-        s3_raw_data_bucket_name = metadata['s3RawDataBucketName']
-        s3_raw_data_object_key = metadata['s3RawDataObjectKey']
-        s3_raw_data_file_name = metadata['s3RawDataFileName']
-        s3_resampled_data_bucket_name = metadata['s3ResampledDataBucketName']
-        s3_resampled_data_object_key = metadata['s3ResampledDataObjectKey']
-        s3_resampled_data_file_name = metadata['s3ResampledDataFileName']
-        request_id = metadata['requestId']
-        email = metadata['email']
-        chart_data_size = int(metadata['chartDataSize'])
-        task_status_sns_topic_arn = metadata['taskStatusSnsTopicArn']
-        record_creation_time = metadata['recordCreationTime']
-        record_expiration_time = metadata['recordExpirationTime']
-        
-        # resampled data local storage preparation
-        local_resampled_data_file_directory = os.environ['localResampledDataFileDirectory']
-        local_resampled_data_file_name = s3_resampled_data_file_name
-        local_resampled_data_file_path = local_resampled_data_file_directory + local_resampled_data_file_name
-        if not os.path.exists(local_resampled_data_file_directory):
-            os.makedirs(local_resampled_data_file_directory)
-        
-        # dynamodb updated value initialization
-        on_resample_start_sns_publish_message_id = None
-        on_resample_complete_sns_publish_message_id = None
-        on_resample_fail_sns_publish_message_id = None
-        chart_data_points = None
-        resampling_start_time = None
-        resampling_end_time = None
+    if len(metadata['Items']) > 0:
+        metadata = metadata['Items'][0]
+    else:
+        raise Exception("Record with requestId " + requestId + " does not exist!")
+    # a job with a resamplingStartTime and no resamplingEndTime is running, see get_job_status() of retrieval.py
+    # the metadata update at the end of the job sets it again, to the start of the resampling itself, or null if the job failed before
+    with job_metrics.measure('startMarker'):
+        metadata_table.update_item(
+            ExpressionAttributeNames={'#RST': 'resamplingStartTime', '#RV': 'recordVersion'},
+            ExpressionAttributeValues={':rst': {'N': get_current_timestamp('int')}, ':rv': 1},
+            Key={ 'requestId': requestId },
+            ReturnValues='NONE',
+            UpdateExpression='SET #RST = :rst ADD #RV :rv'
+        )
+    # the stages of a partitioned job run in other invocations, of which only the planning is profiled
+    if job_profiling or metadata.get('profiling', False):
+        job_metrics.profiler = JobProfiler(requestId)
+    
+    if metadata['method'] == 'batch':
+        return resample_batch(bucket, key, metadata, job_metrics)
         
-        try:
-            # SNS email notification on resample start
-            on_resample_start_sns_publish_message_id = send_on_resample_start_email(
+    # data preparation
+    method = metadata['method']
+    method_parameters = from_dynamodb_method_parameters(metadata.get('methodParameters'))
+    execution_mode = metadata.get('executionMode', 'exact')
+    y = metadata['y']
+    task_status_sns_topic_subscription_option = metadata['taskStatusSnsTopicSubscriptionOption']
+    original_file_name = metadata['originalFileName']
+    raw_data_format = get_data_file_format(metadata['originalFileNameSuffix'])
+    resampled_data_format = get_data_file_format(metadata.get('resampledFileNameSuffix', metadata['originalFileNameSuffix']))
+    resampled_data_content_encoding = metadata.get('resampledDataContentEncoding')
+    s3_raw_data_bucket_name = metadata['s3RawDataBucketName']
+    s3_raw_data_object_key = metadata['s3RawDataObjectKey']
+    s3_raw_data_file_name = metadata['s3RawDataFileName']
+    s3_resampled_data_bucket_name = metadata['s3ResampledDataBucketName']
+    s3_resampled_data_object_key = metadata['s3ResampledDataObjectKey']
+    s3_resampled_data_file_name = metadata['s3ResampledDataFileName']
+    request_id = metadata['requestId']
+    email = metadata['email']
+    chart_data_size = int(metadata['chartDataSize'])
+    task_status_sns_topic_arn = metadata['taskStatusSnsTopicArn']
+    record_creation_time = metadata['recordCreationTime']
+    record_expiration_time = metadata['recordExpirationTime']
+    
+    # dynamodb updated value initialization
+    chart_data_points = None
+    resampling_start_time = None
+    resampling_end_time = None
+    result_cache_hit = False
+    dataset_profile = None
+    approximation_report = None
+    # with several workers, independent stages overlap: the upload with the chart, unless the job is profiled
+    overlap_stages = get_worker_count() > 1 and job_metrics.profiler is None
+    # SNS email notifications are published in the background, and their message ids recorded after the metadata update
+    notification_outbox = SnsOutbox(request_id)
+    notify = task_status_sns_topic_subscription_option != 'reject'
+    
+    try:
+        # SNS email notification on resample start
+        if notify:
+            notification_outbox.add('onResampleStartSnsPublishMessageId', prepare_on_resample_start_sns_publish(
                 task_status_sns_topic_arn, 
                 request_id, 
                 email, 
@@ -102,29 +161,81 @@ def resample(bucket, key):
                 y, 
                 original_file_name, 
                 record_creation_time
-            ) if task_status_sns_topic_subscription_option != 'reject' else None
+            ))
+    
+        # result cache lookup: identical content, method, target and parameters give an identical result
+        with job_metrics.measure('cacheLookup'):
+            raw_data_object = s3_client.head_object(Bucket = bucket, Key = key)
+            result_cache_key = compute_result_cache_key(raw_data_object['ETag'], raw_data_object['ContentLength'], method, y, method_parameters, chart_data_size, resampled_data_format, execution_mode, resampled_data_content_encoding)
+            cached_result = get_cached_result(result_cache_table, result_cache_key)
+        raw_data = None
+        preflight_decision = 'accept'
+        if cached_result == None:
+            dataset_profile = profile_raw_data(job_metrics, bucket, key, raw_data_format, y, raw_data_object['ContentLength'], raw_data_object.get('ContentEncoding'), [(method, execution_mode)])
+            prediction_name = get_prediction_name(method, execution_mode)
+            if dataset_profile != None and prediction_name in dataset_profile['predictions']:
+                preflight_decision = dataset_profile['predictions'][prediction_name]['decision']
+            if preflight_decision == 'reject':
+                raise Exception(get_preflight_rejection_message(method, execution_mode, dataset_profile))
+            raw_data = read_raw_data(job_metrics, bucket, key, raw_data_format, y, raw_data_object['ContentLength'], raw_data_object.get('ContentEncoding'))
+        # the start email is sent before any worker process is forked
+        if overlap_stages:
+            with job_metrics.measure('startEmail'):
+                notification_outbox.flush()
         
+        # smaller data predicted to exceed the limits of the function is partitioned as well
+        if cached_result == None and method in partitioned_methods and (len(raw_data) >= partitioned_job_minimum_rows or preflight_decision == 'partition'):
+            # the partition workers and the finalizer of the job update the metadata from here on
+            with job_metrics.measure('partitionPlan', rows = len(raw_data)):
+                partitioned_job = plan_partitioned_job(metadata, raw_data, method_parameters, result_cache_key)
+            if partitioned_job != None:
+                # the metrics and profiles of the planning are recorded with the job, the finalizer adds its own metrics
+                start_partitioned_job(requestId, partitioned_job, get_current_timestamp('int'), {
+                    'resamplingMetrics': {'M': job_metrics.to_dynamodb()},
+                    'datasetProfile': {'M': to_dynamodb_numbers(dataset_profile)},
+                    'jobProfile': {'M': save_job_profile(job_metrics, s3_resampled_data_bucket_name)}
+                })
+                save_sns_outbox(metadata_table, notification_outbox)
+                return
+        
+        if cached_result != None:
+            resampling_start_time = get_current_timestamp('int')
+            with job_metrics.measure('cacheCopy'):
+                copy_cached_resampled_data(cached_result, s3_resampled_data_bucket_name, s3_resampled_data_object_key, s3_resampled_data_file_name, resampled_data_content_encoding)
+            resampling_end_time = get_current_timestamp('int')
+            chart_data_points = cached_result['chartDataPoints']
+            result_cache_hit = True
+            print('Result cache hit for request {}: reused the result of request {}'.format(request_id, cached_result['sourceRequestId']))
+        else:
             # resample
-            raw_data = pandas.read_csv(local_raw_data_file_path)
             resampling_start_time = get_current_timestamp('int')
-            resampled_data = methods[method](data = raw_data, y = y)
+            with job_metrics.measure('resample', method = method) as stage_metrics:
+                approximation_report = dict() if execution_mode == 'approximate' else None
+                resampled_data = resample_data(raw_data, method, y, method_parameters, execution_mode, approximation_report)
+                stage_metrics.update(rows = resampled_data.shape[0], columns = resampled_data.shape[1])
             resampling_end_time = get_current_timestamp('int')
-            resampled_data.to_csv(local_resampled_data_file_path, index = False)
-            
-            # chart visualization data computation
-            target_list_raw, density_list_raw = compute_kde_plot_data_points(raw_data, y, chart_data_size)
-            target_list_resampled, density_list_resampled = compute_kde_plot_data_points(resampled_data, y, chart_data_size)
-            chart_data_points = format_kde_plot_data_points(target_list_raw, density_list_raw, target_list_resampled, density_list_resampled)
             
             # resampled data s3 uploads
-            s3_client.upload_file(Bucket = s3_resampled_data_bucket_name, Key = s3_resampled_data_object_key, Filename = local_resampled_data_file_path)
+            resampled_data_upload = start_stage(overlap_stages, upload_resampled_data, resampled_data, s3_resampled_data_bucket_name, s3_resampled_data_object_key, s3_resampled_data_file_name, resampled_data_format, job_metrics, resampled_data_content_encoding)
             
-            # s3 download urls generation
+            # chart visualization data computation
+            with job_metrics.measure('chart', rows = len(raw_data) + len(resampled_data)):
+                target_list, density_list_raw, density_list_resampled = compute_kde_plot_data_points(raw_data, resampled_data, y, chart_data_size)
+                chart_data_points = format_kde_plot_data_points(target_list, density_list_raw, density_list_resampled)
+            resampled_data_upload.result()
+            
+            # result cache insertion
+            with job_metrics.measure('cacheInsert'):
+                put_cached_result(result_cache_table, result_cache_key, s3_resampled_data_bucket_name, s3_resampled_data_object_key, chart_data_points, request_id, record_expiration_time)
+        
+        # s3 download urls generation
+        with job_metrics.measure('presignedUrls'):
             get_raw_data_url = generate_presigned_url(s3_raw_data_bucket_name, s3_raw_data_object_key, s3_raw_data_file_name, 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
             get_resampled_data_url = generate_presigned_url(s3_resampled_data_bucket_name, s3_resampled_data_object_key, s3_resampled_data_file_name, 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
-            
-            # SNS email notification on resample complete
-            on_resample_complete_sns_publish_message_id = send_on_resample_complete_email(
+        
+        # SNS email notification on resample complete
+        if notify:
+            notification_outbox.add('onResampleCompleteSnsPublishMessageId', prepare_on_resample_complete_sns_publish(
                 task_status_sns_topic_arn, 
                 request_id, 
                 email, 
@@ -137,11 +248,12 @@ def resample(bucket, key):
                 resampling_end_time,
                 get_raw_data_url,
                 get_resampled_data_url
-            ) if task_status_sns_topic_subscription_option != 'reject' else None
-        # SNS email notification on resample fail
-        except Exception as e:
-            print(e)
-            on_resample_fail_sns_publish_message_id = send_on_resample_fail_email(
+            ))
+    # SNS email notification on resample fail
+    except Exception as e:
+        print(e)
+        if notify:
+            notification_outbox.add('onResampleFailSnsPublishMessageId', prepare_on_resample_fail_sns_publish(
                 task_status_sns_topic_arn, 
                 request_id, 
                 email, 
@@ -150,69 +262,509 @@ def resample(bucket, key):
                 original_file_name, 
                 record_creation_time,
                 str(e)
-            ) if task_status_sns_topic_subscription_option != 'reject' else None
+            ))
+    
+    job_profile = save_job_profile(job_metrics, s3_resampled_data_bucket_name)
+    
+    # metadata update
+    metadata_table.update_item(
+        ExpressionAttributeNames={
+            '#CDP': 'chartDataPoints',
+            '#RST': 'resamplingStartTime',
+            '#RET': 'resamplingEndTime',
+            '#RCH': 'resultCacheHit',
+            '#RM': 'resamplingMetrics',
+            '#DP': 'datasetProfile',
+            '#AR': 'approximationReport',
+            '#JP': 'jobProfile',
+            '#RV': 'recordVersion',
+        },
+        ExpressionAttributeValues={
+            ':cdp': {
+                'M': chart_data_points,
+            },
+            ':rst': {
+                'N': resampling_start_time,
+            },
+            ':ret': {
+                'N': resampling_end_time,
+            },
+            ':rch': {
+                'BOOL': result_cache_hit,
+            },
+            ':rm': {
+                'M': job_metrics.to_dynamodb(),
+            },
+            ':dp': {
+                'M': to_dynamodb_numbers(dataset_profile),
+            },
+            ':ar': {
+                'M': to_dynamodb_numbers(approximation_report),
+            },
+            ':jp': {
+                'M': job_profile,
+            },
+            ':rv': 1
+        },
+        Key={ 'requestId': requestId },
+        ReturnValues='NONE',
+        UpdateExpression='SET #CDP = :cdp, #RST = :rst, #RET = :ret, #RCH = :rch, #RM = :rm, #DP = :dp, #AR = :ar, #JP = :jp ADD #RV :rv',
+    )
+    # the job has ended for its clients, the notifications may still be published
+    with job_metrics.measure('notifications'):
+        save_sns_outbox(metadata_table, notification_outbox)
+
+# batch db updates: { batchResults, chartDataPoints, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, resamplingStartTime, resamplingEndTime, resultCacheHit, resamplingMetrics, datasetProfile, jobProfile, notificationOutbox, recordVersion }
+# datasetProfile: { rows, rowsEstimated, columns, columnTypes, target, predictions, ... }, see profile_raw_data()
+# resamplingMetrics: { totalMs, peakRssMb, stages: [{ stage, durationMs, peakRssMb, rows, columns, bytes, ... }, ...] }, see helper/job_metrics.py
+# batchResults: [{ method, label, executionMode, status, errorMessage, resamplingStartTime, resamplingEndTime, resultCacheHit, approximationReport, s3ResampledDataObjectKey, s3ResampledDataFileName }, ...]
+# the raw data is parsed once for all methods, and the chart holds one resampled density per completed method
+def resample_batch(bucket, key, metadata, job_metrics):
+    # data preparation
+    batch_methods = metadata['batchMethods']
+    method = ','.join(batch_method['method'] for batch_method in batch_methods)
+    y = metadata['y']
+    task_status_sns_topic_subscription_option = metadata['taskStatusSnsTopicSubscriptionOption']
+    original_file_name = metadata['originalFileName']
+    raw_data_format = get_data_file_format(metadata['originalFileNameSuffix'])
+    resampled_data_format = get_data_file_format(metadata.get('resampledFileNameSuffix', metadata['originalFileNameSuffix']))
+    resampled_data_content_encoding = metadata.get('resampledDataContentEncoding')
+    s3_raw_data_bucket_name = metadata['s3RawDataBucketName']
+    s3_raw_data_object_key = metadata['s3RawDataObjectKey']
+    s3_raw_data_file_name = metadata['s3RawDataFileName']
+    s3_resampled_data_bucket_name = metadata['s3ResampledDataBucketName']
+    request_id = metadata['requestId']
+    email = metadata['email']
+    chart_data_size = int(metadata['chartDataSize'])
+    task_status_sns_topic_arn = metadata['taskStatusSnsTopicArn']
+    record_creation_time = metadata['recordCreationTime']
+    record_expiration_time = metadata['recordExpirationTime']
+    
+    # dynamodb updated value initialization
+    chart_data_points = None
+    resampling_start_time = None
+    resampling_end_time = None
+    batch_results = list()
+    dataset_profile = None
+    # with several workers, the methods run in worker processes, those of a profiled job in the profiled one
+    worker_count = get_worker_count() if job_metrics.profiler is None else 1
+    # SNS email notifications are published in the background, and their message ids recorded after the metadata update
+    notification_outbox = SnsOutbox(request_id)
+    notify = task_status_sns_topic_subscription_option != 'reject'
+    
+    try:
+        # SNS email notification on resample start
+        if notify:
+            notification_outbox.add('onResampleStartSnsPublishMessageId', prepare_on_resample_start_sns_publish(
+                task_status_sns_topic_arn, 
+                request_id, 
+                email, 
+                method, 
+                y, 
+                original_file_name, 
+                record_creation_time
+            ))
         
-        # metadata update
-        metadata_table.update_item(
-            ExpressionAttributeNames={
-                '#CDP': 'chartDataPoints',
-                '#RST': 'resamplingStartTime',
-                '#RET': 'resamplingEndTime',
-                '#ORSMID': 'onResampleStartSnsPublishMessageId',
-                '#ORCMID': 'onResampleCompleteSnsPublishMessageId',
-                '#ORFMID': 'onResampleFailSnsPublishMessageId',
-            },
-            ExpressionAttributeValues={
-                ':cdp': {
-                    'L': chart_data_points,
-                },
-                ':rst': {
-                    'N': resampling_start_time,
-                },
-                ':ret': {
-                    'N': resampling_end_time,
-                },
-                ':orsmid': {
-                    'S': on_resample_start_sns_publish_message_id,
-                },
-                ':orcmid': {
-                    'S': on_resample_complete_sns_publish_message_id,
-                },
-                ':orfmid': {
-                    'S': on_resample_fail_sns_publish_message_id,
-                }
+        # raw data is parsed once for the whole batch
+        raw_data_object = s3_client.head_object(Bucket = bucket, Key = key)
+        dataset_profile = profile_raw_data(job_metrics, bucket, key, raw_data_format, y, raw_data_object['ContentLength'], raw_data_object.get('ContentEncoding'), [(batch_method['method'], batch_method.get('executionMode', 'exact')) for batch_method in batch_methods])
+        raw_data = read_raw_data(job_metrics, bucket, key, raw_data_format, y, raw_data_object['ContentLength'], raw_data_object.get('ContentEncoding'))
+        # the start email is sent before any worker process is forked
+        if worker_count > 1:
+            with job_metrics.measure('startEmail'):
+                notification_outbox.flush()
+        resampling_start_time = get_current_timestamp('int')
+        resampled_targets = dict()
+        
+        # cached results are copied, the other methods are resampled afterwards
+        pending_batch_methods = list()
+        for batch_method in batch_methods:
+            batch_result = {
+                'method': batch_method['method'],
+                'label': batch_method['label'],
+                'executionMode': batch_method.get('executionMode', 'exact'),
+                'status': 'failed',
+                'errorMessage': None,
+                'resamplingStartTime': get_current_timestamp('int'),
+                'resamplingEndTime': None,
+                'resultCacheHit': False,
+                'approximationReport': None,
+                's3ResampledDataObjectKey': batch_method['s3ResampledDataObjectKey'],
+                's3ResampledDataFileName': batch_method['s3ResampledDataFileName']
+            }
+            batch_results.append(batch_result)
+            # a failing method does not fail the other methods of the batch
+            try:
+                method_parameters = from_dynamodb_method_parameters(batch_method['parameters'])
+                result_cache_key = compute_result_cache_key(raw_data_object['ETag'], raw_data_object['ContentLength'], batch_method['method'], y, method_parameters, chart_data_size, resampled_data_format, batch_result['executionMode'], resampled_data_content_encoding)
+                with job_metrics.measure('cacheLookup', label = batch_method['label']):
+                    cached_result = get_cached_result(result_cache_table, result_cache_key)
+                if cached_result != None:
+                    with job_metrics.measure('cacheCopy', label = batch_method['label']):
+                        copy_cached_resampled_data(cached_result, s3_resampled_data_bucket_name, batch_method['s3ResampledDataObjectKey'], batch_method['s3ResampledDataFileName'], resampled_data_content_encoding)
+                        resampled_data = read_dataset_from_s3(s3_client, cached_result['s3ResampledDataBucketName'], cached_result['s3ResampledDataObjectKey'], resampled_data_format, content_encoding = resampled_data_content_encoding)
+                    batch_result['resultCacheHit'] = True
+                    resampled_targets[batch_method['label']] = resampled_data[y]
+                    batch_result['status'] = 'completed'
+                # the methods of a batch share one invocation, so a method predicted to exceed its limits is not run at all
+                elif dataset_profile != None and dataset_profile['predictions'].get(get_prediction_name(batch_method['method'], batch_result['executionMode']), {}).get('decision', 'accept') != 'accept':
+                    raise Exception(get_preflight_rejection_message(batch_method['method'], batch_result['executionMode'], dataset_profile))
+                else:
+                    pending_batch_methods.append((batch_method, batch_result, method_parameters, result_cache_key))
+            except Exception as e:
+                print(e)
+                batch_result['errorMessage'] = str(e)
+            batch_result['resamplingEndTime'] = get_current_timestamp('int')
+        
+        # one worker process per method, the methods overlap so the stage covers all of them
+        with job_metrics.measure('resample', method = ','.join(batch_method['method'] for batch_method, batch_result, method_parameters, result_cache_key in pending_batch_methods)):
+            resampled_results = run_in_processes([
+                (resample_data_of_batch_method, (raw_data, batch_method['method'], y, method_parameters, batch_result['executionMode'])) for batch_method, batch_result, method_parameters, result_cache_key in pending_batch_methods
+            ], worker_count, initialize_worker_process)
+        for (batch_method, batch_result, method_parameters, result_cache_key), (resampled_data, error_message, method_resampling_start_time, approximation_report) in zip(pending_batch_methods, resampled_results):
+            batch_result['resamplingStartTime'] = method_resampling_start_time
+            batch_result['approximationReport'] = to_dynamodb_numbers(approximation_report)
+            try:
+                if error_message != None:
+                    raise Exception(error_message)
+                upload_resampled_data(resampled_data, s3_resampled_data_bucket_name, batch_method['s3ResampledDataObjectKey'], batch_method['s3ResampledDataFileName'], resampled_data_format, job_metrics, resampled_data_content_encoding)
+                # cache the method's own chart, so that a single-method request can reuse this result as well
+                with job_metrics.measure('chart', label = batch_method['label'], rows = len(raw_data) + len(resampled_data)):
+                    target_list, density_list_raw, density_list_resampled = compute_kde_plot_data_points(raw_data, resampled_data, y, chart_data_size)
+                put_cached_result(result_cache_table, result_cache_key, s3_resampled_data_bucket_name, batch_method['s3ResampledDataObjectKey'], format_kde_plot_data_points(target_list, density_list_raw, density_list_resampled), request_id, record_expiration_time)
+                resampled_targets[batch_method['label']] = resampled_data[y]
+                batch_result['status'] = 'completed'
+            except Exception as e:
+                print(e)
+                batch_result['errorMessage'] = str(e)
+            batch_result['resamplingEndTime'] = get_current_timestamp('int')
+        
+        resampling_end_time = get_current_timestamp('int')
+        if len(resampled_targets) == 0:
+            raise Exception('All methods of the batch failed! ' + ' '.join('{}: {}'.format(batch_result['label'], batch_result['errorMessage']) for batch_result in batch_results))
+        # densities in batch order
+        resampled_targets = {batch_result['label']: resampled_targets[batch_result['label']] for batch_result in batch_results if batch_result['label'] in resampled_targets}
+        
+        # chart visualization data computation, one pass for all densities
+        with job_metrics.measure('chart', rows = len(raw_data) + sum(len(resampled_target) for resampled_target in resampled_targets.values())):
+            target_list, density_lists = compute_kde_on_shared_grid([raw_data[y]] + list(resampled_targets.values()), chart_data_size)
+            density_names = [CHART_DATA_RAW_DENSITY_NAME] + ['{} ({})'.format(CHART_DATA_RESAMPLED_DENSITY_NAME, label) for label in resampled_targets]
+            chart_data_points = pack_kde_plot_data_points(target_list, dict(zip(density_names, density_lists)))
+        
+        # s3 download urls generation
+        with job_metrics.measure('presignedUrls'):
+            get_raw_data_url = generate_presigned_url(s3_raw_data_bucket_name, s3_raw_data_object_key, s3_raw_data_file_name, 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
+            get_resampled_data_urls = '\n    '.join('{}: {}'.format(
+                batch_result['label'],
+                generate_presigned_url(s3_resampled_data_bucket_name, batch_result['s3ResampledDataObjectKey'], batch_result['s3ResampledDataFileName'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time)) if batch_result['status'] == 'completed' else 'failed - ' + batch_result['errorMessage']
+            ) for batch_result in batch_results)
+        
+        # SNS email notification on resample complete
+        if notify:
+            notification_outbox.add('onResampleCompleteSnsPublishMessageId', prepare_on_resample_complete_sns_publish(
+                task_status_sns_topic_arn, 
+                request_id, 
+                email, 
+                method, 
+                y, 
+                original_file_name, 
+                record_creation_time, 
+                record_expiration_time, 
+                resampling_start_time, 
+                resampling_end_time,
+                get_raw_data_url,
+                get_resampled_data_urls
+            ))
+    # SNS email notification on resample fail
+    except Exception as e:
+        print(e)
+        if notify:
+            notification_outbox.add('onResampleFailSnsPublishMessageId', prepare_on_resample_fail_sns_publish(
+                task_status_sns_topic_arn, 
+                request_id, 
+                email, 
+                method, 
+                y, 
+                original_file_name, 
+                record_creation_time,
+                str(e)
+            ))
+    
+    job_profile = save_job_profile(job_metrics, s3_resampled_data_bucket_name)
+    
+    # metadata update
+    metadata_table.update_item(
+        ExpressionAttributeNames={
+            '#BR': 'batchResults',
+            '#CDP': 'chartDataPoints',
+            '#RST': 'resamplingStartTime',
+            '#RET': 'resamplingEndTime',
+            '#RCH': 'resultCacheHit',
+            '#RM': 'resamplingMetrics',
+            '#DP': 'datasetProfile',
+            '#JP': 'jobProfile',
+            '#RV': 'recordVersion',
+        },
+        ExpressionAttributeValues={
+            ':br': {
+                'L': batch_results,
             },
-            Key={ 'requestId': requestId },
-            ReturnValues='NONE',
-            UpdateExpression='SET #CDP = :cdp, #RST = :rst, #RET = :ret, #ORSMID = :orsmid, #ORCMID = :orcmid, #ORFMID = :orfmid',
+            ':cdp': {
+                'M': chart_data_points,
+            },
+            ':rst': {
+                'N': resampling_start_time,
+            },
+            ':ret': {
+                'N': resampling_end_time if chart_data_points != None else None,
+            },
+            ':rch': {
+                'BOOL': len(batch_results) > 0 and all(batch_result['resultCacheHit'] for batch_result in batch_results),
+            },
+            ':rm': {
+                'M': job_metrics.to_dynamodb(),
+            },
+            ':dp': {
+                'M': to_dynamodb_numbers(dataset_profile),
+            },
+            ':jp': {
+                'M': job_profile,
+            },
+            ':rv': 1
+        },
+        Key={ 'requestId': request_id },
+        ReturnValues='NONE',
+        UpdateExpression='SET #BR = :br, #CDP = :cdp, #RST = :rst, #RET = :ret, #RCH = :rch, #RM = :rm, #DP = :dp, #JP = :jp ADD #RV :rv',
+    )
+    with job_metrics.measure('notifications'):
+        save_sns_outbox(metadata_table, notification_outbox)
+
+# uploads the profile of a profiled job next to its resampled data, a profile that cannot be saved does not fail the job
+def save_job_profile(job_metrics, bucket_name):
+    if job_metrics.profiler is None:
+        return None
+    try:
+        return job_metrics.profiler.save(s3_client, bucket_name)
+    except Exception as e:
+        print('Could not save the profile of request {}: {}'.format(job_metrics.request_id, e))
+        return None
+
+# the methods rename the columns of the data frame they are given, so they get a shallow copy of the raw data
+# approximation_report: filled in by an approximate run, see helper/approximate_methods.py
+def resample_data(raw_data, method, y, method_parameters, execution_mode = 'exact', approximation_report = None):
+    worker_count = get_worker_count()
+    if execution_mode == 'approximate':
+        resampled_data = resample_approximately(method, methods[method], raw_data, y, method_parameters, worker_count, approximation_report)
+    elif method in partitioned_methods and worker_count > 1:
+        resampled_data = resample_partitioned(methods[method], raw_data, y, method_parameters, worker_count)
+    else:
+        resampled_data = methods[method](data = raw_data.copy(deep = False), y = y, **method_parameters)
+    # neighbour graphs computed by this run are kept for later runs on the same data
+    save_neighbour_indexes()
+    return resampled_data
+
+# returns (resampled data, None, start time, approximation report) or (None, error message, start time, None), so that a failing method does not fail the others
+def resample_data_of_batch_method(raw_data, method, y, method_parameters, execution_mode):
+    resampling_start_time = get_current_timestamp('int')
+    approximation_report = dict() if execution_mode == 'approximate' else None
+    try:
+        return resample_data(raw_data, method, y, method_parameters, execution_mode, approximation_report), None, resampling_start_time, approximation_report
+    except Exception as e:
+        print(e)
+        return None, str(e), resampling_start_time, None
+
+# AWS clients keep pooled connections, which a forked worker process must not share with its parent
+def initialize_worker_process():
+    reset_clients()
+
+# pre-flight: a profile of the raw data from a sample read through range GETs (see helper/dataset_profile.py), with the predicted cost of every method:
+# predictions: { method, or 'method (approximate)': { predictedSeconds, predictedPeakMemoryMb, decision } }, see helper/method_cost_model.py
+# decision: accept, partition for a method of partitioned_methods predicted to exceed the limits of the function in one piece, or reject
+# method_modes: [(method, executionMode), ...]
+# raises when the target cannot be resampled, returns None when profiling is disabled or the sample cannot be parsed
+def profile_raw_data(job_metrics, bucket, key, data_format, y, content_length, content_encoding, method_modes):
+    if not preflight_profiling:
+        return None
+    with job_metrics.measure('profile') as stage_metrics:
+        try:
+            profile = profile_dataset(s3_client, bucket, key, data_format, y, content_length, content_encoding)
+        except Exception as e:
+            # e.g. a quoted line break cut by the end of the sample, the read then checks the data as before
+            print('Could not profile object {} from bucket {}: {}'.format(key, bucket, e))
+            return None
+        stage_metrics.update(rows = profile['rows'], columns = profile['columns'], bytes = profile['bytesRead'])
+    validate_target(profile)
+    limits = get_cost_limits()
+    profile['predictions'] = dict()
+    for method, execution_mode in method_modes:
+        if execution_mode == 'approximate':
+            prediction = predict_method_cost(method, profile['rows'], profile['columns'] - 1, APPROXIMATE_PARTITION_ROWS[method], APPROXIMATE_VALIDATION_ROWS[method])
+        else:
+            prediction = predict_method_cost(method, profile['rows'], profile['columns'] - 1)
+        if prediction is None:
+            continue
+        if not is_over_cost_limits(prediction, limits):
+            decision = 'accept'
+        elif method in partitioned_methods:
+            decision = 'partition'
+        else:
+            decision = 'reject'
+        profile['predictions'][get_prediction_name(method, execution_mode)] = dict(prediction, decision = decision)
+    print('Profiled object {} from bucket {}: {}{} rows, {} columns, predictions {}'.format(key, bucket, 'about ' if profile['rowsEstimated'] else '', profile['rows'], profile['columns'], profile['predictions']))
+    return profile
+
+def get_prediction_name(method, execution_mode):
+    return method if execution_mode == 'exact' else '{} ({})'.format(method, execution_mode)
+
+def get_preflight_rejection_message(method, execution_mode, profile):
+    prediction = profile['predictions'][get_prediction_name(method, execution_mode)]
+    limits = get_cost_limits()
+    # an exact run that is too slow may still fit approximately
+    hint = 'a faster method'
+    if execution_mode == 'exact' and method in APPROXIMATE_PARTITION_ROWS:
+        hint = 'executionMode approximate'
+    return 'Method {} on {}{} rows and {} columns is predicted to take {:g} seconds and {:g} MB, beyond the {:g} seconds and {:g} MB of the resampling function! Please use a smaller data set or {}!'.format(
+        get_prediction_name(method, execution_mode),
+        'about ' if profile['rowsEstimated'] else '',
+        profile['rows'],
+        profile['columns'],
+        prediction['predictedSeconds'],
+        prediction['predictedPeakMemoryMb'],
+        limits['timeoutSeconds'],
+        limits['memorySizeMb'],
+        hint
+    )
+
+def read_raw_data(job_metrics, bucket, key, data_format, y, content_length, content_encoding = None):
+    with job_metrics.measure('read', bytes = content_length) as stage_metrics:
+        raw_data = read_dataset_from_s3(s3_client, bucket, key, data_format, is_downcast_enabled(), [y], content_length, content_encoding)
+        stage_metrics.update(rows = raw_data.shape[0], columns = raw_data.shape[1])
+    return raw_data
+
+# the data is written straight into the upload, which sends its parts while the rest is written
+# job_metrics: the upload, writing included, is measured as a stage of the job when given
+# content_encoding: the Content-Encoding to store the data with, compressed, which browsers undo on download
+def upload_resampled_data(resampled_data, bucket_name, object_key, file_name, data_format, job_metrics = None, content_encoding = None):
+    with measure_stage(job_metrics, 'upload', rows = resampled_data.shape[0], columns = resampled_data.shape[1], format = data_format) as stage_metrics:
+        transfer = upload_written_object(
+            s3_client,
+            bucket_name,
+            object_key,
+            lambda file: write_dataset(resampled_data, file, data_format, content_encoding),
+            int(resampled_data.memory_usage(index = False).sum()),
+            get_object_content_headers(file_name, content_encoding)
         )
-    # delete the files afterwards
-    finally:
-        if local_raw_data_file_path != None and os.path.exists(local_raw_data_file_path):
-            os.remove(local_raw_data_file_path)
-        if local_resampled_data_file_path != None and os.path.exists(local_resampled_data_file_path):
-            os.remove(local_resampled_data_file_path)
-    
-def compute_kde_plot_data_points(data, y, chart_data_size = 200):
-    ax = seaborn.kdeplot(data[y], gridsize = chart_data_size)
-    line = ax.lines[len(ax.lines) - 1]
-    target_list, density_list = line.get_data()
-    return target_list, density_list
-
-def format_kde_plot_data_points(target_list_raw, density_list_raw, target_list_resampled, density_list_resampled):
-    target_min = min(min(target_list_raw), min(target_list_resampled))
-    target_max = max(max(target_list_raw), max(target_list_resampled))
-    target_range = target_max - target_min
-    chart_data_size = len(target_list_raw)
-    result = list()
-    for index, (density_raw, density_resampled) in enumerate(zip(density_list_raw, density_list_resampled)):
-        result.append({
-            'Target Variable': Decimal(str(target_min + index * (target_range / (chart_data_size - 1)))),
-            'Raw Density': Decimal(str(density_raw)),
-            'Resampled Density': Decimal(str(density_resampled))
-        })
-    return result
+        stage_metrics['bytes'] = transfer['bytes']
+    print('Uploaded object {} to bucket {}: {:.1f} MB at {} MB/s'.format(object_key, bucket_name, transfer['bytes'] / 1024 / 1024, transfer['throughputMbPerSecond']))
+
+# cached resampled data is copied within s3, so that it expires together with the new record
+def copy_cached_resampled_data(cached_result, bucket_name, object_key, file_name, content_encoding = None):
+    s3_client.copy_object(
+        Bucket = bucket_name, 
+        Key = object_key, 
+        CopySource = {'Bucket': cached_result['s3ResampledDataBucketName'], 'Key': cached_result['s3ResampledDataObjectKey']},
+        MetadataDirective = 'REPLACE',
+        **get_object_content_headers(file_name, content_encoding)
+    )
+
+# the content type of the file name, and the Content-Encoding of compressed content
+def get_object_content_headers(file_name, content_encoding = None):
+    content_headers = {'ContentType': get_content_type(file_name)}
+    if content_encoding != None:
+        content_headers['ContentEncoding'] = content_encoding
+    return content_headers
+    
+# raw and resampled densities share one evaluation grid spanning both supports
+def compute_kde_plot_data_points(raw_data, resampled_data, y, chart_data_size = 200):
+    target_list, (density_list_raw, density_list_resampled) = compute_kde_on_shared_grid([raw_data[y], resampled_data[y]], chart_data_size)
+    return target_list, density_list_raw, density_list_resampled
+
+def format_kde_plot_data_points(target_list, density_list_raw, density_list_resampled):
+    return pack_kde_plot_data_points(target_list, {
+        CHART_DATA_RAW_DENSITY_NAME: density_list_raw,
+        CHART_DATA_RESAMPLED_DENSITY_NAME: density_list_resampled
+    })
+
+# packed chart layout (version 2), see helper/chart_data.py
+def pack_kde_plot_data_points(target_list, density_lists):
+    return {
+        'version': CHART_DATA_VERSION,
+        'size': len(target_list),
+        'targetMin': Decimal(str(target_list[0])),
+        'targetMax': Decimal(str(target_list[-1])),
+        'densityEncoding': CHART_DATA_DENSITY_ENCODING,
+        'densities': {name: pack_density_values(density_list) for name, density_list in density_lists.items()}
+    }
+
+def pack_density_values(density_list):
+    import numpy
+    density_list = numpy.asarray(density_list, dtype = numpy.float64)
+    density_max = float(density_list.max()) if density_list.size > 0 else 0.0
+    scale = density_max / CHART_DATA_DENSITY_QUANTIZATION_LEVELS if density_max > 0 else 1.0
+    values = numpy.rint(density_list / scale).astype('<u2')
+    return {
+        'scale': Decimal(repr(scale)),
+        'values': base64.b64encode(values.tobytes()).decode('ascii')
+    }
+    
+
+# runs every job of an S3 event, or of a batch of messages from a queue: the jobs of the priority lane first, smallest first,
+# then the large jobs, which a batch of the intake queue forwards to the large job queue instead, see helper/job_queue.py
+# returns the messages whose jobs failed or did not start, for the queue to deliver again: { batchItemFailures: [{ itemIdentifier }, ...] }
+# raises the first error of a direct S3 event, after all its jobs have run
+def resample_jobs(event, context = None):
+    start_time = time.perf_counter()
+    jobs = get_job_records(event)
+    small_jobs, large_jobs = split_job_lanes(jobs, small_job_maximum_bytes)
+    # message id -> jobs of the message not done yet, a message is deleted once all its jobs are done
+    pending_jobs = collections.Counter(job['message']['messageId'] for job in jobs if job['message'] != None)
+    messages = {job['message']['messageId']: job['message'] for job in jobs if job['message'] != None}
+    failed_message_ids = set()
+    errors = list()
+    
+    def end_job(job, succeeded):
+        if job['message'] is None:
+            return
+        message_id = job['message']['messageId']
+        pending_jobs[message_id] -= 1
+        if not succeeded:
+            failed_message_ids.add(message_id)
+        elif pending_jobs[message_id] == 0 and message_id not in failed_message_ids:
+            delete_message(sqs_client, job['message'])
+    
+    forwarded_jobs = [job for job in large_jobs if large_job_queue_url != None and job['message'] != None and not is_same_queue(job['message']['eventSourceARN'], large_job_queue_url)]
+    if len(forwarded_jobs) > 0:
+        # only the messages of the jobs that were not sent are delivered again, so that the sent jobs do not run twice
+        failed_forwarded_jobs = forward_jobs(sqs_client, large_job_queue_url, forwarded_jobs)
+        for job in forwarded_jobs:
+            end_job(job, not any(job is failed_job for failed_job in failed_forwarded_jobs))
+    
+    run_jobs = small_jobs + [job for job in large_jobs if not any(job is forwarded_job for forwarded_job in forwarded_jobs)]
+    for job in run_jobs:
+        # a job that fails returns its message to the queue, so the other jobs of the message run again with it anyway
+        if job['message'] != None and (job['message']['messageId'] in failed_message_ids or (context != None and context.get_remaining_time_in_millis() < intake_minimum_remaining_seconds * 1000)):
+            end_job(job, False)
+            continue
+        try:
+            resample(job['bucket'], job['key'])
+            end_job(job, True)
+        except Exception as e:
+            print('Could not resample object {} from bucket {}: {}'.format(job['key'], job['bucket'], e))
+            end_job(job, False)
+            errors.append(e)
     
+    print(json.dumps({
+        'metric': 'resamplingIntake',
+        'jobs': len(jobs),
+        'smallJobs': len(small_jobs),
+        'forwardedJobs': len(forwarded_jobs),
+        'failedMessages': len(failed_message_ids),
+        'durationMs': round((time.perf_counter() - start_time) * 1000, 1)
+    }))
+    if len(messages) > 0:
+        return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in messages if message_id in failed_message_ids]}
+    if len(errors) > 0:
+        raise errors[0]
 
 def lambda_handler(event, context):
     '''Provide an event that contains the following keys:
@@ -221,7 +773,17 @@ def lambda_handler(event, context):
         operation being performed
     '''
     
-    bucket = event['Records'][0]['s3']['bucket']['name']
-    key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'], encoding='utf-8')
+    # the partition workers of a partitioned job are invoked with the partition instead of an S3 event
+    if 'partitionedJob' in event:
+        return resample_job_partition(event['partitionedJob']['requestId'], int(event['partitionedJob']['partition']))
+    # notifications a job could not publish are published again when the function is invoked with the request,
+    # or with none by the schedule of the stack, which publishes those of every record that saved some
+    if 'notificationOutbox' in event:
+        if event['notificationOutbox'].get('requestId') is None:
+            return dispatch_saved_sns_outboxes(metadata_table)
+        return dispatch_saved_sns_outbox(metadata_table, event['notificationOutbox']['requestId'])
+    # the partition failure queue is the onFailure destination of the partition workers, even of those ended by a timeout
+    if len(event.get('Records', [])) > 0 and is_same_queue(event['Records'][0].get('eventSourceARN'), partition_failure_queue_url):
+        return fail_partition_invocations(event)
     
-    resample(bucket, key)
+    return resample_jobs(event, context)
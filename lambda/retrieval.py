@@ -1,20 +1,23 @@
-import boto3 
-from boto3.dynamodb.conditions import Key, Attr
-from helper.s3_presigned_url import generate_presigned_url
-from helper.lambda_http import extract_request_body, generate_lambda_proxy_success_response, generate_lambda_proxy_exception_response
+from helper.s3_presigned_url import generate_presigned_url, PRESIGNED_URL_CACHE_MAXIMUM_AGE_SECONDS
+from helper.lambda_http import extract_request_body, get_request_header, accepts_compressed_response, generate_lambda_proxy_success_response, generate_lambda_proxy_not_modified_response, generate_lambda_proxy_exception_response
 from helper.dynamodb import remove_dynamodb_item_types
+from helper.chart_data import unpack_chart_data_points
 from helper.datetime_converter import get_presigned_url_expires_in_maximum_seconds
+from helper.aws_clients import lazy_resource, lazy_table
+from helper.lazy_import import lazy_function
 import os
+import time
 
-# Create the DynamoDB resource
-metadata_table = boto3.resource('dynamodb').Table(os.environ['metadataTableName'])
-# Create S3 client
-s3_client = boto3.client('s3')
-# Create SNS client
-sns_client = boto3.client('sns')
+# the DynamoDB resource and table, see helper/aws_clients.py
+dynamodb_resource = lazy_resource('dynamodb')
+metadata_table = lazy_table(os.environ['metadataTableName'])
+# the condition builders import boto3, which is otherwise imported with the first client
+Key = lazy_function('boto3.dynamodb.conditions', 'Key')
+Attr = lazy_function('boto3.dynamodb.conditions', 'Attr')
 
-# db fields: { requestId, email, method, y, chartDataSize, chartDataPoints, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, originalFileName, originalFileNameSuffix, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime, resamplingStartTime, resamplingEndTime }
-# inputs: { requestId, email }
+# db fields: { requestId, email, method, methodParameters, executionMode, batchMethods, batchResults, y, chartDataSize, chartDataPoints, taskStatusSnsTopicArn, taskStatusSnsTopicSubscriptionOption, taskStatusSnsTopicSubscriptionArn, onResampleStartSnsPublishMessageId, onResampleCompleteSnsPublishMessageId, onResampleFailSnsPublishMessageId, originalFileName, originalFileNameSuffix, resampledFileNameSuffix, resampledDataContentEncoding, s3RawDataBucketName, s3RawDataObjectKey, s3RawDataFileName, s3ResampledDataBucketName, s3ResampledDataObjectKey, s3ResampledDataFileName, recordCreationTime, recordExpirationTime, resamplingStartTime, resamplingEndTime, resultCacheHit, resamplingMetrics, partitionedJob, partitionedJobStatus, completedPartitions, partitionAttempts, partitionedJobEndClaimTime, notificationOutbox, datasetProfile, approximationReport, profiling, jobProfile, recordVersion }
+# inputs: { requestId, email, chartDataFormat (optional: 'points' by default for the legacy list of points, or 'packed'), ifNoneMatch (optional: the etag of an earlier response) }
+# returns the record with download urls and its etag, or only { notModified, etag } when the etag matches ifNoneMatch
 def retrieve(payload):
     # metadata preparation
     payload['requestId'] = payload['requestId'].strip().lower()
@@ -22,6 +25,7 @@ def retrieve(payload):
     
     request_id = payload['requestId']
     email = payload['email']
+    chart_data_format = get_chart_data_format(payload)
     
     # metadata retrieval
     metadata = metadata_table.query(
@@ -35,14 +39,187 @@ def retrieve(payload):
     
     record_expiration_time = metadata['recordExpirationTime']
     
+    # a record that has not changed since the client's copy is neither unwrapped nor signed again
+    etag = get_record_etag(metadata, chart_data_format)
+    if is_etag_matched(etag, payload.get('ifNoneMatch')):
+        return {'notModified': True, 'etag': etag}
+    
     # s3 download urls generation and request respond
     response_body = remove_dynamodb_item_types(metadata)
+    if chart_data_format == 'points':
+        response_body['chartDataPoints'] = unpack_chart_data_points(response_body['chartDataPoints'])
     response_body.update({
         'getPresignedUrlRaw': None if response_body['resamplingStartTime'] == None else generate_presigned_url(metadata['s3RawDataBucketName'], metadata['s3RawDataObjectKey'], metadata['s3RawDataFileName'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time)),
-        'getPresignedUrlResampled': None if response_body['resamplingEndTime'] == None else generate_presigned_url(metadata['s3ResampledDataBucketName'], metadata['s3ResampledDataObjectKey'], metadata['s3ResampledDataFileName'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
+        'getPresignedUrlResampled': None if response_body['resamplingEndTime'] == None or metadata['s3ResampledDataObjectKey'] == None else generate_presigned_url(metadata['s3ResampledDataBucketName'], metadata['s3ResampledDataObjectKey'], metadata['s3ResampledDataFileName'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
     })
+    # profiled jobs: download urls of the pstats file and of the report, see helper/job_profiler.py
+    if response_body['jobProfile'] != None:
+        response_body['jobProfile'].update({
+            'getPresignedUrlProfileStats': generate_presigned_url(metadata['s3ResampledDataBucketName'], response_body['jobProfile']['s3ProfileStatsObjectKey'], response_body['jobProfile']['s3ProfileStatsObjectKey'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time)),
+            'getPresignedUrlProfileReport': generate_presigned_url(metadata['s3ResampledDataBucketName'], response_body['jobProfile']['s3ProfileReportObjectKey'], response_body['jobProfile']['s3ProfileReportObjectKey'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
+        })
+    # batch requests: per-method status and download urls
+    for batch_result in response_body['batchResults'] or []:
+        batch_result['getPresignedUrlResampled'] = None if batch_result['status'] != 'completed' else generate_presigned_url(metadata['s3ResampledDataBucketName'], batch_result['s3ResampledDataObjectKey'], batch_result['s3ResampledDataFileName'], 'get', get_presigned_url_expires_in_maximum_seconds(record_expiration_time))
+    response_body['etag'] = etag
     return response_body
 
+# clients that do not ask for a format, such as the UI, read the legacy list of points
+def get_chart_data_format(payload):
+    chart_data_format = (payload.get('chartDataFormat') or 'points').strip().lower()
+    if chart_data_format not in ('packed', 'points'):
+        raise Exception('Invalid chartDataFormat {}! Should be either of packed or points!'.format(chart_data_format))
+    return chart_data_format
+
+# every update of a record increments its recordVersion, records of older versions of request.py have none
+# the download urls of a response expire with the credentials that signed them, so the etag also changes with every period of
+# PRESIGNED_URL_CACHE_MAXIMUM_AGE_SECONDS, and a client polling with it gets urls signed at most two periods before
+def get_record_etag(metadata, chart_data_format):
+    presigned_url_period = int(time.time() // PRESIGNED_URL_CACHE_MAXIMUM_AGE_SECONDS)
+    return '"{}-{}-{}-{}"'.format(metadata['requestId'], int(metadata.get('recordVersion', 0)), presigned_url_period, chart_data_format)
+
+# if_none_match: one etag, several separated by commas, or *
+def is_etag_matched(etag, if_none_match):
+    if if_none_match is None:
+        return False
+    etags = [tag.strip() for tag in if_none_match.split(',')]
+    # the weak comparison of If-None-Match
+    return '*' in etags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in etags]
+
+# a long poll returns after at most this many seconds, within the 15 second timeout of the default function
+WAIT_MAXIMUM_SECONDS = 10
+# the record is read again after this delay, which grows by WAIT_DELAY_GROWTH up to WAIT_MAXIMUM_DELAY_SECONDS
+WAIT_INITIAL_DELAY_SECONDS = 0.25
+WAIT_MAXIMUM_DELAY_SECONDS = 2
+WAIT_DELAY_GROWTH = 1.5
+# the fields that tell whether a job has started or ended
+WAIT_FIELDS = ('requestId', 'email', 'resamplingStartTime', 'resamplingEndTime', 'onResampleFailSnsPublishMessageId', 'partitionedJobStatus')
+# the clock of the long polls, local tests replace it with a virtual one
+sleep = time.sleep
+monotonic = time.monotonic
+
+# inputs: { requestId, email, timeoutSeconds (optional: at most and by default WAIT_MAXIMUM_SECONDS), chartDataFormat and ifNoneMatch (optional, see retrieve) }
+# returns what retrieve returns as soon as the job ends or its status changes, or { requestId, status, timedOut } if neither happens in time
+def wait_for_completion(payload):
+    request_id = payload['requestId'].strip().lower()
+    email = payload['email'].strip().lower()
+    timeout_seconds = max(0, min(float(payload.get('timeoutSeconds', WAIT_MAXIMUM_SECONDS)), WAIT_MAXIMUM_SECONDS))
+    deadline = monotonic() + timeout_seconds
+    projection_names = {'#F{}'.format(index): field for index, field in enumerate(WAIT_FIELDS)}
+    initial_status = None
+    delay = WAIT_INITIAL_DELAY_SECONDS
+    while True:
+        item = metadata_table.get_item(
+            Key={ 'requestId': request_id },
+            ProjectionExpression=', '.join(projection_names),
+            ExpressionAttributeNames=projection_names
+        ).get('Item')
+        if item is None or item['email'] != email:
+            raise Exception("Record with requestId {} and email {} does not exist!".format(request_id, email))
+        status = get_job_status(item)
+        initial_status = initial_status or status
+        if status in ('completed', 'failed') or status != initial_status:
+            return retrieve(payload)
+        remaining_seconds = deadline - monotonic()
+        if remaining_seconds <= 0:
+            return {'requestId': request_id, 'status': status, 'timedOut': True}
+        sleep(min(delay, remaining_seconds))
+        delay = min(delay * WAIT_DELAY_GROWTH, WAIT_MAXIMUM_DELAY_SECONDS)
+
+# BatchGetItem reads at most this many items per call
+BATCH_GET_ITEM_MAXIMUM_KEY_COUNT = 100
+# a status request covers at most this many jobs
+STATUS_MAXIMUM_REQUEST_COUNT = 200
+# unprocessed keys are requested again this often, with exponential backoff
+BATCH_GET_ITEM_MAXIMUM_RETRIES = 5
+BATCH_GET_ITEM_RETRY_BASE_DELAY_SECONDS = 0.05
+# the small fields that tell how far a job is, without the chart data
+STATUS_FIELDS = ('requestId', 'email', 'method', 'batchResults', 'resamplingStartTime', 'resamplingEndTime', 'resultCacheHit', 'partitionedJob', 'partitionedJobStatus', 'completedPartitions')
+# fields of batchResults entries returned with the status
+STATUS_BATCH_RESULT_FIELDS = ('method', 'label', 'status', 'errorMessage')
+
+# inputs: { requests: [{ requestId, email }, ...], includeChartData (optional: false by default), chartDataFormat (optional, see retrieve) }
+# returns: { statuses: [{ requestId, status, method, resamplingStartTime, resamplingEndTime, resultCacheHit, batchResults, completedPartitionCount, partitionCount, chartDataPoints (with includeChartData) }, ...] }
+#   in the order of the requests, status is one of pending, running, completed, failed or not found
+def retrieve_statuses(payload):
+    requests = payload.get('requests')
+    if not isinstance(requests, list) or len(requests) < 1 or len(requests) > STATUS_MAXIMUM_REQUEST_COUNT:
+        raise Exception('Invalid requests! Should be a list of 1 to {} requestId and email pairs!'.format(STATUS_MAXIMUM_REQUEST_COUNT))
+    requests = [(request['requestId'].strip().lower(), request['email'].strip().lower()) for request in requests]
+    include_chart_data = payload.get('includeChartData', False) == True
+    chart_data_format = get_chart_data_format(payload)
+    
+    items = batch_get_metadata_items([request_id for request_id, email in requests], STATUS_FIELDS)
+    statuses = list()
+    for request_id, email in requests:
+        item = items.get(request_id)
+        # a wrong email is answered like an unknown request
+        if item is None or item['email'] != email:
+            statuses.append({'requestId': request_id, 'status': 'not found'})
+            continue
+        status = get_job_status(item)
+        item = remove_dynamodb_item_types(item)
+        statuses.append({
+            'requestId': request_id,
+            'status': status,
+            'method': item['method'],
+            'resamplingStartTime': item['resamplingStartTime'],
+            'resamplingEndTime': item['resamplingEndTime'],
+            'resultCacheHit': item['resultCacheHit'],
+            'batchResults': [{field: batch_result[field] for field in STATUS_BATCH_RESULT_FIELDS} for batch_result in item['batchResults']] if item['batchResults'] != None else None,
+            'completedPartitionCount': len(item['completedPartitions']) if item['completedPartitions'] != None else None,
+            'partitionCount': item['partitionedJob']['partitionCount'] if item['partitionedJob'] != None else None
+        })
+    
+    # the chart data is read for the completed jobs only, with a second projection
+    if include_chart_data:
+        chart_items = batch_get_metadata_items([status['requestId'] for status in statuses if status['status'] == 'completed'], ('requestId', 'chartDataPoints'))
+        chart_data_points = {request_id: remove_dynamodb_item_types(item)['chartDataPoints'] for request_id, item in chart_items.items()}
+        for status in statuses:
+            if status['status'] == 'completed':
+                status['chartDataPoints'] = unpack_chart_data_points(chart_data_points[status['requestId']]) if chart_data_format == 'points' else chart_data_points[status['requestId']]
+    return {'statuses': statuses}
+
+# resample() writes resamplingStartTime when a job starts, and resamplingEndTime when it ends, null if it failed, together with
+# the id of the fail message; partitioned jobs keep their own status
+def get_job_status(item):
+    if 'partitionedJobStatus' in item:
+        return item['partitionedJobStatus']['S']
+    if 'resamplingEndTime' in item:
+        return 'completed' if item['resamplingEndTime']['N'] != None else 'failed'
+    if item.get('onResampleFailSnsPublishMessageId', {}).get('S') != None:
+        return 'failed'
+    if item.get('resamplingStartTime', {}).get('N') != None:
+        return 'running'
+    return 'pending'
+
+# requestId -> item with the given fields only, of the records that exist
+def batch_get_metadata_items(request_ids, fields):
+    items = dict()
+    # BatchGetItem rejects duplicate keys
+    request_ids = list(dict.fromkeys(request_ids))
+    projection_names = {'#F{}'.format(index): field for index, field in enumerate(fields)}
+    for start in range(0, len(request_ids), BATCH_GET_ITEM_MAXIMUM_KEY_COUNT):
+        request_items = {
+            metadata_table.name: {
+                'Keys': [{'requestId': request_id} for request_id in request_ids[start:start + BATCH_GET_ITEM_MAXIMUM_KEY_COUNT]],
+                'ProjectionExpression': ', '.join(projection_names),
+                'ExpressionAttributeNames': projection_names
+            }
+        }
+        for attempt in range(BATCH_GET_ITEM_MAXIMUM_RETRIES + 1):
+            response = dynamodb_resource.batch_get_item(RequestItems = request_items)
+            for item in response['Responses'].get(metadata_table.name, []):
+                items[item['requestId']] = item
+            request_items = response.get('UnprocessedKeys')
+            if not request_items:
+                break
+            # unprocessed keys are throttled reads
+            time.sleep(BATCH_GET_ITEM_RETRY_BASE_DELAY_SECONDS * 2 ** attempt)
+        else:
+            raise Exception('Reading the status of {} requests failed after {} retries!'.format(len(request_items[metadata_table.name]['Keys']), BATCH_GET_ITEM_MAXIMUM_RETRIES))
+    return items
+
 def lambda_handler(event, context):
     '''Provide an event that contains the following keys:
       - operation: one of the operations in the operations dict below
@@ -53,6 +230,11 @@ def lambda_handler(event, context):
     try:
         request_body = extract_request_body(event)
         payload = request_body['payload']
-        return generate_lambda_proxy_success_response(retrieve(payload))
+        if payload.get('ifNoneMatch') is None:
+            payload['ifNoneMatch'] = get_request_header(event, 'If-None-Match')
+        response_body = retrieve(payload)
+        if response_body.get('notModified'):
+            return generate_lambda_proxy_not_modified_response(response_body['etag'])
+        return generate_lambda_proxy_success_response(response_body, response_body['etag'], accepts_compressed_response(event))
     except Exception as e:
         return generate_lambda_proxy_exception_response(e)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from helper.sns import subscribe_sns_email
-from helper.lambda_http import extract_request_body, generate_lambda_proxy_success_response, generate_lambda_proxy_exception_response
+from helper.lambda_http import extract_request_body, accepts_compressed_response, generate_lambda_proxy_success_response, generate_lambda_proxy_exception_response
 
 # inputs: { email }
 def subscribe_sns_notification(payload):
@@ -24,7 +24,7 @@ def lambda_handler(event, context):
     try:
       request_body = extract_request_body(event)
       payload = request_body['payload']
-      return generate_lambda_proxy_success_response(subscribe_sns_notification(payload))
+      return generate_lambda_proxy_success_response(subscribe_sns_notification(payload), compress = accepts_compressed_response(event))
     except Exception as e:
       return generate_lambda_proxy_exception_response(e)
         
\ No newline at end of file
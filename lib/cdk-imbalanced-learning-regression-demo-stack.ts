@@ -1,10 +1,16 @@
 import * as cdk from 'aws-cdk-lib';
 import * as apigateway from 'aws-cdk-lib/aws-apigateway';
 import * as dynamodb from 'aws-cdk-lib/aws-dynamodb';
+import * as events from 'aws-cdk-lib/aws-events';
+import * as eventsTargets from 'aws-cdk-lib/aws-events-targets';
+import * as iam from 'aws-cdk-lib/aws-iam';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
+import * as lambdaDestinations from 'aws-cdk-lib/aws-lambda-destinations';
+import * as lambdaEventSources from 'aws-cdk-lib/aws-lambda-event-sources';
 import * as s3 from 'aws-cdk-lib/aws-s3';
 import * as s3n from 'aws-cdk-lib/aws-s3-notifications';
 import * as sns from 'aws-cdk-lib/aws-sns';
+import * as sqs from 'aws-cdk-lib/aws-sqs';
 import { Construct } from 'constructs';
 
 const LAMBDA_RUNTIME: lambda.Runtime = lambda.Runtime.PYTHON_3_10;
@@ -13,8 +19,20 @@ const BUCKET_NAME_RESAMPLED_DATA: string = '';
 const EXPIRATION_DAYS: number = 7;
 const LAMBDA_FUNCTION_DEFAULT_TIMEOUT_SECONDS: number = 15
 const LAMBDA_FUNCTION_RESAMPLING_TIMEOUT_MINUTES: number = 15
-const LAMBDA_FUNCTION_LOCAL_RAW_DATA_FILE_DIRECTORY: string = '/tmp/data/raw/'
-const LAMBDA_FUNCTION_LOCAL_RESAMPLED_DATA_FILE_DIRECTORY: string = '/tmp/data/resampled/'
+const LAMBDA_FUNCTION_RAW_DATA_DOWNCAST_DTYPES: boolean = false
+const LAMBDA_FUNCTION_NEIGHBOUR_INDEX_PERSISTENCE: boolean = true
+const LAMBDA_FUNCTION_RESAMPLING_WORKER_COUNT: number = 2
+const LAMBDA_FUNCTION_PARTITIONED_JOB_MINIMUM_ROWS: number = 100000
+const LAMBDA_FUNCTION_PREFLIGHT_PROFILING: boolean = true
+const LAMBDA_FUNCTION_JOB_PROFILING: boolean = false
+const LAMBDA_FUNCTION_SMALL_JOB_MAXIMUM_BYTES: number = 1024 * 1024
+const LAMBDA_FUNCTION_RESAMPLED_DATA_CONTENT_ENCODING: string = 'gzip'
+const JOB_QUEUE_INTAKE_BATCH_SIZE: number = 10
+const JOB_QUEUE_INTAKE_MAXIMUM_BATCHING_WINDOW_SECONDS: number = 5
+const JOB_QUEUE_INTAKE_MAXIMUM_CONCURRENCY: number = 10
+const JOB_QUEUE_LARGE_JOB_MAXIMUM_CONCURRENCY: number = 5
+const JOB_QUEUE_MAXIMUM_RECEIVE_COUNT: number = 3
+const NOTIFICATION_OUTBOX_DISPATCH_INTERVAL_MINUTES: number = 5
 
 const s3LifecycleRule: s3.LifecycleRule = {
   abortIncompleteMultipartUploadAfter: cdk.Duration.days(EXPIRATION_DAYS),
@@ -56,26 +74,85 @@ export class CdkImbalancedLearningRegressionDemoStack extends cdk.Stack {
       timeToLiveAttribute: 'recordExpirationTime'
     });
 
+    const resultCacheTable = new dynamodb.TableV2(this, 'ResultCacheTable', {
+      partitionKey: { name: 'cacheKey', type: dynamodb.AttributeType.STRING },
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+      timeToLiveAttribute: 'recordExpirationTime'
+    });
+
     const taskStatusSNSTopic = new sns.Topic(this, 'taskStatusSNSTopic');
 
+    // raw data uploads queue up for the resampling function, which runs the small jobs of a batch in one invocation
+    // and passes the large ones on to a queue of their own, see resample_jobs() of lambda/resampling.py
+    // a message stays invisible for several timeouts of the function, as SQS event sources should
+    const jobQueueVisibilityTimeout = cdk.Duration.minutes(LAMBDA_FUNCTION_RESAMPLING_TIMEOUT_MINUTES * 6)
+    const jobDeadLetterQueue = new sqs.Queue(this, 'JobDeadLetterQueue', {
+      retentionPeriod: cdk.Duration.days(EXPIRATION_DAYS),
+      enforceSSL: true
+    });
+
+    const intakeJobQueue = new sqs.Queue(this, 'IntakeJobQueue', {
+      visibilityTimeout: jobQueueVisibilityTimeout,
+      enforceSSL: true,
+      deadLetterQueue: { queue: jobDeadLetterQueue, maxReceiveCount: JOB_QUEUE_MAXIMUM_RECEIVE_COUNT }
+    });
+
+    const largeJobQueue = new sqs.Queue(this, 'LargeJobQueue', {
+      visibilityTimeout: jobQueueVisibilityTimeout,
+      enforceSSL: true,
+      deadLetterQueue: { queue: jobDeadLetterQueue, maxReceiveCount: JOB_QUEUE_MAXIMUM_RECEIVE_COUNT }
+    });
+
+    // the partition workers of partitioned jobs, asynchronous invocations of the resampling function, that fail every attempt,
+    // also by a timeout or by running out of memory where no handler runs, are sent to this queue, from which the resampling
+    // function fails their jobs, see fail_partition_invocations() of lambda/partitioned_resampling.py
+    const partitionFailureQueue = new sqs.Queue(this, 'PartitionFailureQueue', {
+      visibilityTimeout: jobQueueVisibilityTimeout,
+      retentionPeriod: cdk.Duration.days(EXPIRATION_DAYS),
+      enforceSSL: true,
+      deadLetterQueue: { queue: jobDeadLetterQueue, maxReceiveCount: JOB_QUEUE_MAXIMUM_RECEIVE_COUNT }
+    });
+
     const lambdaFunctionEnvironmentVariables = {
       'metadataTableName': metadataTable.tableName, 
+      'resultCacheTableName': resultCacheTable.tableName, 
       'rawDataBucketName': rawDataBucket.bucketName, 
       'resampledDataBucketName': resampledDataBucket.bucketName, 
       'expirationDays': EXPIRATION_DAYS.toString(), 
       'taskStatusSnsTopicArn': taskStatusSNSTopic.topicArn,
-      'localRawDataFileDirectory': LAMBDA_FUNCTION_LOCAL_RAW_DATA_FILE_DIRECTORY,
-      'localResampledDataFileDirectory': LAMBDA_FUNCTION_LOCAL_RESAMPLED_DATA_FILE_DIRECTORY
+      'rawDataDowncastDtypes': LAMBDA_FUNCTION_RAW_DATA_DOWNCAST_DTYPES.toString(),
+      'neighbourIndexPersistence': LAMBDA_FUNCTION_NEIGHBOUR_INDEX_PERSISTENCE.toString(),
+      'resamplingWorkerCount': LAMBDA_FUNCTION_RESAMPLING_WORKER_COUNT.toString(),
+      'partitionedJobMinimumRows': LAMBDA_FUNCTION_PARTITIONED_JOB_MINIMUM_ROWS.toString(),
+      'preflightProfiling': LAMBDA_FUNCTION_PREFLIGHT_PROFILING.toString(),
+      'jobProfiling': LAMBDA_FUNCTION_JOB_PROFILING.toString(),
+      'resamplingTimeoutSeconds': (LAMBDA_FUNCTION_RESAMPLING_TIMEOUT_MINUTES * 60).toString(),
+      'smallJobMaximumBytes': LAMBDA_FUNCTION_SMALL_JOB_MAXIMUM_BYTES.toString(),
+      'largeJobQueueUrl': largeJobQueue.queueUrl,
+      'partitionFailureQueueUrl': partitionFailureQueue.queueUrl,
+      'resampledDataContentEncoding': LAMBDA_FUNCTION_RESAMPLED_DATA_CONTENT_ENCODING
     }
 
     const lambdaFunctionDefaultTimeout = cdk.Duration.seconds(LAMBDA_FUNCTION_DEFAULT_TIMEOUT_SECONDS)
     const lambdaFunctionResamplingTimeout = cdk.Duration.minutes(LAMBDA_FUNCTION_RESAMPLING_TIMEOUT_MINUTES)
 
+    // orjson for the responses of the zip functions, see helper/lambda_http.py, built by pip in the build image of their runtime
+    const apiDependenciesLayer = new lambda.LayerVersion(this, 'ApiDependenciesLayer', {
+      code: lambda.Code.fromAsset('lambda_layer', {
+        bundling: {
+          image: LAMBDA_RUNTIME.bundlingImage,
+          command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output/python']
+        }
+      }),
+      compatibleRuntimes: [LAMBDA_RUNTIME]
+    });
+
     const defaultFunction = new lambda.Function(this, 'DefaultFunction', {
       runtime: LAMBDA_RUNTIME,
       code: lambda.Code.fromAsset('lambda'),
       handler: 'default.lambda_handler',
       environment: lambdaFunctionEnvironmentVariables,
+      layers: [apiDependenciesLayer],
       timeout: lambdaFunctionDefaultTimeout,
       memorySize: 128
     });
@@ -85,6 +162,7 @@ export class CdkImbalancedLearningRegressionDemoStack extends cdk.Stack {
       code: lambda.Code.fromAsset('lambda'),
       handler: 'subscribe_sns_notification.lambda_handler',
       environment: lambdaFunctionEnvironmentVariables,
+      layers: [apiDependenciesLayer],
       timeout: lambdaFunctionDefaultTimeout,
       memorySize: 128
     });
@@ -94,6 +172,7 @@ export class CdkImbalancedLearningRegressionDemoStack extends cdk.Stack {
       code: lambda.Code.fromAsset('lambda'),
       handler: 'request.lambda_handler',
       environment: lambdaFunctionEnvironmentVariables,
+      layers: [apiDependenciesLayer],
       timeout: lambdaFunctionDefaultTimeout,
       memorySize: 128
     });
@@ -103,6 +182,7 @@ export class CdkImbalancedLearningRegressionDemoStack extends cdk.Stack {
       code: lambda.Code.fromAsset('lambda'),
       handler: 'retrieval.lambda_handler',
       environment: lambdaFunctionEnvironmentVariables,
+      layers: [apiDependenciesLayer],
       timeout: lambdaFunctionDefaultTimeout,
       memorySize: 128
     });
@@ -114,14 +194,23 @@ export class CdkImbalancedLearningRegressionDemoStack extends cdk.Stack {
       memorySize: 3008
     });  
 
+    // the first invocation and two retries, see PARTITION_MAXIMUM_ATTEMPTS of lambda/partitioned_resampling.py
+    resamplingFunction.configureAsyncInvoke({
+      onFailure: new lambdaDestinations.SqsDestination(partitionFailureQueue),
+      retryAttempts: 2
+    })
+
     rawDataBucket.grantPut(defaultFunction)
     rawDataBucket.grantRead(defaultFunction)
     rawDataBucket.grantPut(requestFunction)
     rawDataBucket.grantRead(resamplingFunction)
+    rawDataBucket.grantPut(resamplingFunction)
     rawDataBucket.grantRead(retrievalFunction)
 
     resampledDataBucket.grantRead(defaultFunction)
     resampledDataBucket.grantPut(resamplingFunction)
+    resampledDataBucket.grantRead(resamplingFunction)
+    resampledDataBucket.grantDelete(resamplingFunction)
     resampledDataBucket.grantRead(retrievalFunction)
 
     metadataTable.grantReadWriteData(defaultFunction)
@@ -129,16 +218,58 @@ export class CdkImbalancedLearningRegressionDemoStack extends cdk.Stack {
     metadataTable.grantReadWriteData(resamplingFunction)
     metadataTable.grantReadData(retrievalFunction)
 
+    resultCacheTable.grantReadWriteData(resamplingFunction)
+
     taskStatusSNSTopic.grantSubscribe(defaultFunction)
     taskStatusSNSTopic.grantSubscribe(subscribeSnsNotificationFunction)
     taskStatusSNSTopic.grantSubscribe(requestFunction)
     taskStatusSNSTopic.grantPublish(resamplingFunction)
+
+    largeJobQueue.grantSendMessages(resamplingFunction)
+
+    // the partitions of a partitioned job are invoked asynchronously by the resampling function itself,
+    // granted by name pattern since a policy naming the function itself would be a circular dependency
+    resamplingFunction.addToRolePolicy(new iam.PolicyStatement({
+      actions: ['lambda:InvokeFunction'],
+      resources: [cdk.Stack.of(this).formatArn({ service: 'lambda', resource: 'function', resourceName: '*ResamplingFunction*', arnFormat: cdk.ArnFormat.COLON_RESOURCE_NAME })]
+    }))
     
-    rawDataBucket.addEventNotification(s3.EventType.OBJECT_CREATED, new s3n.LambdaDestination(resamplingFunction))
+    // only uploaded raw data starts a resampling, not the neighbour indexes persisted next to it
+    rawDataBucket.addEventNotification(s3.EventType.OBJECT_CREATED, new s3n.SqsDestination(intakeJobQueue), { prefix: 'raw_' })
+
+    // the messages of a batch whose jobs failed or did not start are returned to their queue, the others deleted
+    resamplingFunction.addEventSource(new lambdaEventSources.SqsEventSource(intakeJobQueue, {
+      batchSize: JOB_QUEUE_INTAKE_BATCH_SIZE,
+      maxBatchingWindow: cdk.Duration.seconds(JOB_QUEUE_INTAKE_MAXIMUM_BATCHING_WINDOW_SECONDS),
+      maxConcurrency: JOB_QUEUE_INTAKE_MAXIMUM_CONCURRENCY,
+      reportBatchItemFailures: true
+    }))
+    resamplingFunction.addEventSource(new lambdaEventSources.SqsEventSource(largeJobQueue, {
+      batchSize: 1,
+      maxConcurrency: JOB_QUEUE_LARGE_JOB_MAXIMUM_CONCURRENCY,
+      reportBatchItemFailures: true
+    }))
+
+    resamplingFunction.addEventSource(new lambdaEventSources.SqsEventSource(partitionFailureQueue, {
+      batchSize: 1
+    }))
+
+    // notifications that jobs could not publish are saved in the notificationOutbox of their records, and published again
+    // by the resampling function on this schedule, see dispatch_saved_sns_outboxes() of lambda/helper/sns_outbox.py
+    new events.Rule(this, 'NotificationOutboxDispatchRule', {
+      schedule: events.Schedule.rate(cdk.Duration.minutes(NOTIFICATION_OUTBOX_DISPATCH_INTERVAL_MINUTES)),
+      targets: [new eventsTargets.LambdaFunction(resamplingFunction, {
+        event: events.RuleTargetInput.fromObject({ notificationOutbox: {} }),
+        retryAttempts: 0
+      })]
+    })
 
     const api = new apigateway.LambdaRestApi(this, 'ImbalancedLearningRegressionDemoApi', {
       handler: defaultFunction,
       proxy: false,
+      // only requests that accept this type first get the gzip compressed responses of the functions as binary,
+      // the bodies and responses of all other requests, such as those of the UI, pass through as text, see helper/lambda_http.py
+      binaryMediaTypes: ['application/gzip'],
       deployOptions: {
         throttlingBurstLimit: 20,
         throttlingRateLimit: 10
@@ -0,0 +1,19 @@
+import os
+import sys
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIRECTORY, '..', '..', 'benchmark'))
+sys.path.insert(0, os.path.join(TEST_DIRECTORY, '..', '..', 'lambda'))
+
+# the handler modules read these at import time, as they do in the benchmarks
+from import_time import LAMBDA_ENVIRONMENT_VARIABLES
+for name, value in dict(LAMBDA_ENVIRONMENT_VARIABLES, resultCacheTableName = 'result-cache-table').items():
+    os.environ.setdefault(name, value)
+
+import pytest
+from local_api import LocalApi
+
+# a fresh deployment of the stack on in-memory stand-ins, without the throttling of the API
+@pytest.fixture
+def local_api():
+    return LocalApi(rate_limit = 1e6, burst_limit = 1e6)
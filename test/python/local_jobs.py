@@ -0,0 +1,21 @@
+from local_api import get_response_data
+from load_test import get_job_data
+
+# requests a job of payload (method ro of target y by default) on rows of data, uploads it and runs it, returns the request response
+def run_job(local_api, rows = 200, email = 'test@example.com', seed = 0, **payload):
+    response = request_job(local_api, email, **payload)
+    local_api.upload(response, get_job_data(rows, seed))
+    local_api.drain()
+    return response
+
+def request_job(local_api, email = 'test@example.com', **payload):
+    return get_response_data(local_api.call('request', 'request', {
+        'email': email,
+        'method': 'ro',
+        'y': 'y',
+        'chartDataSize': 50,
+        'taskStatusSnsTopicSubscriptionOption': 'reject',
+        'taskStatusSnsTopicSubscriptionArn': None,
+        'originalFileName': 'test.csv',
+        **payload
+    }))
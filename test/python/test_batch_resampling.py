@@ -0,0 +1,41 @@
+from local_api import get_response_data
+from local_jobs import run_job
+import retrieval
+
+# rel_thres out of (0, 1] fails the method in the library
+FAILING_METHOD = {'method': 'ro', 'parameters': {'rel_thres': 2}}
+
+def get_record(local_api, job):
+    return local_api.local_aws.metadata_table.items[job['requestId']]
+
+def retrieve(local_api, job):
+    return get_response_data(local_api.call('retrieve', 'retrieve', {'requestId': job['requestId'], 'email': 'test@example.com'}))
+
+def test_failing_method_does_not_fail_the_batch(local_api):
+    job = run_job(local_api, methods = [{'method': 'ro'}, FAILING_METHOD, {'method': 'ru'}])
+    record = get_record(local_api, job)
+    batch_results = record['batchResults']['L']
+    assert [batch_result['label'] for batch_result in batch_results] == ['ro #1', 'ro #2', 'ru']
+    assert [batch_result['status'] for batch_result in batch_results] == ['completed', 'failed', 'completed']
+    assert [batch_result['errorMessage'] != None for batch_result in batch_results] == [False, True, False]
+    assert all(batch_result['resamplingEndTime'] != None for batch_result in batch_results)
+    assert retrieval.get_job_status(record) == 'completed'
+    # only the completed methods have a resampled object
+    objects = local_api.local_aws.s3_client.objects
+    assert [(record['s3ResampledDataBucketName'], batch_result['s3ResampledDataObjectKey']) in objects for batch_result in batch_results] == [True, False, True]
+
+def test_chart_of_a_batch_shares_one_grid(local_api):
+    job = run_job(local_api, methods = [{'method': 'ro'}, FAILING_METHOD, {'method': 'ru'}])
+    points = retrieve(local_api, job)['chartDataPoints']
+    assert len(points) == 50
+    # one resampled density per completed method, in batch order
+    assert list(points[0]) == ['Target Variable', 'Raw Density', 'Resampled Density (ro #1)', 'Resampled Density (ru)']
+    targets = [float(point['Target Variable']) for point in points]
+    assert targets == sorted(targets)
+
+def test_batch_of_failing_methods_fails(local_api):
+    job = run_job(local_api, methods = [FAILING_METHOD, FAILING_METHOD])
+    record = get_record(local_api, job)
+    assert [batch_result['status'] for batch_result in record['batchResults']['L']] == ['failed', 'failed']
+    assert record['resamplingEndTime']['N'] == None
+    assert retrieval.get_job_status(record) == 'failed'
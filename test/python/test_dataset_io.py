@@ -0,0 +1,95 @@
+import gzip
+import io
+import pandas
+import pytest
+from local_aws import LocalS3Client
+from local_jobs import request_job
+from load_test import get_job_data
+from helper import dataset_io
+from helper.file_format import get_data_compression, get_data_file_format
+
+# blanks, quoted blanks and the missing values of pandas in numeric, string, boolean and date columns
+CSV_ROWS = b'''1.5,a,2,True,1,2024-01-01
+,b,3,False,2,2024-01-02
+2.5,,NA,True,,2024-01-03
+3,n/a,4,,4,
+4,"",5.5,False,5,2024-01-05
+5,c,null,True,6,2024-01-06
+6,N/A,7,True,7,2024-01-07
+7,d,8,False,8,2024-01-08
+'''
+CSV = b'x,name,z,flag,count,when\n' + CSV_ROWS * 20
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # the CSV is read in several blocks, each converted on its own
+    monkeypatch.setattr(dataset_io, 'RAW_DATA_READ_BLOCK_SIZE_BYTES', 256)
+
+def test_csv_stream_reads_like_pandas(small_blocks):
+    pandas.testing.assert_frame_equal(dataset_io.read_csv_stream(io.BytesIO(CSV)), pandas.read_csv(io.BytesIO(CSV)))
+
+def test_csv_stream_downcasts_every_block(small_blocks):
+    data = dataset_io.read_csv_stream(io.BytesIO(CSV), downcast = True, exclude_columns = ['z'])
+    expected = pandas.read_csv(io.BytesIO(CSV))
+    assert data['x'].dtype == 'float32'
+    assert data['z'].dtype == 'float64'
+    pandas.testing.assert_frame_equal(data, expected, check_dtype = False)
+
+def test_csv_stream_of_a_header_only():
+    data = dataset_io.read_csv_stream(io.BytesIO(b'x,y\n'))
+    assert list(data.columns) == ['x', 'y']
+    assert len(data) == 0
+
+# the first bytes of the codecs
+COMPRESSION_MAGIC_BYTES = {'gzip': b'\x1f\x8b', 'zstd': b'\x28\xb5\x2f\xfd'}
+
+def generate_dataset():
+    return pandas.DataFrame({'x': [0.5, 1.5, None, 3.25], 'count': [1, 2, 3, 4], 'label': ['a', None, 'c', 'd'], 'y': [1.0, 2.0, 4.0, 8.0]})
+
+def write_to_s3(data, data_format, content_encoding):
+    s3_client = LocalS3Client()
+    file = io.BytesIO()
+    dataset_io.write_dataset(data, file, data_format, content_encoding)
+    s3_client.put_object(Bucket = 'bucket', Key = 'key', Body = file.getvalue(), ContentEncoding = content_encoding)
+    return s3_client, file.getvalue()
+
+@pytest.mark.parametrize('data_format, content_encoding', [
+    ('csv', None), ('csv', 'gzip'), ('csv', 'zstd'),
+    ('csv.gz', None), ('csv.zst', None),
+    ('parquet', None), ('parquet', 'gzip'), ('parquet', 'zstd'),
+    ('feather', None), ('feather', 'gzip'), ('feather', 'zstd')
+])
+def test_written_dataset_reads_back(data_format, content_encoding):
+    data = generate_dataset()
+    s3_client, body = write_to_s3(data, data_format, content_encoding)
+    compression = get_data_compression(data_format, content_encoding)
+    if compression != None:
+        assert body.startswith(COMPRESSION_MAGIC_BYTES[compression])
+    pandas.testing.assert_frame_equal(dataset_io.read_dataset_from_s3(s3_client, 'bucket', 'key', data_format, content_encoding = content_encoding), data)
+
+def test_compressed_csv_decompresses_with_the_standard_tools():
+    data = generate_dataset()
+    _, body = write_to_s3(data, 'csv', 'gzip')
+    pandas.testing.assert_frame_equal(pandas.read_csv(io.BytesIO(gzip.decompress(body))), data)
+
+# compressed uploads, by Content-Encoding or as a compressed format, and compressed outputs of a whole job
+@pytest.mark.parametrize('original_file_name, upload_content_encoding, output_content_encoding', [
+    ('test.csv', 'gzip', None),
+    ('test.csv', 'zstd', 'gzip'),
+    ('test.csv.gz', None, None),
+    ('test.csv.zst', None, None)
+])
+def test_compressed_upload_is_resampled(local_api, original_file_name, upload_content_encoding, output_content_encoding):
+    data = pandas.read_csv(io.BytesIO(get_job_data(200, 0)))
+    response = request_job(local_api, originalFileName = original_file_name, uploadContentEncoding = upload_content_encoding, outputContentEncoding = output_content_encoding)
+    assert response.get('putPresignedUrlContentEncoding') == upload_content_encoding
+    file = io.BytesIO()
+    dataset_io.write_dataset(data, file, get_data_file_format(original_file_name), upload_content_encoding)
+    local_api.upload(response, file.getvalue())
+    local_api.drain()
+    record = local_api.local_aws.metadata_table.items[response['requestId']]
+    assert record['resamplingEndTime']['N'] != None
+    resampled_object = local_api.local_aws.s3_client.objects[(record['s3ResampledDataBucketName'], record['s3ResampledDataObjectKey'])]
+    assert resampled_object['ContentEncoding'] == output_content_encoding
+    resampled_data = dataset_io.read_dataset_from_s3(local_api.local_aws.s3_client, record['s3ResampledDataBucketName'], record['s3ResampledDataObjectKey'], get_data_file_format(original_file_name), content_encoding = output_content_encoding)
+    assert list(resampled_data.columns) == list(data.columns)
@@ -0,0 +1,17 @@
+import statistics
+import pytest
+from import_time import IMPORT_TIME_BUDGETS_MS, DEFERRED_PACKAGES, measure_import_time
+
+# the median of this many fresh interpreters is held against the budget
+IMPORT_TIME_RUNS = 3
+
+@pytest.mark.parametrize('module_name', list(IMPORT_TIME_BUDGETS_MS))
+def test_handler_imports_within_budget(module_name):
+    runs = [measure_import_time(module_name) for _ in range(IMPORT_TIME_RUNS)]
+    total_ms = statistics.median(run[0] for run in runs)
+    assert total_ms <= IMPORT_TIME_BUDGETS_MS[module_name], '{} imports in {:.1f} ms, over its budget of {} ms'.format(module_name, total_ms, IMPORT_TIME_BUDGETS_MS[module_name])
+
+@pytest.mark.parametrize('module_name', list(IMPORT_TIME_BUDGETS_MS))
+def test_handler_defers_heavy_packages(module_name):
+    total_ms, packages = measure_import_time(module_name)
+    assert [package for package in DEFERRED_PACKAGES if package in packages] == []
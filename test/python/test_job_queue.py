@@ -0,0 +1,85 @@
+import json
+import pytest
+from local_aws import LocalSqsClient, get_queue_arn
+from local_jobs import request_job
+from load_test import get_job_data
+import resampling
+import retrieval
+from helper import job_queue
+
+def generate_job(key, size_bytes):
+    return {'bucket': 'raw-data', 'key': key, 'sizeBytes': size_bytes, 's3Record': {'s3': {'bucket': {'name': 'raw-data'}, 'object': {'key': key, 'size': size_bytes}}}, 'message': None}
+
+# fails the entries of the jobs of failed_keys, and every call with a job of raised_keys
+class FailingSqsClient(LocalSqsClient):
+
+    def __init__(self, failed_keys = (), raised_keys = ()):
+        super().__init__()
+        self.failed_keys = set(failed_keys)
+        self.raised_keys = set(raised_keys)
+
+    def send_message_batch(self, QueueUrl, Entries, **arguments):
+        keys = {entry['Id']: json.loads(entry['MessageBody'])['Records'][0]['s3']['object']['key'] for entry in Entries}
+        if any(key in self.raised_keys for key in keys.values()):
+            raise Exception('Service unavailable')
+        response = super().send_message_batch(QueueUrl, [entry for entry in Entries if keys[entry['Id']] not in self.failed_keys])
+        response['Failed'] = [{'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError', 'Message': 'Internal error'} for entry in Entries if keys[entry['Id']] in self.failed_keys]
+        return response
+
+def test_split_job_lanes():
+    jobs = [generate_job('a', 300), generate_job('b', 50), generate_job('c', 5000), generate_job('d', 100), generate_job('e', 1000)]
+    small_jobs, large_jobs = job_queue.split_job_lanes(jobs, 300)
+    assert [job['key'] for job in small_jobs] == ['b', 'd', 'a']
+    assert [job['key'] for job in large_jobs] == ['c', 'e']
+
+def test_forward_jobs_returns_the_jobs_not_sent():
+    sqs_client = FailingSqsClient(failed_keys = ['job3'], raised_keys = ['job11'])
+    queue_url = sqs_client.create_queue(QueueName = 'large')['QueueUrl']
+    jobs = [generate_job('job{}'.format(index), 100) for index in range(job_queue.SQS_BATCH_MAXIMUM_ENTRIES + 2)]
+    failed_jobs = job_queue.forward_jobs(sqs_client, queue_url, jobs)
+    # a failed entry fails its job, a failed call all jobs of the call
+    assert [job['key'] for job in failed_jobs] == ['job3', 'job10', 'job11']
+    assert len(sqs_client.queues[queue_url]) == job_queue.SQS_BATCH_MAXIMUM_ENTRIES - 1
+
+def test_get_queue_url_asks_the_endpoint_of_the_client():
+    sqs_client = LocalSqsClient()
+    queue_url = sqs_client.create_queue(QueueName = 'intake')['QueueUrl']
+    assert job_queue.get_queue_url(sqs_client, get_queue_arn(queue_url)) == queue_url
+
+def upload_job(local_api, rows, seed):
+    response = request_job(local_api)
+    local_api.upload(response, get_job_data(rows, seed))
+    return response
+
+def test_only_messages_of_jobs_not_forwarded_fail(local_api, monkeypatch):
+    sqs_client = local_api.local_aws.sqs_client
+    large_job_queue_url = sqs_client.create_queue(QueueName = 'LargeJobQueue')['QueueUrl']
+    monkeypatch.setattr(resampling, 'large_job_queue_url', large_job_queue_url)
+    monkeypatch.setattr(resampling, 'small_job_maximum_bytes', len(get_job_data(200, 0)))
+    small_responses = [upload_job(local_api, 100, seed) for seed in range(2)]
+    large_responses = [upload_job(local_api, 2000, seed) for seed in range(2)]
+    # the second large job is not sent
+    send_message_batch = sqs_client.send_message_batch
+    def fail_second_large_job(QueueUrl, Entries, **arguments):
+        entries = [entry for entry in Entries if large_responses[1]['s3RawDataObjectKey'] not in entry['MessageBody']]
+        response = send_message_batch(QueueUrl, entries, **arguments)
+        response['Failed'] = [{'Id': entry['Id'], 'SenderFault': False, 'Code': 'InternalError'} for entry in Entries if entry not in entries]
+        return response
+    monkeypatch.setattr(sqs_client, 'send_message_batch', fail_second_large_job)
+    messages = sqs_client.receive_message(QueueUrl = local_api.intake_queue_url, MaxNumberOfMessages = 10, VisibilityTimeout = 900)['Messages']
+    assert len(messages) == 4
+    event = {'Records': [{
+        'messageId': message['MessageId'],
+        'receiptHandle': message['ReceiptHandle'],
+        'body': message['Body'],
+        'eventSource': 'aws:sqs',
+        'eventSourceARN': get_queue_arn(local_api.intake_queue_url)
+    } for message in messages]}
+    result = resampling.resample_jobs(event)
+    failed_message_ids = [failure['itemIdentifier'] for failure in result['batchItemFailures']]
+    assert [json.loads(message['Body'])['Records'][0]['s3']['object']['key'] for message in messages if message['MessageId'] in failed_message_ids] == [large_responses[1]['s3RawDataObjectKey']]
+    # the other messages are done and deleted, the forwarded job waits in the large job queue
+    assert len(sqs_client.queues[local_api.intake_queue_url]) == 1
+    assert [json.loads(message['Body'])['Records'][0]['s3']['object']['key'] for message in sqs_client.queues[large_job_queue_url]] == [large_responses[0]['s3RawDataObjectKey']]
+    for response in small_responses:
+        assert retrieval.get_job_status(retrieval.metadata_table.get_item(Key = {'requestId': response['requestId']})['Item']) == 'completed'
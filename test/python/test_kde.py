@@ -0,0 +1,57 @@
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot
+import numpy
+import pytest
+import scipy.stats
+import seaborn
+from helper.kde import compute_kde_on_shared_grid
+
+# the binned FFT estimate deviates from the exact one of seaborn by about 4e-4 of the peak density
+DENSITY_TOLERANCE = 2e-3
+
+def get_seaborn_line(values, grid_size):
+    axes = seaborn.kdeplot(x = values, gridsize = grid_size)
+    try:
+        return axes.get_lines()[0].get_data()
+    finally:
+        matplotlib.pyplot.close(axes.figure)
+
+def get_relative_deviation(densities, expected_densities):
+    return numpy.abs(densities - expected_densities).max() / expected_densities.max()
+
+@pytest.mark.parametrize('grid_size', [50, 200, 1000])
+@pytest.mark.parametrize('distribution', ['normal', 'lognormal', 'bimodal'])
+def test_single_sample_matches_seaborn(distribution, grid_size):
+    random = numpy.random.default_rng(0)
+    values = {
+        'normal': random.normal(size = 500),
+        'lognormal': random.lognormal(size = 500),
+        'bimodal': numpy.concatenate([random.normal(-3, 0.5, 300), random.normal(4, 1, 200)])
+    }[distribution]
+    seaborn_target_list, seaborn_densities = get_seaborn_line(values, grid_size)
+    target_list, densities = compute_kde_on_shared_grid([values], grid_size)
+    numpy.testing.assert_allclose(target_list, seaborn_target_list, rtol = 1e-9, atol = 1e-9)
+    assert get_relative_deviation(densities[0], seaborn_densities) < DENSITY_TOLERANCE
+
+# seaborn evaluates every sample on a grid of its own, so the shared grid is checked against the exact estimate seaborn computes
+def test_shared_grid_matches_exact_estimates():
+    random = numpy.random.default_rng(1)
+    raw_values = random.lognormal(size = 400)
+    resampled_values = numpy.concatenate([raw_values, random.lognormal(1, 0.3, 200)])
+    target_list, densities = compute_kde_on_shared_grid([raw_values, resampled_values], 200)
+    assert target_list[0] <= min(raw_values.min(), resampled_values.min())
+    assert target_list[-1] >= max(raw_values.max(), resampled_values.max())
+    for values, density in zip([raw_values, resampled_values], densities):
+        assert get_relative_deviation(density, scipy.stats.gaussian_kde(values)(target_list)) < DENSITY_TOLERANCE
+
+def test_non_finite_values_are_ignored():
+    values = numpy.random.default_rng(2).normal(size = 100)
+    target_list, densities = compute_kde_on_shared_grid([values], 100)
+    target_list_with_nan, densities_with_nan = compute_kde_on_shared_grid([numpy.append(values, [numpy.nan, numpy.inf])], 100)
+    numpy.testing.assert_allclose(target_list_with_nan, target_list)
+    numpy.testing.assert_allclose(densities_with_nan, densities)
+
+def test_constant_sample_raises():
+    with pytest.raises(Exception, match = 'zero variance'):
+        compute_kde_on_shared_grid([numpy.ones(10)], 100)
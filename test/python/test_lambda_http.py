@@ -0,0 +1,67 @@
+import base64
+import gzip
+import json
+from decimal import Decimal
+import numpy
+import pytest
+from local_api import get_response_data
+from local_jobs import run_job
+from helper import lambda_http
+from helper.chart_data import unpack_chart_data_points, CHART_DATA_RAW_DENSITY_NAME
+
+COMPRESSED_RESPONSE_HEADERS = {'Accept': lambda_http.COMPRESSED_RESPONSE_MEDIA_TYPE, 'Accept-Encoding': 'gzip, deflate, br'}
+
+@pytest.mark.parametrize('name', sorted(lambda_http.json_serializers))
+def test_serializers_send_decimals_as_strings_and_numpy_as_values(name):
+    data = {'decimal': Decimal('1.50'), 'float': numpy.float32(2.5), 'int': numpy.int64(3), 'array': numpy.arange(6).reshape(2, 3)[:, ::2]}
+    assert json.loads(lambda_http.json_serializers[name](data)) == {'decimal': '1.50', 'float': 2.5, 'int': 3, 'array': [[0, 2], [3, 5]]}
+
+def test_unknown_serializer_is_rejected():
+    with pytest.raises(Exception, match = 'Unavailable JSON serializer'):
+        lambda_http.get_json_serializer('simplejson')
+
+@pytest.mark.parametrize('accept_encoding, expected', [
+    (None, False), ('identity', False), ('gzip', True), ('GZIP', True), ('gzip;q=0', False), ('*', True), ('*;q=0', False),
+    ('br, gzip;q=0.5', True), ('deflate, *;q=0.1, gzip;q=0', False)
+])
+def test_accepts_gzip(accept_encoding, expected):
+    assert lambda_http.accepts_gzip(accept_encoding) == expected
+
+@pytest.mark.parametrize('headers, expected', [
+    (COMPRESSED_RESPONSE_HEADERS, True),
+    ({'accept': 'Application/Gzip; q=1', 'accept-encoding': 'gzip'}, True),
+    # API Gateway returns binary only for the first media type of the Accept header
+    ({'Accept': 'application/json, application/gzip', 'Accept-Encoding': 'gzip'}, False),
+    ({'Accept': 'application/json, text/plain, */*', 'Accept-Encoding': 'gzip, deflate, br'}, False),
+    ({'Accept': lambda_http.COMPRESSED_RESPONSE_MEDIA_TYPE}, False),
+    ({}, False)
+])
+def test_accepts_compressed_response(headers, expected):
+    assert lambda_http.accepts_compressed_response({'headers': headers}) == expected
+
+def test_only_large_bodies_are_compressed():
+    assert not lambda_http.generate_lambda_proxy_success_response({'x': 1}, compress = True)['isBase64Encoded']
+    response = lambda_http.generate_lambda_proxy_success_response({'x': 'x' * lambda_http.RESPONSE_COMPRESSION_MINIMUM_BYTES}, 'etag', compress = True)
+    assert response['isBase64Encoded']
+    assert response['headers']['Content-Encoding'] == 'gzip'
+    assert response['headers']['ETag'] == 'etag'
+    assert json.loads(gzip.decompress(base64.b64decode(response['body']))) == {'data': {'x': 'x' * lambda_http.RESPONSE_COMPRESSION_MINIMUM_BYTES}}
+
+def test_base64_request_bodies_are_decoded():
+    assert lambda_http.extract_request_body({'isBase64Encoded': True, 'body': base64.b64encode(b'{"a": 1}').decode('ascii')}) == {'a': 1}
+
+def test_retrieve_is_compressed_for_the_binary_media_type_only(local_api):
+    job = run_job(local_api)
+    payload = {'requestId': job['requestId'], 'email': 'test@example.com'}
+    compressed_response = local_api.call('retrieve', 'retrieve', payload, COMPRESSED_RESPONSE_HEADERS)
+    assert compressed_response['headers']['Content-Encoding'] == 'gzip'
+    # the UI accepts gzip too, but not the binary media type
+    response = local_api.call('retrieve', 'retrieve', payload, {'Accept': 'application/json, text/plain, */*', 'Accept-Encoding': 'gzip, deflate, br'})
+    assert not response['isBase64Encoded']
+    assert 'Content-Encoding' not in response['headers']
+    assert get_response_data(compressed_response)['chartDataPoints'] == get_response_data(response)['chartDataPoints']
+
+def test_chart_points_are_strings():
+    points = [{'Target Variable': Decimal('0.5'), CHART_DATA_RAW_DENSITY_NAME: Decimal('0.25')}]
+    assert unpack_chart_data_points(points) == [{'Target Variable': '0.5', CHART_DATA_RAW_DENSITY_NAME: '0.25'}]
+    assert unpack_chart_data_points(None) is None
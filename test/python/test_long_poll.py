@@ -0,0 +1,80 @@
+import pytest
+from local_api import get_response_data
+from local_aws import LocalClock
+from local_jobs import request_job
+from load_test import get_job_data
+import retrieval
+
+# the long polls wait on a virtual clock, which runs the events of call_later() as it passes them
+@pytest.fixture
+def clock(monkeypatch):
+    clock = LocalClock()
+    monkeypatch.setattr(retrieval, 'sleep', clock.sleep)
+    monkeypatch.setattr(retrieval, 'monotonic', clock.monotonic)
+    return clock
+
+# counts the metadata reads of the long polls
+@pytest.fixture
+def reads(local_api, monkeypatch):
+    reads = {'count': 0}
+    get_item = local_api.local_aws.metadata_table.get_item
+    def counted_get_item(*arguments, **keyword_arguments):
+        reads['count'] += 1
+        return get_item(*arguments, **keyword_arguments)
+    monkeypatch.setattr(local_api.local_aws.metadata_table, 'get_item', counted_get_item)
+    return reads
+
+def wait(local_api, job, **payload):
+    return get_response_data(local_api.call('default', 'wait', {'requestId': job['requestId'], 'email': 'test@example.com', **payload}))
+
+def test_pending_job_times_out(local_api, clock, reads):
+    job = request_job(local_api)
+    assert wait(local_api, job, timeoutSeconds = 3) == {'requestId': job['requestId'], 'status': 'pending', 'timedOut': True}
+    assert clock.monotonic() == 3
+    # the delay between the reads grows, 0.25, 0.375, 0.5625, 0.84375 and the rest of the timeout
+    assert reads['count'] == 6
+
+def test_timeout_is_at_most_the_maximum(local_api, clock):
+    job = request_job(local_api)
+    assert wait(local_api, job, timeoutSeconds = 100)['timedOut']
+    assert clock.monotonic() == retrieval.WAIT_MAXIMUM_SECONDS
+    assert wait(local_api, job, timeoutSeconds = -1)['timedOut']
+    assert clock.monotonic() == retrieval.WAIT_MAXIMUM_SECONDS
+
+def test_wait_returns_when_the_job_ends(local_api, clock):
+    job = request_job(local_api)
+    local_api.upload(job, get_job_data(200, 0))
+    clock.call_later(5, local_api.drain)
+    data = wait(local_api, job)
+    assert 'timedOut' not in data
+    assert data['resamplingEndTime'] != None
+    assert data['getPresignedUrlResampled'] != None
+    # the job is seen by the first read after it ended
+    assert 5 <= clock.monotonic() < 5 + retrieval.WAIT_MAXIMUM_DELAY_SECONDS
+
+def test_wait_returns_when_the_job_starts(local_api, clock):
+    job = request_job(local_api)
+    # the start marker of resample()
+    clock.call_later(1, lambda: retrieval.metadata_table.update_item(
+        ExpressionAttributeNames={'#RST': 'resamplingStartTime'},
+        ExpressionAttributeValues={':rst': {'N': 1}},
+        Key={ 'requestId': job['requestId'] },
+        UpdateExpression='SET #RST = :rst'
+    ))
+    data = wait(local_api, job)
+    assert 'timedOut' not in data
+    assert data['resamplingStartTime'] != None
+    assert data['resamplingEndTime'] == None
+    assert clock.monotonic() < retrieval.WAIT_MAXIMUM_SECONDS
+
+def test_ended_job_returns_at_once(local_api, clock):
+    job = request_job(local_api)
+    local_api.upload(job, get_job_data(200, 0))
+    local_api.drain()
+    assert wait(local_api, job)['resamplingEndTime'] != None
+    assert clock.monotonic() == 0
+
+def test_wait_of_another_email_is_rejected(local_api, clock):
+    job = request_job(local_api)
+    with pytest.raises(Exception, match = 'does not exist'):
+        wait(local_api, job, email = 'other@example.com')
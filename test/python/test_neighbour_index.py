@@ -0,0 +1,71 @@
+import numpy
+import pytest
+from sklearn.neighbors import NearestNeighbors
+from local_aws import LocalS3Client
+from helper import neighbour_index
+
+@pytest.fixture(autouse = True)
+def empty_neighbour_indexes():
+    neighbour_index.neighbour_indexes.clear()
+    yield
+    neighbour_index.neighbour_indexes.clear()
+    neighbour_index.configure_neighbour_index_store(None, None)
+
+def generate_matrix(rows, features, seed = 0):
+    return numpy.random.default_rng(seed).normal(size = (rows, features))
+
+# both trees, as KD_TREE_MAXIMUM_DIMENSIONS chooses them by the number of features
+@pytest.mark.parametrize('features', [3, neighbour_index.KD_TREE_MAXIMUM_DIMENSIONS + 4])
+def test_graph_matches_brute_force(features):
+    matrix = generate_matrix(500, features)
+    distances, indices = neighbour_index.get_neighbour_index(matrix, 'test').kneighbors(6)
+    expected_distances, expected_indices = NearestNeighbors(n_neighbors = 6, algorithm = 'brute').fit(matrix).kneighbors(matrix)
+    # brute force computes the distances through the dot product, which rounds the zero distance of a row to itself
+    numpy.testing.assert_allclose(distances, expected_distances, rtol = 1e-9, atol = 1e-6)
+    numpy.testing.assert_array_equal(indices, expected_indices)
+
+def test_fewer_neighbours_are_answered_from_a_larger_graph():
+    index = neighbour_index.get_neighbour_index(generate_matrix(200, 3), 'test')
+    distances, indices = index.kneighbors(8)
+    fewer_distances, fewer_indices = index.kneighbors(3)
+    assert list(index.graphs) == [8]
+    numpy.testing.assert_array_equal(fewer_distances, distances[:, :3])
+    numpy.testing.assert_array_equal(fewer_indices, indices[:, :3])
+
+def test_same_data_reuses_the_index():
+    matrix = generate_matrix(100, 3)
+    index = neighbour_index.get_neighbour_index(matrix, 'test')
+    assert neighbour_index.get_neighbour_index(matrix.copy(), 'test') is index
+    assert neighbour_index.get_neighbour_index(matrix, 'other') is not index
+    matrix[0, 0] += 1
+    assert neighbour_index.get_neighbour_index(matrix, 'test') is not index
+
+def test_least_recently_used_index_is_evicted():
+    matrices = [generate_matrix(50, 3, seed) for seed in range(neighbour_index.NEIGHBOUR_INDEX_CACHE_SIZE + 1)]
+    first_index = neighbour_index.get_neighbour_index(matrices[0], 'test')
+    for matrix in matrices[1:]:
+        neighbour_index.get_neighbour_index(matrix, 'test')
+    assert len(neighbour_index.neighbour_indexes) == neighbour_index.NEIGHBOUR_INDEX_CACHE_SIZE
+    assert first_index.fingerprint not in neighbour_index.neighbour_indexes
+
+def test_saved_graphs_are_loaded_by_a_new_container():
+    s3_client = LocalS3Client()
+    neighbour_index.configure_neighbour_index_store(s3_client, 'raw-data')
+    matrix = generate_matrix(300, 3)
+    distances, indices = neighbour_index.get_neighbour_index(matrix, 'test').kneighbors(5)
+    neighbour_index.save_neighbour_indexes()
+    assert list(s3_client.objects) == [('raw-data', neighbour_index.get_neighbour_index_object_key(neighbour_index.compute_neighbour_index_fingerprint(matrix, 'test')))]
+    # a cold container has no index in memory
+    neighbour_index.neighbour_indexes.clear()
+    index = neighbour_index.get_neighbour_index(matrix, 'test')
+    assert list(index.graphs) == [5]
+    loaded_distances, loaded_indices = index.kneighbors(5)
+    assert index.tree is None
+    numpy.testing.assert_array_equal(loaded_distances, distances)
+    numpy.testing.assert_array_equal(loaded_indices, indices)
+
+def test_missing_graphs_are_a_miss():
+    neighbour_index.configure_neighbour_index_store(LocalS3Client(), 'raw-data')
+    index = neighbour_index.get_neighbour_index(generate_matrix(100, 3), 'test')
+    assert index.graphs == {}
+    assert not index.modified
@@ -0,0 +1,94 @@
+import inspect
+import sys
+import numpy
+import pandas
+import pytest
+import ImbalancedLearningRegression
+from helper import neighbour_index, neighbour_methods
+
+@pytest.fixture(scope = 'module', autouse = True)
+def indexed_methods():
+    neighbour_methods.use_neighbour_index(ImbalancedLearningRegression)
+
+# runs method with the inner functions of the library instead of the indexed ones
+def run_original(method, *arguments, **keyword_arguments):
+    replaced = dict()
+    for module_name, function_name in neighbour_methods.indexed_functions.items():
+        replaced[module_name] = getattr(sys.modules[module_name], function_name)
+        setattr(sys.modules[module_name], function_name, neighbour_methods.original_functions[function_name])
+    try:
+        return method(*arguments, **keyword_arguments)
+    finally:
+        for module_name, function_name in neighbour_methods.indexed_functions.items():
+            setattr(sys.modules[module_name], function_name, replaced[module_name])
+
+def run_indexed(method, *arguments, **keyword_arguments):
+    neighbour_index.neighbour_indexes.clear()
+    return method(*arguments, **keyword_arguments)
+
+# features of rows with a skewed target: continuous, rounded to integers (ties and duplicate rows), or with a nominal feature
+def generate_data(rows, kind, seed):
+    random = numpy.random.default_rng(seed)
+    data = pandas.DataFrame(random.normal(size = (rows, 3)), columns = ['x0', 'x1', 'x2'])
+    if kind == 'rounded':
+        data = data.round().astype('int64')
+    elif kind == 'coarse':
+        data = (data * 2).round() / 2
+    elif kind == 'nominal':
+        data['x2'] = random.choice(['a', 'b', 'c'], size = rows)
+    data['y'] = numpy.exp(data['x0'] + random.normal(scale = 0.3, size = rows))
+    return data
+
+def assert_same_rows(result, expected):
+    pandas.testing.assert_frame_equal(result.reset_index(drop = True), expected.reset_index(drop = True))
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('kind', ['continuous', 'rounded', 'coarse', 'nominal'])
+def test_enn_matches_the_library(kind, seed):
+    data = generate_data(300, kind, seed)
+    expected = run_original(ImbalancedLearningRegression.enn, data.copy(), 'y')
+    assert_same_rows(run_indexed(ImbalancedLearningRegression.enn, data.copy(), 'y'), expected)
+
+@pytest.mark.parametrize('k', [1, 4])
+def test_enn_matches_the_library_with_k(k):
+    data = generate_data(200, 'rounded', 3)
+    expected = run_original(ImbalancedLearningRegression.enn, data.copy(), 'y', k = k)
+    assert_same_rows(run_indexed(ImbalancedLearningRegression.enn, data.copy(), 'y', k = k), expected)
+
+# the original builds an n x n distance matrix in python, so the data is smaller, and fails on data without
+# tomek links (numpy.setxor1d of an empty list gives float indices), so the seeds are of data with links
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('option', ['majority', 'minority', 'both'])
+@pytest.mark.parametrize('kind', ['continuous', 'rounded'])
+def test_tomeklinks_matches_the_library(kind, option, seed):
+    data = generate_data(120, kind, seed)
+    expected = run_original(ImbalancedLearningRegression.tomeklinks, data.copy(), 'y', option = option)
+    assert_same_rows(run_indexed(ImbalancedLearningRegression.tomeklinks, data.copy(), 'y', option = option), expected)
+
+# fails when the library changes: the replacements are only written for the versions and inner functions it lists
+def test_library_is_an_indexed_version():
+    assert ImbalancedLearningRegression.__version__ in neighbour_methods.INDEXED_LIBRARY_VERSIONS
+    for function_name, signature in neighbour_methods.INDEXED_FUNCTION_SIGNATURES.items():
+        assert str(inspect.signature(neighbour_methods.original_functions[function_name])) == signature
+    for module_name, function_name in neighbour_methods.indexed_functions.items():
+        assert getattr(sys.modules[module_name], function_name) is getattr(neighbour_methods, function_name)
+
+def restore_original_functions(monkeypatch):
+    for module_name, function_name in neighbour_methods.indexed_functions.items():
+        monkeypatch.setattr(sys.modules[module_name], function_name, neighbour_methods.original_functions[function_name])
+
+def test_other_library_version_is_not_patched(monkeypatch):
+    restore_original_functions(monkeypatch)
+    monkeypatch.setattr(ImbalancedLearningRegression, '__version__', '0.0.3')
+    neighbour_methods.use_neighbour_index(ImbalancedLearningRegression)
+    for module_name, function_name in neighbour_methods.indexed_functions.items():
+        assert getattr(sys.modules[module_name], function_name) is neighbour_methods.original_functions[function_name]
+
+def test_other_inner_function_is_not_patched(monkeypatch):
+    restore_original_functions(monkeypatch)
+    def under_sampling_enn(data, index, estimator, rare_indices, weights):
+        pass
+    monkeypatch.setattr(sys.modules['ImbalancedLearningRegression.enn'], 'under_sampling_enn', under_sampling_enn)
+    neighbour_methods.use_neighbour_index(ImbalancedLearningRegression)
+    assert sys.modules['ImbalancedLearningRegression.enn'].under_sampling_enn is under_sampling_enn
+    assert sys.modules['ImbalancedLearningRegression.tomeklinks'].under_sampling_tomeklinks is neighbour_methods.original_functions['under_sampling_tomeklinks']
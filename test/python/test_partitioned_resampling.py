@@ -0,0 +1,147 @@
+import json
+import math
+import pytest
+from local_aws import get_queue_arn
+from local_jobs import request_job
+from load_test import get_job_data
+import partitioned_resampling
+import resampling
+from helper.method_cost_model import predict_method_cost, get_cost_limits, is_over_cost_limits
+
+def get_record(local_api, request_id):
+    return local_api.local_aws.metadata_table.items[request_id]
+
+# requests a job of method on rows and runs it with the local runner of partitioned_resampling.py, which calls the partitions in turn
+def run_job_locally(local_api, rows, method = 'ro'):
+    response = request_job(local_api, method = method)
+    local_api.upload(response, get_job_data(rows, 0))
+    partitioned_resampling.run_locally(response['s3RawDataBucketName'], response['s3RawDataObjectKey'])
+    return get_record(local_api, response['requestId'])
+
+def get_stage_names(record):
+    return [stage['stage'] for stage in record['resamplingMetrics']['M']['stages']]
+
+def test_partition_count_of_cheap_methods_follows_the_rows():
+    assert partitioned_resampling.get_partition_count('ro', 120000, 3) == math.ceil(120000 / partitioned_resampling.PARTITIONED_JOB_ROWS_PER_PARTITION)
+
+def test_partition_count_of_costly_methods_follows_the_predicted_cost():
+    partition_count = partitioned_resampling.get_partition_count('smote', 60000, 3)
+    limits = {name: limit * partitioned_resampling.PARTITION_COST_LIMIT_SHARE for name, limit in get_cost_limits().items()}
+    assert not is_over_cost_limits(predict_method_cost('smote', math.ceil(60000 / partition_count), 3), limits)
+    assert is_over_cost_limits(predict_method_cost('smote', math.ceil(60000 / (partition_count - 1)), 3), limits)
+
+def test_large_job_is_partitioned(local_api, monkeypatch):
+    monkeypatch.setattr(resampling, 'partitioned_job_minimum_rows', 10000)
+    monkeypatch.setattr(partitioned_resampling, 'PARTITIONED_JOB_ROWS_PER_PARTITION', 5000)
+    record = run_job_locally(local_api, 12000)
+    assert record['partitionedJobStatus']['S'] == 'completed'
+    assert record['completedPartitions'] == {0, 1}
+    assert record['resamplingEndTime']['N'] != None
+    assert record['chartDataPoints']['M'] != None
+    # the metrics of the planning are followed by those of the finalizer, the dataset profile is that of the planning
+    stage_names = get_stage_names(record)
+    assert stage_names.index('profile') < stage_names.index('merge') < stage_names.index('chart')
+    assert int(record['datasetProfile']['M']['rows']) == 12000
+    assert not any(key[1].startswith(partitioned_resampling.PARTITION_OBJECT_KEY_PREFIX) for key in local_api.local_aws.s3_client.objects)
+
+def test_small_job_predicted_to_exceed_the_limits_is_partitioned(local_api, monkeypatch):
+    monkeypatch.setattr(resampling, 'preflight_profiling', True)
+    # ro on 12000 rows is predicted to take about 0.9 seconds, which a function of 0.5 seconds cannot do in one piece
+    monkeypatch.setenv('resamplingTimeoutSeconds', '0.5')
+    record = run_job_locally(local_api, 12000)
+    assert record['datasetProfile']['M']['predictions']['ro']['decision'] == 'partition'
+    assert record['partitionedJobStatus']['S'] == 'completed'
+    assert int(record['partitionedJob']['M']['partitionCount']) == 2
+
+def test_small_job_is_not_partitioned(local_api):
+    record = run_job_locally(local_api, 2000)
+    assert 'partitionedJob' not in record
+    assert record['resamplingEndTime']['N'] != None
+
+# ends a worker without its handlers running, like a timeout of Lambda or running out of memory
+class WorkerKilled(BaseException):
+    pass
+
+def kill_workers(*arguments, **keyword_arguments):
+    raise WorkerKilled()
+
+# requests a partitioned job and plans it, returns the request response and the partitions the planning dispatched
+def start_job(local_api, monkeypatch, rows = 12000):
+    monkeypatch.setattr(resampling, 'partitioned_job_minimum_rows', 10000)
+    monkeypatch.setattr(partitioned_resampling, 'PARTITIONED_JOB_ROWS_PER_PARTITION', 5000)
+    dispatched_partitions = list()
+    monkeypatch.setattr(partitioned_resampling, 'partition_dispatcher', lambda request_id, partition: dispatched_partitions.append(partition))
+    response = request_job(local_api)
+    local_api.upload(response, get_job_data(rows, 0))
+    resampling.resample(response['s3RawDataBucketName'], response['s3RawDataObjectKey'])
+    return response, dispatched_partitions
+
+# the record of an asynchronous invocation that failed every attempt, as Lambda sends it to the onFailure destination
+def generate_failure_event(local_api, monkeypatch, request_id, partition):
+    queue_url = local_api.local_aws.sqs_client.create_queue(QueueName = 'PartitionFailureQueue')['QueueUrl']
+    monkeypatch.setattr(resampling, 'partition_failure_queue_url', queue_url)
+    return {'Records': [{
+        'messageId': 'message',
+        'eventSource': 'aws:sqs',
+        'eventSourceARN': get_queue_arn(queue_url),
+        'body': json.dumps({
+            'requestContext': {'condition': 'RetriesExhausted', 'approximateInvokeCount': partitioned_resampling.PARTITION_MAXIMUM_ATTEMPTS},
+            'requestPayload': {'partitionedJob': {'requestId': request_id, 'partition': partition}},
+            'responsePayload': {'errorMessage': 'Task timed out'}
+        })
+    }]}
+
+def test_partition_that_never_returns_fails_the_job(local_api, monkeypatch):
+    response, dispatched_partitions = start_job(local_api, monkeypatch)
+    assert dispatched_partitions == [0, 1]
+    monkeypatch.setattr(resampling, 'resample_data', kill_workers)
+    for _ in range(partitioned_resampling.PARTITION_MAXIMUM_ATTEMPTS):
+        with pytest.raises(WorkerKilled):
+            partitioned_resampling.resample_job_partition(response['requestId'], 0)
+    record = get_record(local_api, response['requestId'])
+    assert record['partitionAttempts']['0'] == partitioned_resampling.PARTITION_MAXIMUM_ATTEMPTS
+    assert record['partitionedJobStatus']['S'] == 'running'
+    # Lambda gives up on the invocation and sends it to the partition failure queue
+    resampling.lambda_handler(generate_failure_event(local_api, monkeypatch, response['requestId'], 0), None)
+    record = get_record(local_api, response['requestId'])
+    assert record['partitionedJobStatus']['S'] == 'failed'
+    assert 'partitionedJobEndClaimTime' in record
+    assert not any(key[1].startswith(partitioned_resampling.PARTITION_OBJECT_KEY_PREFIX) for key in local_api.local_aws.s3_client.objects)
+
+def test_partition_invoked_after_its_last_attempt_fails_the_job(local_api, monkeypatch):
+    response, _ = start_job(local_api, monkeypatch)
+    monkeypatch.setattr(resampling, 'resample_data', kill_workers)
+    for _ in range(partitioned_resampling.PARTITION_MAXIMUM_ATTEMPTS):
+        with pytest.raises(WorkerKilled):
+            partitioned_resampling.resample_job_partition(response['requestId'], 1)
+    # a duplicate delivery of the event is not resampled
+    partitioned_resampling.resample_job_partition(response['requestId'], 1)
+    assert get_record(local_api, response['requestId'])['partitionedJobStatus']['S'] == 'failed'
+
+def test_failed_finalizer_is_retried(local_api, monkeypatch):
+    monkeypatch.setattr(resampling, 'partitioned_job_minimum_rows', 10000)
+    monkeypatch.setattr(partitioned_resampling, 'PARTITIONED_JOB_ROWS_PER_PARTITION', 5000)
+    # the first merge fails, as with a transient error of S3
+    compute_kde_on_shared_grid = partitioned_resampling.compute_kde_on_shared_grid
+    calls = list()
+    def fail_first_call(*arguments):
+        calls.append(arguments)
+        if len(calls) == 1:
+            raise Exception('Service unavailable')
+        return compute_kde_on_shared_grid(*arguments)
+    monkeypatch.setattr(partitioned_resampling, 'compute_kde_on_shared_grid', fail_first_call)
+    record = run_job_locally(local_api, 12000)
+    assert len(calls) == 2
+    assert record['partitionedJobStatus']['S'] == 'completed'
+    assert record['resamplingEndTime']['N'] != None
+    assert record['partitionAttempts']['1'] == 2
+
+def test_failed_finalizer_fails_the_job_after_its_last_attempt(local_api, monkeypatch):
+    monkeypatch.setattr(resampling, 'partitioned_job_minimum_rows', 10000)
+    monkeypatch.setattr(partitioned_resampling, 'PARTITIONED_JOB_ROWS_PER_PARTITION', 5000)
+    def fail(*arguments):
+        raise Exception('Service unavailable')
+    monkeypatch.setattr(partitioned_resampling, 'compute_kde_on_shared_grid', fail)
+    record = run_job_locally(local_api, 12000)
+    assert record['partitionedJobStatus']['S'] == 'failed'
+    assert record['partitionAttempts']['1'] == partitioned_resampling.PARTITION_MAXIMUM_ATTEMPTS
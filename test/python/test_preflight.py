@@ -0,0 +1,82 @@
+import pytest
+from local_jobs import request_job
+from load_test import get_job_data
+import resampling
+import retrieval
+from helper.job_metrics import JobMetrics
+
+SUBSCRIPTION_ARN = 'arn:aws:sns:us-east-1:000000000000:task-status:subscription'
+# y is the target, label a string column, and empty a column without values
+CSV = b'x,y,label,empty\n' + b''.join('{},{},{},\n'.format(index, index * 0.5, 'abc'[index % 3]).encode() for index in range(200))
+
+@pytest.fixture(autouse = True)
+def preflight_profiling(monkeypatch):
+    monkeypatch.setattr(resampling, 'preflight_profiling', True)
+
+def profile(local_api, method, y = 'y', execution_mode = 'exact'):
+    local_api.local_aws.s3_client.put_object(Bucket = 'raw-data-bucket', Key = 'raw_test.csv', Body = CSV)
+    return resampling.profile_raw_data(JobMetrics('test'), 'raw-data-bucket', 'raw_test.csv', 'csv', y, len(CSV), None, [(method, execution_mode)])
+
+def test_profile_of_a_sample(local_api):
+    dataset_profile = profile(local_api, 'ro')
+    assert dataset_profile['rows'] == 200
+    assert not dataset_profile['rowsEstimated']
+    assert dataset_profile['columns'] == 4
+    assert dataset_profile['target']['numeric']
+    assert (dataset_profile['target']['min'], dataset_profile['target']['max']) == (0, 99.5)
+
+def test_method_within_the_limits_is_accepted(local_api):
+    assert profile(local_api, 'ro')['predictions']['ro']['decision'] == 'accept'
+
+# every method is predicted to need more than 100 MB
+def test_partitioned_method_beyond_the_limits_is_partitioned(local_api, monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '100')
+    assert profile(local_api, 'ro')['predictions']['ro']['decision'] == 'partition'
+
+# smote on 200 rows is predicted to take about 0.2 seconds
+@pytest.mark.parametrize('limit, value', [('resamplingTimeoutSeconds', '0.1'), ('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '100')])
+def test_other_method_beyond_the_limits_is_rejected(local_api, monkeypatch, limit, value):
+    monkeypatch.setenv(limit, value)
+    assert profile(local_api, 'smote')['predictions']['smote']['decision'] == 'reject'
+
+def test_approximate_mode_beyond_the_limits_is_rejected(local_api, monkeypatch):
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_MEMORY_SIZE', '100')
+    assert profile(local_api, 'enn', execution_mode = 'approximate')['predictions']['enn (approximate)']['decision'] == 'reject'
+
+@pytest.mark.parametrize('y, message', [
+    ('missing', 'Target column missing does not exist in the data!'),
+    ('label', 'Target column label is of type string! Should be numeric!'),
+    ('empty', 'Target column empty has no values!')
+])
+def test_invalid_target_is_rejected(local_api, y, message):
+    with pytest.raises(Exception) as error:
+        profile(local_api, 'ro', y)
+    assert str(error.value) == message
+
+# runs a job of payload on data, whose notifications are published
+def run_notified_job(local_api, data, **payload):
+    response = request_job(local_api, taskStatusSnsTopicSubscriptionOption = 'subscribed', taskStatusSnsTopicSubscriptionArn = SUBSCRIPTION_ARN, **payload)
+    local_api.upload(response, data)
+    local_api.drain()
+    return local_api.local_aws.metadata_table.items[response['requestId']]
+
+def get_fail_messages(local_api):
+    return [message['Message'] for message in local_api.local_aws.sns_client.messages if 'failed' in message['Subject'].lower()]
+
+def test_rejected_job_fails_before_the_read(local_api, monkeypatch):
+    monkeypatch.setenv('resamplingTimeoutSeconds', '0.1')
+    record = run_notified_job(local_api, get_job_data(200, 0), method = 'smote')
+    assert retrieval.get_job_status(record) == 'failed'
+    assert record['datasetProfile']['M']['predictions']['smote']['decision'] == 'reject'
+    assert 'read' not in [stage['stage'] for stage in record['resamplingMetrics']['M']['stages']]
+    assert record['onResampleFailSnsPublishMessageId']['S'] != None
+    fail_messages = get_fail_messages(local_api)
+    assert len(fail_messages) == 1
+    assert 'is predicted to take' in fail_messages[0]
+
+def test_job_of_a_non_numeric_target_fails(local_api):
+    record = run_notified_job(local_api, CSV, y = 'label')
+    assert retrieval.get_job_status(record) == 'failed'
+    fail_messages = get_fail_messages(local_api)
+    assert len(fail_messages) == 1
+    assert 'Target column label is of type string! Should be numeric!' in fail_messages[0]
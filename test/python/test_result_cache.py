@@ -0,0 +1,57 @@
+import pytest
+from local_jobs import run_job
+from helper.result_cache import compute_result_cache_key
+
+def get_record(local_api, job):
+    return local_api.local_aws.metadata_table.items[job['requestId']]
+
+def get_object(local_api, bucket, key):
+    return local_api.local_aws.s3_client.objects[(bucket, key)]
+
+def get_stage_names(record):
+    return [stage['stage'] for stage in record['resamplingMetrics']['M']['stages']]
+
+def test_identical_upload_is_served_from_the_cache(local_api):
+    job = run_job(local_api)
+    cached_job = run_job(local_api)
+    record = get_record(local_api, job)
+    cached_record = get_record(local_api, cached_job)
+    assert record['resultCacheHit']['BOOL'] == False
+    assert cached_record['resultCacheHit']['BOOL'] == True
+    assert 'cacheCopy' in get_stage_names(cached_record) and 'resample' not in get_stage_names(cached_record)
+    assert cached_record['chartDataPoints'] == record['chartDataPoints']
+    # the resampled object is copied for the new request
+    assert cached_record['s3ResampledDataObjectKey'] != record['s3ResampledDataObjectKey']
+    assert get_object(local_api, cached_record['s3ResampledDataBucketName'], cached_record['s3ResampledDataObjectKey'])['Body'] == get_object(local_api, record['s3ResampledDataBucketName'], record['s3ResampledDataObjectKey'])['Body']
+
+# every input of the key: the data, the method, its parameters, the execution mode, the output format and its Content-Encoding
+@pytest.mark.parametrize('payload, changed_payload', [
+    ({}, {'seed': 1}),
+    ({}, {'method': 'ru'}),
+    ({}, {'methodParameters': {'samp_method': 'extreme'}}),
+    ({}, {'chartDataSize': 60}),
+    ({'method': 'enn'}, {'method': 'enn', 'executionMode': 'approximate'}),
+    ({}, {'outputFormat': 'parquet'}),
+    ({}, {'outputContentEncoding': 'gzip'}),
+    ({'outputContentEncoding': 'gzip'}, {'outputContentEncoding': 'zstd'})
+])
+def test_changed_key_input_misses_the_cache(local_api, payload, changed_payload):
+    run_job(local_api, **payload)
+    job = run_job(local_api, **changed_payload)
+    record = get_record(local_api, job)
+    assert record['resultCacheHit']['BOOL'] == False
+    assert 'cacheCopy' not in get_stage_names(record)
+
+def test_batch_method_is_served_from_the_cache_of_a_single_method_request(local_api):
+    run_job(local_api, method = 'ro')
+    job = run_job(local_api, methods = [{'method': 'ro'}, {'method': 'ru'}])
+    batch_results = get_record(local_api, job)['batchResults']['L']
+    assert [batch_result['resultCacheHit'] for batch_result in batch_results] == [True, False]
+    # the batch itself is a cache hit only when all of its methods are
+    assert get_record(local_api, job)['resultCacheHit']['BOOL'] == False
+
+def test_default_mode_and_encoding_keep_the_keys_of_earlier_results():
+    key = compute_result_cache_key('"etag"', 100, 'ro', 'y', {}, 50, 'csv')
+    assert compute_result_cache_key('etag', 100, 'ro', 'y', {}, 50, 'csv', 'exact', None) == key
+    assert compute_result_cache_key('etag', 100, 'ro', 'y', {}, 50, 'csv', 'approximate', None) != key
+    assert compute_result_cache_key('etag', 100, 'ro', 'y', {}, 50, 'csv', 'exact', 'gzip') != key
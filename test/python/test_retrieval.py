@@ -0,0 +1,66 @@
+import time
+import pytest
+from local_api import get_response_data
+from local_jobs import run_job, request_job
+from load_test import get_job_data
+import resampling
+import retrieval
+
+def retrieve(local_api, job, **payload):
+    return get_response_data(local_api.call('retrieve', 'retrieve', {'requestId': job['requestId'], 'email': 'test@example.com', **payload}))
+
+@pytest.mark.parametrize('chart_data_format', [None, 'points', ' Points '])
+def test_retrieve_returns_points_unless_packed_is_asked_for(local_api, chart_data_format):
+    job = run_job(local_api)
+    data = retrieve(local_api, job, **({} if chart_data_format is None else {'chartDataFormat': chart_data_format}))
+    assert isinstance(data['chartDataPoints'], list)
+    assert len(data['chartDataPoints']) == 50
+    assert set(data['chartDataPoints'][0]) == {'Target Variable', 'Raw Density', 'Resampled Density'}
+
+def test_retrieve_returns_packed_chart_data(local_api):
+    job = run_job(local_api)
+    data = retrieve(local_api, job, chartDataFormat = 'packed')
+    # numbers of the tables are sent as strings
+    assert int(data['chartDataPoints']['version']) == 2
+    assert int(data['chartDataPoints']['size']) == 50
+
+def test_explicit_null_chart_data_format_is_the_default(local_api):
+    job = run_job(local_api)
+    assert isinstance(retrieve(local_api, job, chartDataFormat = None)['chartDataPoints'], list)
+    statuses = get_response_data(local_api.call('default', 'retrieve-status', {'requests': [{'requestId': job['requestId'], 'email': 'test@example.com'}], 'includeChartData': True, 'chartDataFormat': None}))['statuses']
+    assert isinstance(statuses[0]['chartDataPoints'], list)
+
+def test_invalid_chart_data_format_is_rejected(local_api):
+    job = run_job(local_api)
+    with pytest.raises(Exception, match = 'Invalid chartDataFormat'):
+        retrieve(local_api, job, chartDataFormat = 'csv')
+
+def test_unchanged_record_is_not_modified_until_its_urls_are_renewed(local_api, monkeypatch):
+    job = run_job(local_api)
+    now = time.time()
+    monkeypatch.setattr(time, 'time', lambda: now)
+    data = retrieve(local_api, job)
+    response = local_api.call('retrieve', 'retrieve', {'requestId': job['requestId'], 'email': 'test@example.com'}, {'If-None-Match': data['etag']})
+    assert response['statusCode'] == 304
+    assert response['headers']['ETag'] == data['etag']
+    assert retrieve(local_api, job, chartDataFormat = 'packed')['etag'] != data['etag']
+    # the signed download urls of the cached response are renewed with the next period
+    now += retrieval.PRESIGNED_URL_CACHE_MAXIMUM_AGE_SECONDS
+    renewed_data = retrieve(local_api, job, ifNoneMatch = data['etag'])
+    assert renewed_data['etag'] != data['etag']
+    assert renewed_data['getPresignedUrlResampled'] != None
+
+def test_status_is_running_from_the_start_of_the_job(local_api, monkeypatch):
+    statuses = []
+    response = request_job(local_api)
+    # the status is read while the data is resampled
+    resample_data = resampling.resample_data
+    def read_status(*arguments):
+        statuses.append(retrieval.get_job_status(retrieval.metadata_table.get_item(Key = {'requestId': response['requestId']})['Item']))
+        return resample_data(*arguments)
+    monkeypatch.setattr(resampling, 'resample_data', read_status)
+    assert retrieval.get_job_status(retrieval.metadata_table.get_item(Key = {'requestId': response['requestId']})['Item']) == 'pending'
+    local_api.upload(response, get_job_data(200, 0))
+    local_api.drain()
+    assert statuses == ['running']
+    assert retrieval.get_job_status(retrieval.metadata_table.get_item(Key = {'requestId': response['requestId']})['Item']) == 'completed'
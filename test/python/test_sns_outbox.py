@@ -0,0 +1,72 @@
+import pytest
+import resampling
+from helper import sns_outbox
+
+TOPIC_ARN = 'arn:aws:sns:us-east-1:000000000000:task-status'
+
+def generate_publish_arguments(message):
+    return {'TopicArn': TOPIC_ARN, 'Message': message, 'Subject': 'Resampling'}
+
+@pytest.fixture
+def retry_at_once(monkeypatch):
+    monkeypatch.setattr(sns_outbox, 'SNS_OUTBOX_RETRY_BASE_DELAY_SECONDS', 0.001)
+
+# every publish fails, for a fault of the sender with sender_fault, of SNS otherwise
+def fail_publish(local_api, monkeypatch, sender_fault):
+    def publish_batch(TopicArn, PublishBatchRequestEntries, **arguments):
+        return {'Successful': [], 'Failed': [{'Id': entry['Id'], 'SenderFault': sender_fault, 'Code': 'Error'} for entry in PublishBatchRequestEntries]}
+    monkeypatch.setattr(local_api.local_aws.sns_client, 'publish_batch', publish_batch)
+
+def save_outbox(request_id, messages):
+    outbox = sns_outbox.SnsOutbox(request_id)
+    for field, message in messages.items():
+        outbox.add(field, generate_publish_arguments(message))
+    sns_outbox.save_sns_outbox(resampling.metadata_table, outbox)
+
+def get_record(local_api, request_id):
+    return local_api.local_aws.metadata_table.items[request_id]
+
+def test_undelivered_notifications_are_published_by_the_schedule(local_api, monkeypatch, retry_at_once):
+    for request_id in ('saved', 'delivered', 'other'):
+        local_api.local_aws.metadata_table.put_item(Item = {'requestId': request_id})
+    with monkeypatch.context() as failing:
+        fail_publish(local_api, failing, False)
+        save_outbox('saved', {'onResampleStartSnsPublishMessageId': 'started', 'onResampleCompleteSnsPublishMessageId': 'completed'})
+    save_outbox('delivered', {'onResampleStartSnsPublishMessageId': 'started'})
+    assert len(get_record(local_api, 'saved')['notificationOutbox']['L']) == 2
+    assert get_record(local_api, 'delivered')['notificationOutbox']['L'] == []
+    local_api.local_aws.sns_client.messages.clear()
+    # the event of the schedule of the stack
+    assert resampling.lambda_handler({'notificationOutbox': {}}, None) == {'requestIds': ['saved']}
+    assert sorted(message['Message'] for message in local_api.local_aws.sns_client.messages) == ['completed', 'started']
+    record = get_record(local_api, 'saved')
+    assert record['notificationOutbox']['L'] == []
+    assert record['onResampleCompleteSnsPublishMessageId'] != None
+    assert resampling.lambda_handler({'notificationOutbox': {}}, None) == {'requestIds': []}
+
+def test_notifications_of_sender_faults_are_not_saved(local_api, monkeypatch, retry_at_once):
+    local_api.local_aws.metadata_table.put_item(Item = {'requestId': 'invalid'})
+    fail_publish(local_api, monkeypatch, True)
+    save_outbox('invalid', {'onResampleFailSnsPublishMessageId': 'failed'})
+    assert 'notificationOutbox' not in get_record(local_api, 'invalid')
+
+def test_dispatch_is_limited_per_invocation(local_api, monkeypatch, retry_at_once):
+    with monkeypatch.context() as failing:
+        fail_publish(local_api, failing, False)
+        for index in range(3):
+            local_api.local_aws.metadata_table.put_item(Item = {'requestId': 'saved{}'.format(index)})
+            save_outbox('saved{}'.format(index), {'onResampleStartSnsPublishMessageId': 'started'})
+    assert len(sns_outbox.dispatch_saved_sns_outboxes(resampling.metadata_table, maximum_requests = 2)['requestIds']) == 2
+    assert len(sns_outbox.dispatch_saved_sns_outboxes(resampling.metadata_table)['requestIds']) == 1
+
+def test_saved_notifications_of_sender_faults_are_dropped(local_api, monkeypatch, retry_at_once):
+    local_api.local_aws.metadata_table.put_item(Item = {'requestId': 'saved'})
+    with monkeypatch.context() as failing:
+        fail_publish(local_api, failing, False)
+        save_outbox('saved', {'onResampleStartSnsPublishMessageId': 'started', 'onResampleCompleteSnsPublishMessageId': 'completed'})
+    assert len(get_record(local_api, 'saved')['notificationOutbox']['L']) == 2
+    # the saved notifications fail again, for a fault of the sender
+    fail_publish(local_api, monkeypatch, True)
+    assert resampling.lambda_handler({'notificationOutbox': {}}, None) == {'requestIds': ['saved']}
+    assert get_record(local_api, 'saved')['notificationOutbox']['L'] == []
+    assert resampling.lambda_handler({'notificationOutbox': {}}, None) == {'requestIds': []}